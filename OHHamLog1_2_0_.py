@@ -1,12 +1,268 @@
 #!/usr/bin/env python3
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
+import tkinter.font as tkfont
 import datetime
 import os
 import json
-import re
+import io
+import time
+import functools
+import tempfile
+import threading
+import queue
+import sys
 from pathlib import Path
 
+from ohhamlog_core import (
+    iter_adif_records, date_epoch, utc_day_now, QSO, open_log_stream, base_callsign,
+    parse_input_line, INPUT_HINT_DELAY_MS, InputState, DupeIndex, CallHistoryIndex,
+    SCP_MATCH_LIMIT, PartialCallIndex, LogStats, SQLiteLogStore, qso_from_adif_tags,
+    LogLoader, QsoJournal, render_adi, iter_adi_chunks, Counted, unique_in_time_order,
+    SortedRuns, MERGE_TOLERANCE_MINUTES, NearDuplicateFilter, drop_near_duplicates,
+    describe_near_duplicate, entries_between, AdiWriter, BackupManifest, parse_text_qso,
+    LatencyRecorder)
+
+
+def timed(stage):
+    """Kirjaa HamLogger-metodin kesto, kun viivemittaus on päällä (self.latency)"""
+    def decorate(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            recorder = self.latency
+            if recorder is None:
+                return method(self, *args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                recorder.record(stage, time.perf_counter() - start, len(self.log_entries))
+        return wrapper
+    return decorate
+
+
+class VirtualLogView:
+    """Virtualisoitu lokinäkymä suurille lokeille.
+
+    Text-widgetissä on kerrallaan vain näkyvät rivit; vierityspalkki ja
+    hiiren rulla siirtävät ikkunaa lokin päällä. Rivit haetaan kutsuilla
+    row_count() ja format_row(indeksi) -> (teksti, tagit), joten vieritys,
+    järjestyksen vaihto ja hyppy tiettyyn QSO:hon maksavat vain näkyvien
+    rivien verran. Näkymä seuraa lokin uusinta päätä, kunnes käyttäjä
+    vierittää muualle.
+
+    Tagit on joko yksi tyylitagi tai tuple (tyyli, rivitagi, ...). Rivikohtaiset
+    tagit poistetaan Text-widgetistä kun rivi vierii pois näkyvistä.
+    """
+
+    def __init__(self, parent, row_count, format_row, font=('Courier New', 9)):
+        self.row_count = row_count
+        self.format_row = format_row
+        self.text = tk.Text(parent, height=20, width=70, font=font, wrap=tk.NONE)
+        self.scrollbar = ttk.Scrollbar(parent, orient="vertical", command=self.on_scrollbar)
+        self.line_height = max(1, tkfont.Font(font=font).metrics('linespace'))
+        
+        self.first = 0              # Ensimmäinen näkyvä rivi
+        self.shown = []             # Näkyvien rivien lokin indeksit
+        self.row_tags = set()       # Näkyvien rivien rivikohtaiset tagit
+        self.visible_rows = 20
+        self.follow_newest = True   # Pysy uusimman QSO:n kohdalla
+        self.newest_first = False   # Uusin ylimpänä
+        self.sort_key = None        # None = aikajärjestys (lokin järjestys)
+        self.order = None           # Lajittelujärjestys lokin indekseinä
+        self.rows = None            # Käänteinen järjestys: lokin indeksi -> rivi
+        
+        self.text.bind('<Configure>', self.on_resize)
+        self.text.bind('<MouseWheel>', self.on_mousewheel)
+        self.text.bind('<Button-4>', lambda event: self.scroll_rows(-3))
+        self.text.bind('<Button-5>', lambda event: self.scroll_rows(3))
+        self.text.bind('<Prior>', lambda event: self.scroll_rows(-self.visible_rows))
+        self.text.bind('<Next>', lambda event: self.scroll_rows(self.visible_rows))
+        self.text.bind('<Home>', lambda event: self.scroll_to(0))
+        self.text.bind('<End>', lambda event: self.scroll_to(self.row_count()))
+
+    def pack(self):
+        self.text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+    def sorted_order(self, count):
+        """Lokin indeksit lajittelujärjestyksessä (lasketaan vain muutosten jälkeen)"""
+        if self.order is None or len(self.order) != count:
+            self.order = sorted(range(count), key=self.sort_key)
+            self.rows = None
+        return self.order
+
+    def log_indexes(self, start, end):
+        """Näytön rivien start..end-1 lokin indeksit yhdellä kertaa"""
+        count = self.row_count()
+        end = min(end, count)
+        if start >= end:
+            return []
+        if self.newest_first:
+            positions = range(count - 1 - start, count - 1 - end, -1)
+        else:
+            positions = range(start, end)
+        if self.sort_key is not None:
+            order = self.sorted_order(count)
+            return [order[position] for position in positions]
+        return list(positions)
+
+    def row_of(self, index):
+        """Lokin indeksi -> näytön rivi (lajittelussa käänteisestä taulukosta)"""
+        count = self.row_count()
+        if self.sort_key is not None:
+            order = self.sorted_order(count)
+            if self.rows is None:
+                self.rows = [0] * count
+                for row, log_index in enumerate(order):
+                    self.rows[log_index] = row
+            index = self.rows[index]
+        return count - 1 - index if self.newest_first else index
+
+    def refresh(self, changed=False):
+        """Piirrä näkyvät rivit; changed=True kun lokin sisältö muuttui"""
+        if changed:
+            self.order = None
+            self.rows = None
+        count = self.row_count()
+        last_first = max(0, count - self.visible_rows)
+        if self.follow_newest:
+            self.first = 0 if self.newest_first else last_first
+        self.first = min(max(0, self.first), last_first)
+        
+        self.shown = self.log_indexes(self.first, self.first + self.visible_rows)
+        old_tags = self.row_tags
+        self.row_tags = set()
+        chunks = self.format_rows(self.shown)
+        old_tags -= self.row_tags
+        
+        self.text.config(state=tk.NORMAL)
+        self.text.delete('1.0', tk.END)
+        if old_tags:
+            self.text.tag_delete(*old_tags)
+        if chunks:
+            self.text.insert('1.0', *chunks)
+        self.text.config(state=tk.DISABLED)
+        self.update_scrollbar()
+
+    def format_rows(self, indexes):
+        """Rivit Text.insert-kutsulle: teksti, tagit, teksti, tagit, ..."""
+        chunks = []
+        for index in indexes:
+            line, tags = self.format_row(index)
+            if isinstance(tags, tuple):
+                self.row_tags.update(tags[1:])
+            chunks.append(line)
+            chunks.append(tags)
+        return chunks
+
+    def update_scrollbar(self):
+        count = self.row_count()
+        if count:
+            self.scrollbar.set(self.first / count, min(1.0, (self.first + self.visible_rows) / count))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    def update_rows(self, predicate):
+        """Piirrä uudelleen vain ne näkyvät rivit, joiden lokin indeksille predicate on tosi"""
+        self.text.config(state=tk.NORMAL)
+        for line, index in enumerate(self.shown, 1):
+            if predicate(index):
+                self.text.delete(f"{line}.0", f"{line + 1}.0")
+                self.text.insert(f"{line}.0", *self.format_rows([index]))
+        self.text.config(state=tk.DISABLED)
+
+    def remove_row(self, row, index):
+        """Poista näytöltä rivi row, jonka QSO (lokin indeksi index) on poistettu lokista.
+
+        Vain poistettu rivi otetaan pois ja ikkunan reunaan tuleva rivi
+        lisätään; muut näkyvät rivit jäävät paikalleen.
+        """
+        if self.order is not None:
+            self.order = [i - (i > index) for i in self.order if i != index]
+            self.rows = None
+        
+        count = self.row_count()
+        self.text.config(state=tk.NORMAL)
+        if row < self.first:
+            # Poistettu rivi oli ikkunan yläpuolella: sama sisältö, ikkuna siirtyy
+            self.first -= 1
+        elif row < self.first + len(self.shown):
+            line = row - self.first + 1
+            self.text.delete(f"{line}.0", f"{line + 1}.0")
+            shown_end = self.first + len(self.shown) - 1
+            
+            last_first = max(0, count - self.visible_rows)
+            new_first = min(self.first, last_first)
+            if self.follow_newest:
+                new_first = 0 if self.newest_first else last_first
+            if new_first < self.first:
+                # Lokin loppu: ikkuna siirtyy rivin ylöspäin
+                chunks = self.format_rows(self.log_indexes(new_first, self.first))
+                self.text.insert('1.0', *chunks)
+            wanted_end = min(count, new_first + self.visible_rows)
+            if wanted_end > shown_end:
+                chunks = self.format_rows(self.log_indexes(shown_end, wanted_end))
+                self.text.insert(tk.END + '-1c', *chunks)
+            self.first = new_first
+        self.text.config(state=tk.DISABLED)
+        
+        self.shown = self.log_indexes(self.first, self.first + self.visible_rows)
+        self.update_scrollbar()
+
+    def reset(self):
+        """Uusi loki: takaisin uusimpaan päähän ja piirrä kerralla"""
+        self.first = 0
+        self.follow_newest = True
+        self.refresh(changed=True)
+
+    def scroll_to(self, row):
+        count = self.row_count()
+        last_first = max(0, count - self.visible_rows)
+        self.first = min(max(0, row), last_first)
+        newest_row = 0 if self.newest_first else last_first
+        self.follow_newest = self.first == newest_row
+        self.refresh()
+
+    def scroll_rows(self, rows):
+        self.scroll_to(self.first + rows)
+        return 'break'
+
+    def jump_to(self, index):
+        """Näytä lokin indeksin QSO näkymän ylimpänä"""
+        self.scroll_to(self.row_of(index))
+
+    def set_order(self, sort_key=None, newest_first=False):
+        """Vaihda järjestystä; sort_key(lokin indeksi) tai None = aikajärjestys"""
+        self.sort_key = sort_key
+        self.newest_first = newest_first
+        self.order = None
+        self.rows = None
+        # Aikajärjestyksessä näytetään uusin pää, muuten alku
+        self.follow_newest = sort_key is None
+        self.first = 0
+        self.refresh()
+
+    def on_scrollbar(self, action, *args):
+        count = self.row_count()
+        if action == 'moveto':
+            self.scroll_to(int(float(args[0]) * count))
+        elif action == 'scroll':
+            amount = int(args[0])
+            if args[1] == 'pages':
+                amount *= max(1, self.visible_rows - 1)
+            self.scroll_rows(amount)
+
+    def on_mousewheel(self, event):
+        return self.scroll_rows(-3 if event.delta > 0 else 3)
+
+    def on_resize(self, event):
+        rows = max(1, event.height // self.line_height)
+        if rows != self.visible_rows:
+            self.visible_rows = rows
+            self.refresh()
+
+
 class HamLogger:
     def __init__(self, root):
         self.root = root
@@ -24,6 +280,15 @@ class HamLogger:
         # Backup-asetukset
         self.backup_interval = 60000  # 60 sekuntia (1 minuutti)
         self.backup_running = False
+        self.backups = None
+        self.backup_dirty = True    # Loki muuttunut edellisen backupin jälkeen
+        self.backup_full = True     # Muutos muu kuin lisäys: tarvitaan täysi backup
+        
+        # ADI-tiedostot kirjoitetaan taustasäikeessä
+        self.adi_writer = AdiWriter()
+        self.writer_polling = False
+        self.log_saving = False
+        self.log_generation = 0     # Kasvaa jokaisesta lokin muutoksesta
         
         # Oletusasetukset
         self.settings = {
@@ -40,16 +305,48 @@ class HamLogger:
             'language': 'suomi',  # KORJATTU: Lisätty puuttuva pilkku
             'last_log_file': None,  # Viimeksi avattu loki
             'auto_backup': True,    # Automaattinen backup
-            'auto_open_last': True  # Avaa viimeisin loki automaattisesti
+            'auto_open_last': True,  # Avaa viimeisin loki automaattisesti
+            'sqlite_store': False,   # Pidä loki myös SQLite-tietokannassa
+            'qso_journal': True,     # Kirjaa jokainen muutos heti journaaliin
+            'scp_file': os.path.join(os.path.expanduser('~'), 'hamlog', 'MASTER.SCP'),
+            'latency_stats': False,  # Kirjaa vaiheiden viiveet diagnostiikkaa varten
+            'merge_tolerance_minutes': MERGE_TOLERANCE_MINUTES,  # Sama yhteys, jos aikaero enintään tämä
+            'merge_exact_call': False  # Vertaa koko kutsua (A1A/P ei ole sama kuin A1A)
         }
         
         # Nykyiset asetukset
         self.current_band = self.settings['default_band']
         self.current_mode = self.settings['default_mode']
         self.log_entries = []
+        self.dupe_index = DupeIndex()
+        self.call_history = CallHistoryIndex()
+        self.log_calls = PartialCallIndex()     # Lokin peruskutsut (super check partial)
+        self.scp_calls = PartialCallIndex()     # MASTER.SCP-tiedoston kutsut
+        self.scp_fragment = ''
+        self.latency = None         # LatencyRecorder, kun viivemittaus on päällä
+        self.input_started = None   # Kirjatun rivin käsittelyn alku (perf_counter)
+        self.stats = LogStats()
+        self.stats_day = None
+        self.log_store = None
+        self.journal = None
+        self.qso_by_uid = {}        # QSO:n pysyvä tunniste -> QSO
+        self.entry_positions = {}   # Tunniste -> paikka lokissa (tarkistetaan käytettäessä)
+        self.log_loader = None      # Taustalla latautuva loki
+        # Kootut näkymäpäivitykset (after_idle)
+        self.pending_views = set()
+        self.pending_previous = None
+        self.view_update_scheduled = False
+        self.loaded_count = 0       # Ladattujen QSO:iden määrä lokin alussa
+        self.input_state = InputState()
+        self.input_hint_job = None  # Viivästetty syöttörivin tulkinta (after)
+        self.prev_contact_uid = None  # Edellisen yhteyden QSO (klikkaus näyttää sen lokissa)
+        self.next_uid = 1
+        self.recovered_changes = 0
         
         self.load_settings()
         self.setup_data_dir()
+        self.load_scp_file()
+        self.configure_latency()
         
         # ALUSTA TEKSTIT ENNEN WIDGETIEN LUOMISTA
         self.texts = {}
@@ -59,6 +356,11 @@ class HamLogger:
         self.start_clock()
         self.apply_theme()
         
+        # SQLite-varasto: jatka tallentamatonta lokia edellisestä istunnosta
+        self.configure_log_store()
+        # Journaali: palauta kaatumisen jälkeen tallentamattomat QSO:t
+        self.recover_unsaved_journal()
+        
         # KÄYNNISTÄ AUTOMAATTINEN BACKUP
         self.start_auto_backup()
         
@@ -109,57 +411,45 @@ class HamLogger:
             self.root.after(self.backup_interval, self.start_auto_backup)
     
     def create_backup(self):
-        """Luo varmuuskopio nykyisestä lokista"""
-        if not self.log_entries or not self.backup_running:
+        """Luo varmuuskopio nykyisestä lokista (vain jos loki on muuttunut)"""
+        if (not self.log_entries or not self.backup_running or not self.backup_dirty or
+                self.log_loader is not None):
             return
         
         try:
-            timestamp = datetime.datetime.now(datetime.UTC).strftime('%Y%m%d_%H%M%S')
+            backup_dir = self.settings['backup_dir']
+            if self.backups is None or self.backups.backup_dir != backup_dir:
+                self.backups = BackupManifest(backup_dir)
+                self.backup_full = True
             
             if self.current_log_file:
                 filename = os.path.basename(self.current_log_file)
-                backup_name = f"backup_{timestamp}_{filename}"
             else:
-                backup_name = f"backup_{timestamp}_unsaved_log.adi"
-            
-            backup_path = os.path.join(self.settings['backup_dir'], backup_name)
-            adi_content = self.generate_adi()
-            
-            with open(backup_path, 'w', encoding='utf-8') as f:
-                f.write(adi_content)
+                filename = "unsaved_log.adi"
             
-            print(f"Backup luotu: {backup_name}")
-            
-            # Poista vanhat backupit (säilytä vain 10 uusinta)
-            self.cleanup_old_backups()
+            backup_path, chunk = self.backups.plan(filename, self.log_entries,
+                                                   full=self.backup_full)
+            self.backup_dirty = False
+            self.backup_full = False
+            self.write_adi_async(backup_path, chunk, self.backup_written)
             
         except Exception as e:
             print(f"Backupin luonti epäonnistui: {e}")
     
-    def cleanup_old_backups(self):
-        """Poista vanhat backup-tiedostot, säilytä vain 10 uusinta"""
-        try:
-            backup_files = []
-            for file in os.listdir(self.settings['backup_dir']):
-                if file.startswith('backup_') and file.endswith('.adi'):
-                    file_path = os.path.join(self.settings['backup_dir'], file)
-                    backup_files.append((file_path, os.path.getmtime(file_path)))
-            
-            # Lajittele uusin ensin
-            backup_files.sort(key=lambda x: x[1], reverse=True)
-            
-            # Poista ylimääräiset
-            for file_path, _ in backup_files[10:]:
-                os.remove(file_path)
-                print(f"Vanha backup poistettu: {os.path.basename(file_path)}")
-                
-        except Exception as e:
-            print(f"Vanhojen backupien poisto epäonnistui: {e}")
+    def backup_written(self, backup_path, error):
+        if error is not None:
+            print(f"Backupin luonti epäonnistui: {error}")
+            # Seuraavalla kerralla täysi backup
+            self.backup_dirty = True
+            self.backup_full = True
+        else:
+            print(f"Backup luotu: {os.path.basename(backup_path)}")
     
     def auto_open_last_log(self):
         """Yritä avata viimeksi käytetty loki automaattisesti"""
         try:
             if (self.settings.get('auto_open_last', True) and 
+                not self.log_modified and
                 self.settings.get('last_log_file') and 
                 os.path.exists(self.settings['last_log_file'])):
                 
@@ -167,7 +457,7 @@ class HamLogger:
                 
                 # Tarkista että tiedosto on luettavissa
                 try:
-                    with open(last_log, 'r', encoding='utf-8') as f:
+                    with open(last_log, 'rb') as f:
                         test_content = f.read(100)  # Lue vain pieni osa testiksi
                 except:
                     print("Edellinen lokitiedosto ei ole luettavissa")
@@ -178,45 +468,19 @@ class HamLogger:
                     f"Haluatko avata viimeksi käytetyn lokin?\n{os.path.basename(last_log)}"
                 )
                 if response:
-                    success = self.load_log_file(last_log)
-                    if not success:
-                        messagebox.showerror("Virhe", "Edellisen lokin avaaminen epäonnistui")
+                    self.start_log_load(last_log)
         except Exception as e:
             print(f"Automaattisen lokin avaus epäonnistui: {e}")
     
     def load_log_file(self, filename):
         """Lataa lokitiedosto (käytetään auto_open_last_log:ssa)"""
         try:
-            content = None
-            encodings = ['utf-8', 'latin-1', 'cp1252', 'iso-8859-1']
-            
-            for encoding in encodings:
-                try:
-                    with open(filename, 'r', encoding=encoding) as f:
-                        content = f.read()
-                    print(f"Tiedosto luettu onnistuneesti enkoodauksella: {encoding}")
-                    break
-                except UnicodeDecodeError:
-                    continue
-            
-            if content is None:
-                messagebox.showerror("Tiedoston avausvirhe", "Tiedoston enkoodausta ei tunnistettu.")
-                return False
-            self.log_entries = []  
-            success_count = self.parse_adi_content(content)
+            success_count = self.read_log_entries(filename)
             
             if success_count > 0:
                 self.current_log_file = filename
-                self.log_modified = False
-                self.update_header()
-                
-                self.update_stats()
-                self.log_text.delete(1.0, tk.END)
-                for qso in self.log_entries:
-                    self.add_to_log_display(qso)
-                
-                if self.log_entries:
-                    self.update_previous_contact(self.log_entries[-1])
+                self.log_modified = self.recovered_changes > 0 or not self.log_store_synced()
+                self.display_log()
                 
                 # Päivitä asetukset
                 self.settings['last_log_file'] = filename
@@ -233,6 +497,9 @@ class HamLogger:
 
     def import_text_log(self):
         """Tuo tekstitiedostona oleva hamlokki"""
+        if self.log_loading_busy():
+            return
+        
         filename = filedialog.askopenfilename(
             title="Valitse tuotava tekstitiedosto",
             filetypes=[
@@ -247,11 +514,13 @@ class HamLogger:
         if not filename:
             return
         
+        # Kesken oleva tallennus voi vielä palauttaa lokin tilan
+        self.finish_pending_writes()
         try:
             with open(filename, 'r', encoding='utf-8') as f:
                 lines = f.readlines()
             
-            imported_count = 0
+            parsed = []
             skipped_count = 0
             
             for line_num, line in enumerate(lines, 1):
@@ -262,24 +531,30 @@ class HamLogger:
                 # Yritä jäsentää erilaisia tekstitiedostoformaattia
                 qso_data = self.parse_text_qso(line)
                 if qso_data:
-                    # Tarkista onko duplikaatti
-                    if not self.is_duplicate_contact(qso_data):
-                        self.log_entries.append(qso_data)
-                        self.add_to_log_display(qso_data)
-                        imported_count += 1
-                    else:
-                        skipped_count += 1
+                    parsed.append(qso_data)
                 else:
                     skipped_count += 1
             
+            # Sama yhteys lokissa tai tiedostossa jo aiemmin (aikaikkunan sisällä) ohitetaan
+            imported, merged = drop_near_duplicates(self.log_entries, parsed, self.merge_tolerance(),
+                                                    self.settings.get('merge_exact_call', False))
+            for qso_data in imported:
+                self.add_qso(qso_data)
+            imported_count = len(imported)
+            
             if imported_count > 0:
                 self.log_modified = True
-                self.update_stats()
-                self.update_header()
+                self.display_log()
                 
                 messagebox.showinfo(
                     "Tuonti valmis",
                     f"Tuonti valmis!\nTuotuja QSO:ita: {imported_count}\nOhitettuja: {skipped_count}"
+                    f"{self.near_duplicate_report(merged)}"
+                )
+            elif merged:
+                messagebox.showinfo(
+                    "Tuonti valmis",
+                    f"Kaikki tiedoston QSO:t ovat jo lokissa.{self.near_duplicate_report(merged)}"
                 )
             else:
                 messagebox.showwarning(
@@ -290,107 +565,28 @@ class HamLogger:
         except Exception as e:
             messagebox.showerror("Tuontivirhe", f"Tiedoston tuonti epäonnistui: {str(e)}")
     
-    def parse_text_qso(self, line):
-        """Jäsennä QSO-tietue tekstirivistä"""
+    def merge_tolerance(self):
+        """Lähekkäisten kaksoiskappaleiden aikaikkuna sekunteina asetuksista"""
         try:
-            # Poista ylimääräiset välilyönnit
-            line = ' '.join(line.split())
-            
-            # Yleisimpiä lokimuotoja:
-            # 1. OH2ABC 59 59 2024-01-15 14:30 20m SSB
-            # 2. 2024-01-15 14:30 OH2ABC 20m SSB 59 59
-            # 3. OH2ABC,59,59,2024-01-15,14:30,20m,SSB (CSV)
-            
-            parts = []
-            
-            # Kokeile ensin CSV-muotoa
-            if ',' in line:
-                parts = [p.strip() for p in line.split(',')]
-            else:
-                parts = line.split()
-            
-            if len(parts) < 5:
-                return None
-            
-            qso_data = {
-                'timestamp': '',
-                'call': '',
-                'band': self.current_band,
-                'mode': self.current_mode,
-                'rst_sent': self.settings['default_rst_sent'],
-                'rst_rcvd': self.settings['default_rst_rcvd'],
-                'comment': '',
-                'my_gridsquare': self.settings['mylocator'],
-                'their_wwff': ''
-            }
-            
-            # Etsi osat
-            for part in parts:
-                part_upper = part.upper()
-                
-                # Kutsu (sisältää numeroita ja kirjaimia)
-                if any(c.isdigit() for c in part) and any(c.isalpha() for c in part) and len(part) >= 3:
-                    if not qso_data['call']:
-                        qso_data['call'] = part_upper
-                
-                # Päivämäärä (vuosi-kuukausi-päivä)
-                elif re.match(r'\d{4}-\d{2}-\d{2}', part):
-                    date_part = part
-                
-                # Aika (tunnit:minuutit)
-                elif re.match(r'\d{1,2}:\d{2}', part):
-                    time_part = part
-                    if ':' in time_part and time_part.count(':') == 1:
-                        time_part += ':00'  # Lisää sekunnit
-                
-                # Bandit
-                elif part_upper in ['160M', '80M', '60M', '40M', '30M', '20M', '17M', '15M', '12M', '10M', '6M', '2M', '70CM']:
-                    qso_data['band'] = part_upper.lower()
-                
-                # Modet
-                elif part_upper in ['SSB', 'LSB', 'USB', 'CW', 'FM', 'AM', 'FT8', 'FT4', 'RTTY', 'PSK', 'FREEDV']:
-                    qso_data['mode'] = part_upper
-                
-                # RST (vain numerot, pituus 2-3)
-                elif part.isdigit() and 2 <= len(part) <= 3:
-                    if qso_data['rst_sent'] == self.settings['default_rst_sent']:
-                        qso_data['rst_sent'] = part
-                    else:
-                        qso_data['rst_rcvd'] = part
-            
-            # Yhdistä päivämäärä ja aika
-            if 'date_part' in locals() and 'time_part' in locals():
-                try:
-                    datetime_obj = datetime.datetime.strptime(f"{date_part} {time_part}", '%Y-%m-%d %H:%M:%S')
-                    qso_data['timestamp'] = datetime_obj.strftime('%Y-%m-%d %H:%M:%S')
-                except:
-                    qso_data['timestamp'] = datetime.datetime.now(datetime.UTC).strftime('%Y-%m-%d %H:%M:%S')
-            else:
-                qso_data['timestamp'] = datetime.datetime.now(datetime.UTC).strftime('%Y-%m-%d %H:%M:%S')
-            
-            # Kommentti on kaikki muu teksti
-            comment_parts = []
-            for part in parts:
-                if (part != qso_data['call'] and 
-                    part != date_part if 'date_part' in locals() else True and
-                    part != time_part if 'time_part' in locals() else True and
-                    part.upper() != qso_data['band'].upper() and
-                    part.upper() != qso_data['mode'] and
-                    part != qso_data['rst_sent'] and
-                    part != qso_data['rst_rcvd']):
-                    comment_parts.append(part)
-            
-            qso_data['comment'] = ' '.join(comment_parts)
-            
-            # Varmista että kaikki pakolliset kentät on täytetty
-            if qso_data['call'] and qso_data['timestamp']:
-                return qso_data
-            else:
-                return None
-                
-        except Exception as e:
-            print(f"Virhe rivin jäsentämisessä: {line} - {e}")
-            return None
+            return max(0, int(self.settings.get('merge_tolerance_minutes', MERGE_TOLERANCE_MINUTES))) * 60
+        except (TypeError, ValueError):
+            return MERGE_TOLERANCE_MINUTES * 60
+    
+    def near_duplicate_report(self, merged, limit=10):
+        """Yhteenveto yhdistetyistä kaksoiskappaleista ilmoitukseen (tyhjä jos ei yhtään)"""
+        if not merged:
+            return ""
+        lines = [f"\n\nYhdistettyjä kaksoiskappaleita: {len(merged)}"]
+        lines += [describe_near_duplicate(kept, dropped) for kept, dropped in merged[:limit]]
+        if len(merged) > limit:
+            lines.append(f"... ja {len(merged) - limit} muuta")
+        return "\n".join(lines)
+    
+    def parse_text_qso(self, line):
+        """Jäsennä QSO-tietue tekstirivistä nykyisillä oletusarvoilla"""
+        return parse_text_qso(line, self.current_band, self.current_mode,
+                              self.settings['default_rst_sent'], self.settings['default_rst_rcvd'],
+                              self.settings['mylocator'])
 
     # Päivitetään valikko sisältämään tuontitoiminto
     def update_menus(self):
@@ -727,12 +923,23 @@ class HamLogger:
                 'merge_complete': "Merge complete",
                 'merge_error': "Merge error",
                 'select_logs_to_merge': "Select logs to merge",
-                'select_first_log': "Select first log file",
-                'select_second_log': "Select second log file",
                 'about_title': "About HamLogger",
                 'about_text': f"HamLogger - Radio Amateur Logging Software\nVersion {self.version}\nDeveloped by OH3ENK\n\nSimple and efficient logging for radio amateurs\nSupports ADI 3.1.0 format and WWFF logging",
                 'edit_entry': "Edit Entry",
                 'delete_entry': "Delete Entry",
+                'sort_oldest_first': "Sort: oldest first",
+                'sort_newest_first': "Sort: newest first",
+                'sort_by_call': "Sort: by callsign",
+                'loading_log': "Loading log...",
+                'loading_busy': "Wait until the log has loaded or cancel loading.",
+                'cancel': "Cancel",
+                'diagnostics': "Diagnostics",
+                'latency_disabled': "Latency measurement is off (Settings → Other settings).",
+                'stage': "Stage",
+                'log_size': "Log size",
+                'refresh': "Refresh",
+                'save_json': "Save JSON...",
+                'reset': "Reset",
                 'edit_qso': "Edit QSO"
             }
         else:  # suomi
@@ -784,12 +991,23 @@ class HamLogger:
                 'merge_complete': "Yhdistäminen valmis",
                 'merge_error': "Yhdistämisvirhe",
                 'select_logs_to_merge': "Valitse yhdistettävät lokit",
-                'select_first_log': "Valitse ensimmäinen lokitiedosto",
-                'select_second_log': "Valitse toinen lokitiedosto",
                 'about_title': "Tietoa OHHamLoggerista",
                 'about_text': f"OHHamLogger - Radioamatöörilokiohjelma\nVersio {self.version}\nKehittänyt OH3ENK\n\nYksinkertainen ja tehokas lokinpito radioamatööreille\nTuki ADI 3.1.0 -formaattiin ja WWFF-lokeihin",
                 'edit_entry': "Muokkaa merkintää",
                 'delete_entry': "Poista merkintä",
+                'sort_oldest_first': "Järjestys: vanhin ensin",
+                'sort_newest_first': "Järjestys: uusin ensin",
+                'sort_by_call': "Järjestys: kutsun mukaan",
+                'loading_log': "Ladataan lokia...",
+                'loading_busy': "Odota kunnes loki on ladattu tai peruuta lataus.",
+                'cancel': "Peruuta",
+                'diagnostics': "Diagnostiikka",
+                'latency_disabled': "Viivemittaus ei ole päällä (Asetukset → Muut asetukset).",
+                'stage': "Vaihe",
+                'log_size': "Lokin koko",
+                'refresh': "Päivitä",
+                'save_json': "Tallenna JSON...",
+                'reset': "Nollaa",
                 'edit_qso': "Muokkaa QSO:ta"
             }
         
@@ -806,8 +1024,11 @@ class HamLogger:
             'no_open_log', 'log', 'modified', 'no_contacts', 'no_data', 
             'no_qso_data', 'file_open_error', 'file_save_error', 
             'export_complete', 'merge_complete', 'merge_error', 
-            'select_logs_to_merge', 'select_first_log', 'select_second_log', 
-            'about_title', 'about_text'
+            'select_logs_to_merge', 
+            'about_title', 'about_text', 'sort_oldest_first', 
+            'sort_newest_first', 'sort_by_call', 'loading_log', 
+            'loading_busy', 'cancel', 'diagnostics', 'latency_disabled',
+            'stage', 'log_size', 'refresh', 'save_json', 'reset'
         ]
         
         # Lisää puuttuvat avaimet oletusarvoilla
@@ -870,11 +1091,7 @@ class HamLogger:
         
         # Päivitä tilastot
         if hasattr(self, 'total_qso_label'):
-            total = len(self.log_entries)
-            today = datetime.datetime.now(datetime.UTC).strftime('%Y-%m-%d')
-            today_count = sum(1 for qso in self.log_entries if qso['timestamp'].startswith(today))
-            self.total_qso_label.config(text=f"{self.texts['total_qsos']} {total}")
-            self.today_qso_label.config(text=f"{self.texts['today']} {today_count}")
+            self.update_stats()
     
     def apply_theme(self):
         """Sovelleta valittu teema"""
@@ -1018,6 +1235,7 @@ class HamLogger:
         self.info_menu = tk.Menu(menubar, tearoff=0)
         menubar.add_cascade(label=self.texts['info_menu'], menu=self.info_menu)
         self.info_menu.add_command(label=self.texts['about'], command=self.show_about)
+        self.info_menu.add_command(label=self.texts['diagnostics'], command=self.show_diagnostics)
         
         # Ohje-valikko
         self.help_menu = tk.Menu(menubar, tearoff=0)
@@ -1054,6 +1272,7 @@ class HamLogger:
         self.info_menu = tk.Menu(menubar, tearoff=0)
         menubar.add_cascade(label=self.texts['info_menu'], menu=self.info_menu)
         self.info_menu.add_command(label=self.texts['about'], command=self.show_about)
+        self.info_menu.add_command(label=self.texts['diagnostics'], command=self.show_diagnostics)
         
         # Ohje-valikko
         self.help_menu = tk.Menu(menubar, tearoff=0)
@@ -1122,8 +1341,9 @@ class HamLogger:
         self.log_frame = ttk.LabelFrame(parent, text=self.texts['qso_log'], padding="5")
         self.log_frame.pack(fill=tk.BOTH, expand=True, pady=(0, 10))
         
-        # Luo Text widget tagit erilaisille tyyleille
-        self.log_text = tk.Text(self.log_frame, height=20, width=70, font=('Courier New', 9))
+        # Virtualisoitu näkymä: Text-widgetissä vain näkyvät rivit
+        self.log_view = VirtualLogView(self.log_frame, lambda: len(self.log_entries), self.format_log_row)
+        self.log_text = self.log_view.text
         
         # Määritä tyylit
         self.log_text.tag_configure("duplicate", foreground="red", font=('Courier New', 9, 'bold'))
@@ -1133,11 +1353,7 @@ class HamLogger:
         self.log_text.bind('<Button-3>', self.show_log_context_menu)
         self.log_text.bind('<Double-Button-1>', self.on_log_double_click)
         
-        scrollbar = ttk.Scrollbar(self.log_frame, orient="vertical", command=self.log_text.yview)
-        self.log_text.configure(yscrollcommand=scrollbar.set)
-        
-        self.log_text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.log_view.pack()
     
     def create_input_section(self, parent):
         """Luo syöttöosion"""
@@ -1149,6 +1365,10 @@ class HamLogger:
         self.input_entry.grid(row=0, column=1, sticky=(tk.W, tk.E), padx=(5, 0))
         self.input_entry.bind('<Return>', self.process_input)
         self.input_entry.bind('<KeyRelease>', self.check_special_input)
+        self.input_hint_label = ttk.Label(self.input_frame, text="")
+        self.input_hint_label.grid(row=1, column=1, sticky=tk.W, padx=(5, 0))
+        self.scp_label = ttk.Label(self.input_frame, text="")
+        self.scp_label.grid(row=2, column=1, sticky=tk.W, padx=(5, 0))
         
         self.input_frame.columnconfigure(1, weight=1)
     
@@ -1222,6 +1442,7 @@ class HamLogger:
         
         self.prev_contact_label = ttk.Label(self.prev_contact_frame, text=self.texts['no_contacts'], wraplength=250)
         self.prev_contact_label.pack(anchor=tk.W)
+        self.prev_contact_label.bind('<Button-1>', lambda event: self.show_previous_contact())
         
         # Tilastot
         self.stats_frame = ttk.LabelFrame(parent, text=self.texts['stats'], padding="10")
@@ -1232,11 +1453,75 @@ class HamLogger:
         
         self.today_qso_label = ttk.Label(self.stats_frame, text=f"{self.texts['today']} 0")
         self.today_qso_label.pack(anchor=tk.W, pady=2)
+        
+        self.band_mode_qso_label = ttk.Label(self.stats_frame, text=f"{self.current_band}: 0 | {self.current_mode}: 0")
+        self.band_mode_qso_label.pack(anchor=tk.W, pady=2)
     
     def show_about(self):
         """Näytä tietoa ohjelmasta -dialogi"""
         messagebox.showinfo(self.texts['about_title'], self.texts['about_text'])
     
+    def configure_latency(self):
+        """Ota viivemittaus käyttöön tai pois asetuksen mukaan"""
+        if not self.settings.get('latency_stats'):
+            self.latency = None
+        elif self.latency is None:
+            self.latency = LatencyRecorder()
+    
+    def show_diagnostics(self):
+        """Näytä vaiheiden viiveet (p50/p95/p99) lokin kokoluokittain"""
+        if self.latency is None:
+            messagebox.showinfo(self.texts['diagnostics'], self.texts['latency_disabled'])
+            return
+        
+        window = tk.Toplevel(self.root)
+        window.title(self.texts['diagnostics'])
+        window.geometry("720x400")
+        
+        columns = ('stage', 'log_size', 'count', 'p50', 'p95', 'p99', 'max')
+        tree = ttk.Treeview(window, columns=columns, show='headings')
+        headings = (self.texts['stage'], self.texts['log_size'], 'n',
+                    'p50 ms', 'p95 ms', 'p99 ms', 'max ms')
+        for column, heading in zip(columns, headings):
+            tree.heading(column, text=heading)
+            tree.column(column, width=180 if column == 'stage' else 80,
+                        anchor=tk.W if column == 'stage' else tk.E)
+        tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=(10, 5))
+        
+        def refresh():
+            tree.delete(*tree.get_children())
+            for stage, size_class, histogram in self.latency.rows():
+                stats = histogram.to_dict()
+                tree.insert('', tk.END, values=(
+                    stage, f"{size_class}+", stats['count'],
+                    f"{stats['p50_ms']:.2f}", f"{stats['p95_ms']:.2f}",
+                    f"{stats['p99_ms']:.2f}", f"{stats['max_ms']:.2f}"))
+        
+        def save_json():
+            filename = filedialog.asksaveasfilename(
+                parent=window,
+                initialdir=self.settings['data_dir'],
+                defaultextension=".json",
+                filetypes=[("JSON files", "*.json"), ("All files", "*.*")]
+            )
+            if filename:
+                try:
+                    self.latency.dump_json(filename, len(self.log_entries))
+                except OSError as e:
+                    messagebox.showerror(self.texts['file_save_error'], str(e), parent=window)
+        
+        def reset():
+            self.latency.reset()
+            refresh()
+        
+        button_frame = ttk.Frame(window)
+        button_frame.pack(fill=tk.X, padx=10, pady=(0, 10))
+        ttk.Button(button_frame, text=self.texts['refresh'], command=refresh).pack(side=tk.LEFT)
+        ttk.Button(button_frame, text=self.texts['save_json'], command=save_json).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text=self.texts['reset'], command=reset).pack(side=tk.LEFT)
+        
+        refresh()
+    
     def show_help(self):
         """Näytä ohje"""
         help_text = """
@@ -1258,7 +1543,8 @@ WWFF-lokitus:
 - Tiedostonimi muodostuu automaattisesti: OMAKUTSU@WWFF-ALUE.adi
 
 Lokien yhdistäminen:
-- Tiedosto → Yhdistä lokit: yhdistää kaksi ADI-lokia yhdeksi
+- Tiedosto → Yhdistä lokit: yhdistää valitut ADI-lokit (kuinka monta tahansa) yhdeksi
+- Päällekkäiset QSO:t poistetaan ja lokit järjestetään ajan mukaan
 
 Lisätietoja: http://sourceforge.net/p/ohhamlogger
         """
@@ -1282,7 +1568,8 @@ WWFF Logging:
 - Filename generated automatically: MYCALL@WWFF-AREA.adi
 
 Log Merging:
-- File → Merge Logs: combines two ADI logs into one
+- File → Merge Logs: combines any number of selected ADI logs into one
+- Duplicate QSOs are removed and the result is sorted by time
 
 More info: https://github.com/oh3enk/hamlogger
             """
@@ -1307,8 +1594,12 @@ More info: https://github.com/oh3enk/hamlogger
     
     def update_clock(self):
         """Päivitä UTC-kello sekunneilla"""
-        utc_time = datetime.datetime.now(datetime.UTC).strftime('UTC: %H:%M:%S')
-        self.clock_label.config(text=utc_time)
+        now = datetime.datetime.now(datetime.UTC)
+        self.clock_label.config(text=now.strftime('UTC: %H:%M:%S'))
+        
+        # UTC-päivä vaihtui: "Tänään"-laskuri alkaa alusta
+        if self.stats_day is not None and utc_day_now() != self.stats_day:
+            self.update_stats()
         self.root.after(1000, self.update_clock)
     
     def quick_band_change(self, band):
@@ -1327,380 +1618,254 @@ More info: https://github.com/oh3enk/hamlogger
         """Päivitä info-näkymät"""
         self.current_band_label.config(text=f"Band: {self.current_band}")
         self.current_mode_label.config(text=f"Mode: {self.current_mode}")
+        self.update_band_mode_stats()
     
     def check_special_input(self, event=None):
-        """Tarkista erikoissyötteet reaaliajassa"""
-        text = self.input_entry.get().strip().upper()
+        """Päivitä syöttörivin tila näppäilyn jälkeen, tulkinta viivästetään"""
+        if not self.input_state.update(self.input_entry.get()):
+            return
         
-        if not text:
+        self.update_scp_matches()
+        if self.input_hint_job is not None:
+            self.root.after_cancel(self.input_hint_job)
+        self.input_hint_job = self.root.after(INPUT_HINT_DELAY_MS, self.apply_input_hints)
+    
+    def apply_input_hints(self):
+        """Vaihda band/mode ja näytä tulkinta, kun kirjoittaminen pysähtyy"""
+        self.input_hint_job = None
+        command = self.input_state.command
+        if command and command[1] != (self.current_band if command[0] == 'band' else self.current_mode):
+            self.apply_input_command(*command)
+        self.input_hint_label.config(text=self.input_state.hint())
+    
+    def update_scp_matches(self):
+        """Näytä kirjoitettua kutsua vastaavat kutsut lokista ja SCP-tiedostosta"""
+        fragment = self.input_state.call
+        if fragment == self.scp_fragment:
+            return
+        self.scp_fragment = fragment
+        
+        matches = self.log_calls.matches(fragment) if fragment else []
+        if len(matches) < SCP_MATCH_LIMIT and fragment:
+            seen = set(matches)
+            for call in self.scp_calls.matches(fragment):
+                if call not in seen:
+                    matches.append(call)
+                    if len(matches) == SCP_MATCH_LIMIT:
+                        break
+        self.scp_label.config(text=" ".join(matches))
+    
+    def load_scp_file(self):
+        """Lue MASTER.SCP taustalla, jos tiedosto on olemassa"""
+        filename = self.settings.get('scp_file')
+        if not filename or not os.path.exists(filename):
             return
         
-        # Pilkun jälkeinen luku tulkitaan cm-bandiksi
-        if ',' in text:
-            parts = text.split(',')
-            if len(parts) == 2 and parts[1].strip().isdigit():
-                cm_value = parts[1].strip()
-                if 1 <= len(cm_value) <= 3:
-                    self.current_band = f"{cm_value}cm"
-                    self.update_info_display()
-                    return
+        def load():
+            try:
+                # Valmis indeksi vaihdetaan kerralla käyttöön
+                self.scp_calls = PartialCallIndex().load_file(filename)
+            except (OSError, UnicodeDecodeError) as e:
+                print(f"SCP-tiedoston luku epäonnistui: {e}")
         
-        # Pelkkä numerosarja (1-4 numeroa) - vaihda band
-        if text.isdigit() and 1 <= len(text) <= 4:
-            self.current_band = f"{text}m"
-            self.update_info_display()
-        
-        # Pelkkä kirjainsarja (1-4 kirjainta) - vaihda mode
-        elif text.isalpha() and 1 <= len(text) <= 4:
-            mode_map = {
-                'SSB': 'SSB', 'LSB': 'LSB', 'USB': 'USB', 'CW': 'CW', 
-                'FM': 'FM', 'AM': 'AM', 'FT8': 'FT8', 'FT4': 'FT4',
-                'RTTY': 'RTTY', 'PSK': 'PSK', 'JT65': 'JT65', 'FREEDV': 'FreeDV'
-            }
-            if text in mode_map:
-                self.current_mode = mode_map[text]
-                self.update_info_display()
+        threading.Thread(target=load, daemon=True).start()
+    
+    def clear_input_hints(self):
+        """Nollaa syöttörivin tila rivin käsittelyn jälkeen"""
+        if self.input_hint_job is not None:
+            self.root.after_cancel(self.input_hint_job)
+            self.input_hint_job = None
+        self.input_state.reset()
+        self.input_hint_label.config(text="")
+        self.update_scp_matches()
+    
+    def apply_input_command(self, kind, value):
+        """Vaihda band tai mode syöttörivin komennon mukaan"""
+        if kind == 'band':
+            self.current_band = value
+        else:
+            self.current_mode = value
+        self.update_info_display()
     
+    @timed('process_input')
     def process_input(self, event=None):
         """Käsittele syöttörivin tiedot"""
         text = self.input_entry.get().strip().upper()
         if not text:
             return
         
-        # Tarkista ensin erikoiskomennot (band/mode vaihto)
-        if len(text.split()) == 1:
-            # Pilkun jälkeinen luku cm-bandiksi
-            if ',' in text:
-                parts = text.split(',')
-                if len(parts) == 2 and parts[1].strip().isdigit():
-                    cm_value = parts[1].strip()
-                    if 1 <= len(cm_value) <= 3:
-                        self.current_band = f"{cm_value}cm"
-                        self.update_info_display()
-                        self.input_entry.delete(0, tk.END)
-                        return "break"
-            
-            # Numerosarja bandiksi
-            if text.isdigit() and 1 <= len(text) <= 4:
-                self.current_band = f"{text}m"
-                self.update_info_display()
-                self.input_entry.delete(0, tk.END)
-                return "break"
-            
-            # Kirjainsarja modeksi
-            elif text.isalpha() and 1 <= len(text) <= 4:
-                mode_map = {
-                    'SSB': 'SSB', 'LSB': 'LSB', 'USB': 'USB', 'CW': 'CW', 
-                    'FM': 'FM', 'AM': 'AM', 'FT8': 'FT8', 'FT4': 'FT4',
-                    'RTTY': 'RTTY', 'PSK': 'PSK', 'JT65': 'JT65', 'FREEDV': 'FreeDV'
-                }
-                if text in mode_map:
-                    self.current_mode = mode_map[text]
-                    self.update_info_display()
-                    self.input_entry.delete(0, tk.END)
-                    return "break"
-        
-        # KORJATTU OSA: Tunnista radioamatöörikutsu ja täydennä raportti automaattisesti
-        parts = text.split()
-        
-        # Tarkista onko syöte mahdollisesti kutsu (sisältää kirjaimia ja numeroita)
-        if len(parts) >= 1:
-            callsign = parts[0]
-            
-            # Yksinkertainen kutsumerkin tunnistus (sisältää vähintään yhden numeron ja kirjaimia)
-            if any(char.isdigit() for char in callsign) and any(char.isalpha() for char in callsign):
-                
-                # Jos on vain kutsu ilman raportteja, täydennä automaattisesti
-                if len(parts) == 1:
-                    # Täydennä oletusraportit
-                    rst_sent = self.settings['default_rst_sent']
-                    rst_rcvd = self.settings['default_rst_rcvd']
-                    
-                    # CW-mode erikoiskäsittely
-                    if self.current_mode == 'CW':
-                        if len(rst_sent) == 2:
-                            rst_sent += '9'
-                        if len(rst_rcvd) == 2:
-                            rst_rcvd += '9'
-                    
-                    # Luo QSO-tietue pelkällä kutsulla + automaattisilla raporteilla
-                    qso_data = {
-                        'timestamp': datetime.datetime.now(datetime.UTC).strftime('%Y-%m-%d %H:%M:%S'),
-                        'call': callsign,
-                        'band': self.current_band,
-                        'mode': self.current_mode,
-                        'rst_sent': rst_sent,
-                        'rst_rcvd': rst_rcvd,
-                        'comment': "",
-                        'my_gridsquare': self.settings['mylocator'],
-                        'their_wwff': ""
-                    }
-                    
-                    self.log_entries.append(qso_data)
-                    self.add_to_log_display(qso_data)
-                    self.update_stats()
-                    self.update_previous_contact(qso_data)
-                    self.log_modified = True
-                    self.update_header()
-                    
-                    self.input_entry.delete(0, tk.END)
-                    return "break"
-                
-                # KORJATTU: Tässä oli sisennysvirhe - nyt korjattu
-                # Jos on kutsu + numeroita, tulkitaan ensimmäinen numero raportiksi
-                elif len(parts) >= 2 and parts[1].isdigit():
-                    rst_sent = parts[1]
-                    rst_rcvd = self.settings['default_rst_rcvd']  # Oletus toiselle raportille
-                    comment = ""
-                    their_wwff = ""
-                    
-                    # CW-mode erikoiskäsittely
-                    if self.current_mode == 'CW':
-                        if len(rst_sent) == 2:
-                            rst_sent += '9'
-                        if len(rst_rcvd) == 2:
-                            rst_rcvd += '9'
-                    
-                    # Tarkista onko kolmas osa numero (toinen raportti)
-                    if len(parts) >= 3 and parts[2].isdigit():
-                        rst_rcvd = parts[2]
-                        comment_parts = parts[3:]
-                    else:
-                        comment_parts = parts[2:]
-                    
-                    # PARANNELTU WWFF-TUNNISTUS: Tunnista vain prefix+FF muodot
-                    wwff_found_index = -1
-                    for i, part in enumerate(comment_parts):
-                        # Tunnista maatunnus + FF (OHFF-1234, DLFF-1234, jne.)
-                        if '-' in part and len(part.split('-')) == 2:
-                            prefix, number = part.split('-')
-                            # Tunnista 2-4 kirjaimen prefix + FF + numero (OHFF-1234, GFF-1234)
-                            if (2 <= len(prefix) <= 4 and 
-                                prefix.upper().endswith('FF') and 
-                                number.isdigit() and 1 <= len(number) <= 4):
-                                their_wwff = part
-                                wwff_found_index = i
-                                break
-                            # Tunnista myös FF + maatunnus (FF-OH-1234, FF-DL-1234)
-                            elif (prefix.upper() == 'FF' and 
-                                  len(number) >= 2 and
-                                  number[:2].isalpha() and 
-                                  number[2:].isdigit() and 1 <= len(number[2:]) <= 4):
-                                their_wwff = f"FF-{number}"
-                                wwff_found_index = i
-                                break
-                            # Tunnista UK-erikoismuodot (GFF-1234, GMFF-1234, GWFF-1234, GIFF-1234, GUFF-1234)
-                            elif (len(prefix) in [3, 4] and 
-                                  prefix.startswith(('G', 'GM', 'GW', 'GI', 'GU')) and 
-                                  prefix.endswith('FF') and 
-                                  number.isdigit() and 1 <= len(number) <= 4):
-                                their_wwff = part
-                                wwff_found_index = i
-                                break
-                    
-                    # Poista WWFF comment_parts:sta
-                    if wwff_found_index >= 0:
-                        comment_parts = comment_parts[:wwff_found_index] + comment_parts[wwff_found_index+1:]
-                    
-                    comment = " ".join(comment_parts) if comment_parts else ""
-                    
-                    # Luo QSO-tietue
-                    qso_data = {
-                        'timestamp': datetime.datetime.now(datetime.UTC).strftime('%Y-%m-%d %H:%M:%S'),
-                        'call': callsign,
-                        'band': self.current_band,
-                        'mode': self.current_mode,
-                        'rst_sent': rst_sent,
-                        'rst_rcvd': rst_rcvd,
-                        'comment': comment,
-                        'my_gridsquare': self.settings['mylocator'],
-                        'their_wwff': their_wwff
-                    }
-                    
-                    self.log_entries.append(qso_data)
-                    self.add_to_log_display(qso_data)
-                    self.update_stats()
-                    self.update_previous_contact(qso_data)
-                    self.log_modified = True
-                    self.update_header()
-                    
-                    self.input_entry.delete(0, tk.END)
-                    return "break"
-        
-        # Vanha käsittely muille syötteille
-        if len(text.split()) >= 2:
-            parts = text.split()
-            callsign = parts[0]
-            rst_sent = self.settings['default_rst_sent']
-            rst_rcvd = self.settings['default_rst_rcvd']
-            comment = ""
-            their_wwff = ""  # Vasta-aseman WWFF-tunnus
-            
-            # Etsi RST:t ja WWFF-tunnus
-            if len(parts) >= 3:
-                if parts[1].isdigit() and parts[2].isdigit():
-                    rst_sent = parts[1]
-                    rst_rcvd = parts[2]
-                    
-                    # PARANNELTU WWFF-TUNNISTUS: Etsi vain prefix+FF muodot
-                    remaining_parts = parts[3:]
-                    wwff_found_index = -1
-                    for i, part in enumerate(remaining_parts):
-                        # Tunnista maatunnus + FF (OHFF-1234, DLFF-1234, jne.)
-                        if '-' in part and len(part.split('-')) == 2:
-                            prefix, number = part.split('-')
-                            # Tunnista 2-4 kirjaimen prefix + FF + numero
-                            if (2 <= len(prefix) <= 4 and 
-                                prefix.upper().endswith('FF') and 
-                                number.isdigit() and 1 <= len(number) <= 4):
-                                their_wwff = part
-                                wwff_found_index = i
-                                break
-                            # Tunnista FF + maatunnus (FF-OH-1234)
-                            elif (prefix.upper() == 'FF' and 
-                                  len(number) >= 2 and
-                                  number[:2].isalpha() and 
-                                  number[2:].isdigit() and 1 <= len(number[2:]) <= 4):
-                                their_wwff = f"FF-{number}"
-                                wwff_found_index = i
-                                break
-                            # Tunnista UK-erikoismuodot
-                            elif (len(prefix) in [3, 4] and 
-                                  prefix.startswith(('G', 'GM', 'GW', 'GI', 'GU')) and 
-                                  prefix.endswith('FF') and 
-                                  number.isdigit() and 1 <= len(number) <= 4):
-                                their_wwff = part
-                                wwff_found_index = i
-                                break
-                    
-                    # Poista WWFF remaining_parts:sta
-                    if wwff_found_index >= 0:
-                        remaining_parts = remaining_parts[:wwff_found_index] + remaining_parts[wwff_found_index+1:]
-                    
-                    comment = " ".join(remaining_parts) if remaining_parts else ""
-                else:
-                    # Ei RST:itä, etsi WWFF-tunnus suoraan
-                    remaining_parts = parts[1:]
-                    wwff_found_index = -1
-                    for i, part in enumerate(remaining_parts):
-                        # Sama paranneltu WWFF-tunnistus kuin yllä
-                        if '-' in part and len(part.split('-')) == 2:
-                            prefix, number = part.split('-')
-                            if (2 <= len(prefix) <= 4 and 
-                                prefix.upper().endswith('FF') and 
-                                number.isdigit() and 1 <= len(number) <= 4):
-                                their_wwff = part
-                                wwff_found_index = i
-                                break
-                            elif (prefix.upper() == 'FF' and 
-                                  len(number) >= 2 and
-                                  number[:2].isalpha() and 
-                                  number[2:].isdigit() and 1 <= len(number[2:]) <= 4):
-                                their_wwff = f"FF-{number}"
-                                wwff_found_index = i
-                                break
-                            elif (len(prefix) in [3, 4] and 
-                                  prefix.startswith(('G', 'GM', 'GW', 'GI', 'GU')) and 
-                                  prefix.endswith('FF') and 
-                                  number.isdigit() and 1 <= len(number) <= 4):
-                                their_wwff = part
-                                wwff_found_index = i
-                                break
-                    
-                    # Poista WWFF remaining_parts:sta
-                    if wwff_found_index >= 0:
-                        remaining_parts = remaining_parts[:wwff_found_index] + remaining_parts[wwff_found_index+1:]
-                    
-                    comment = " ".join(remaining_parts) if remaining_parts else ""
-            else:
-                comment = " ".join(parts[1:]) if len(parts) > 1 else ""
-            
-            # CW-mode erikoiskäsittely
-            if self.current_mode == 'CW':
-                if len(rst_sent) == 2:
-                    rst_sent += '9'
-                if len(rst_rcvd) == 2:
-                    rst_rcvd += '9'
-            
-            # Luo QSO-tietue
-            qso_data = {
-                'timestamp': datetime.datetime.now(datetime.UTC).strftime('%Y-%m-%d %H:%M:%S'),
-                'call': callsign,
-                'band': self.current_band,
-                'mode': self.current_mode,
-                'rst_sent': rst_sent,
-                'rst_rcvd': rst_rcvd,
-                'comment': comment,
-                'my_gridsquare': self.settings['mylocator'],
-                'their_wwff': their_wwff  # Tallennetaan vasta-aseman WWFF-tunnus
-            }
+        kind, value = parse_input_line(text, self.current_mode,
+                                       self.settings['default_rst_sent'],
+                                       self.settings['default_rst_rcvd'])
+        if kind == 'qso':
+            if self.latency is not None:
+                self.input_started = time.perf_counter()
+            qso_data = QSO(
+                epoch=int(time.time()),
+                band=self.current_band,
+                mode=self.current_mode,
+                my_gridsquare=self.settings['mylocator'],
+                **value
+            )
             
-            self.log_entries.append(qso_data)
-            self.add_to_log_display(qso_data)
-            self.update_stats()
-            self.update_previous_contact(qso_data)
+            self.add_qso(qso_data)
             self.log_modified = True
-            self.update_header()
+            self.log_changed(qso_data)
+        elif kind:
+            self.apply_input_command(kind, value)
         
         self.input_entry.delete(0, tk.END)
+        self.clear_input_hints()
         return "break"
     
+    @timed('is_duplicate_contact')
     def is_duplicate_contact(self, qso_data):
-        """Tarkista onko yhteys duplikaatti (sama kutsu, sama päivä, sama bandi, sama mode)"""
-        today = datetime.datetime.now(datetime.UTC).strftime('%Y-%m-%d')
-        base_call = qso_data['call'].split('/')[0]
-        
+        """Tarkista onko yhteys duplikaatti (sama kutsu, sama QSO-päivä, sama bandi, sama mode)"""
+        return self.dupe_index.is_duplicate(qso_data)
+    
+    def add_qso(self, qso_data):
+        """Lisää QSO lokiin ja indekseihin"""
+        self.log_entries.append(qso_data)
+        self.index_qso(qso_data)
+        self.entry_positions[qso_data.uid] = len(self.log_entries) - 1
+        if self.log_store is not None:
+            self.log_store.add(qso_data)
+        if self.journal is not None:
+            self.journal.append('add', qso=qso_data)
+    
+    def index_qso(self, qso_data):
+        """Lisää QSO hakuindekseihin"""
+        self.register_qso(qso_data)
+        self.dupe_index.add(qso_data)
+        self.call_history.add(qso_data)
+        if len(self.call_history.history(qso_data.call)) == 1:
+            self.log_calls.add(base_callsign(qso_data.call))
+        self.stats.add(qso_data)
+        self.log_generation += 1
+        self.backup_dirty = True
+    
+    def unindex_qso(self, qso_data):
+        """Poista QSO hakuindekseistä (ennen muokkausta tai poistoa)"""
+        self.qso_by_uid.pop(qso_data.uid, None)
+        self.dupe_index.remove(qso_data)
+        self.call_history.remove(qso_data)
+        if not self.call_history.history(qso_data.call):
+            self.log_calls.discard(base_callsign(qso_data.call))
+        self.stats.remove(qso_data)
+        self.log_generation += 1
+        self.backup_dirty = True
+        self.backup_full = True
+    
+    def rebuild_indexes(self):
+        """Rakenna hakuindeksit uudelleen koko lokista"""
+        self.qso_by_uid = {}
         for qso in self.log_entries:
-            if qso == qso_data:
-                continue
-                
-            qso_base_call = qso['call'].split('/')[0]
-            qso_date = qso['timestamp'].split(' ')[0]
-            
-            # Tarkista sama kutsu, sama päivä, sama bandi JA sama mode
-            if (qso_base_call == base_call and 
-                qso_date == today and 
-                qso['band'] == qso_data['band'] and 
-                qso['mode'] == qso_data['mode']):
-                return True
-        return False
+            self.register_qso(qso)
+        self.rebuild_entry_positions()
+        self.dupe_index.rebuild(self.log_entries)
+        self.call_history.rebuild(self.log_entries)
+        self.log_calls.rebuild(self.call_history.calls)
+        self.stats.rebuild(self.log_entries)
+        # Loki vaihtui: vanhan lokin taustatallennukset eivät saa merkitä tätä tallennetuksi
+        self.log_generation += 1
+        self.backup_dirty = True
+        self.backup_full = True
+    
+    def register_qso(self, qso_data):
+        """Anna QSO:lle pysyvä tunniste (muokattu kopio säilyttää alkuperäisen)"""
+        if qso_data.uid is None:
+            qso_data.uid = self.next_uid
+            self.next_uid += 1
+        self.qso_by_uid[qso_data.uid] = qso_data
     
-    def add_to_log_display(self, qso_data):
-        """Lisää QSO lokinäkymään"""
-        log_line = f"{qso_data['timestamp']} | {self.settings['mycall']} > {qso_data['call']} | RST: {qso_data['rst_sent']}/{qso_data['rst_rcvd']} | Band: {qso_data['band']} | Mode: {qso_data['mode']}"
+    def entry_index(self, uid):
+        """Tunnisteen QSO:n nykyinen paikka lokissa, None jos QSO on poistettu"""
+        qso = self.qso_by_uid.get(uid)
+        if qso is None:
+            return None
+        # Talletettu paikka pitää, ellei loki ole siirtynyt (poisto, latauksen
+        # vanhemmat QSO:t alkuun); silloin paikat lasketaan kerran uudelleen
+        index = self.entry_positions.get(uid)
+        if index is None or index >= len(self.log_entries) or self.log_entries[index] is not qso:
+            self.rebuild_entry_positions()
+            index = self.entry_positions.get(uid)
+            if index is None or self.log_entries[index] is not qso:
+                return None
+        return index
+    
+    def rebuild_entry_positions(self):
+        self.entry_positions = {qso.uid: index for index, qso in enumerate(self.log_entries)}
+    
+    def format_log_row(self, index):
+        """Lokinäkymän rivi ja tyyli lokin indeksille"""
+        qso_data = self.log_entries[index]
+        log_line = f"{qso_data.timestamp} | {self.settings['mycall']} > {qso_data.call} | RST: {qso_data.rst_sent}/{qso_data.rst_rcvd} | Band: {qso_data.band} | Mode: {qso_data.mode}"
         
         # Näytä WWFF-tunnus lokissa jos se on olemassa
-        if qso_data.get('their_wwff'):
-            log_line += f" | WWFF: {qso_data['their_wwff']}"
+        if qso_data.their_wwff:
+            log_line += f" | WWFF: {qso_data.their_wwff}"
         
-        if qso_data['comment']:
-            log_line += f" | Comment: {qso_data['comment']}"
+        if qso_data.comment:
+            log_line += f" | Comment: {qso_data.comment}"
         
         log_line += "\n"
         
+        # Rivin tagi qso<uid> yhdistää rivin QSO:hon järjestyksestä riippumatta
+        uid_tag = f"qso{qso_data.uid}"
+        
         # Käytä parannettua duplikaattitarkistusta
         if self.is_duplicate_contact(qso_data):
-            self.log_text.insert(tk.END, log_line, "duplicate")
-        else:
-            self.log_text.insert(tk.END, log_line, "normal")
+            return log_line, ("duplicate", uid_tag)
+        return log_line, ("normal", uid_tag)
+    
+    def log_changed(self, qso_data=None, parts=('log', 'stats', 'previous', 'header')):
+        """Merkitse näkymät päivitettäviksi; päivitys tehdään kerran kun Tk on jouten.
+
+        Peräkkäin kirjatut QSO:t (pileup) tuottavat yhden näkymäpäivityksen,
+        eikä jokainen Enter-painallus piirrä lokia, tilastoja ja otsikkoa erikseen.
+        """
+        self.pending_views.update(parts)
+        if qso_data is not None:
+            self.pending_previous = qso_data
+        if not self.view_update_scheduled:
+            self.view_update_scheduled = True
+            self.root.after_idle(self.flush_view_updates)
+    
+    @timed('flush_view_updates')
+    def flush_view_updates(self):
+        """Tee kertyneet näkymäpäivitykset kerralla"""
+        self.view_update_scheduled = False
+        views, self.pending_views = self.pending_views, set()
+        
+        if 'log' in views:
+            self.log_view.refresh(changed=True)
+        if 'stats' in views:
+            self.update_stats()
+        if 'previous' in views and self.pending_previous is not None:
+            self.update_previous_contact(self.pending_previous)
+            self.pending_previous = None
+        if 'header' in views:
+            self.update_header()
         
-        self.log_text.see(tk.END)
+        if self.input_started is not None:
+            # Enterin painalluksesta siihen, että QSO näkyy lokissa
+            if self.latency is not None:
+                self.latency.record('enter_to_display', time.perf_counter() - self.input_started,
+                                    len(self.log_entries))
+            self.input_started = None
     
+    @timed('update_previous_contact')
     def update_previous_contact(self, qso_data):
         """Päivitä edellinen yhteys saman aseman kanssa -info"""
-        base_call = qso_data['call'].split('/')[0]
-        same_station_qsos = []
+        base_call = base_callsign(qso_data['call'])
+        prev_qso = self.call_history.last_contact(qso_data)
         
-        for qso in self.log_entries:
-            if qso['call'].split('/')[0] == base_call and qso != qso_data:
-                same_station_qsos.append(qso)
-        
-        if same_station_qsos:
-            prev_qso = same_station_qsos[-1]
-            
-            prev_date = datetime.datetime.strptime(prev_qso['timestamp'], '%Y-%m-%d %H:%M:%S').strftime('%d.%m.%Y')
+        self.prev_contact_uid = prev_qso.uid if prev_qso is not None else None
+        if prev_qso is not None:
+            prev_timestamp = prev_qso.timestamp
+            prev_date = f"{prev_timestamp[8:10]}.{prev_timestamp[5:7]}.{prev_timestamp[:4]}"
             info_text = f"{self.texts['previous_with_station']}\n"
-            info_text += f"{prev_date} - {prev_qso['timestamp'].split(' ')[1][:5]}\n"
+            info_text += f"{prev_date} - {prev_timestamp[11:16]}\n"
             info_text += f"Band: {prev_qso['band']} | Mode: {prev_qso['mode']}\n"
             info_text += f"RST: {prev_qso['rst_sent']}/{prev_qso['rst_rcvd']}"
             
@@ -1711,15 +1876,30 @@ More info: https://github.com/oh3enk/hamlogger
         
         self.prev_contact_label.config(text=info_text)
     
+    def show_previous_contact(self):
+        """Vieritä lokinäkymä edelliseen yhteyteen saman aseman kanssa"""
+        if self.prev_contact_uid is None:
+            return
+        index = self.entry_index(self.prev_contact_uid)
+        if index is not None:
+            self.log_view.jump_to(index)
+    
+    @timed('update_stats')
     def update_stats(self):
         """Päivitä tilastot"""
-        total = len(self.log_entries)
-        
-        today = datetime.datetime.now(datetime.UTC).strftime('%Y-%m-%d')
-        today_count = sum(1 for qso in self.log_entries if qso['timestamp'].startswith(today))
+        today = utc_day_now()
+        self.stats_day = today
+        today_count = self.stats.day_count(today)
         
-        self.total_qso_label.config(text=f"{self.texts['total_qsos']} {total}")
+        self.total_qso_label.config(text=f"{self.texts['total_qsos']} {self.stats.total}")
         self.today_qso_label.config(text=f"{self.texts['today']} {today_count}")
+        self.update_band_mode_stats()
+    
+    def update_band_mode_stats(self):
+        """Näytä nykyisen bandin ja moden QSO-määrät"""
+        band_count = self.stats.per_band.get(self.current_band, 0)
+        mode_count = self.stats.per_mode.get(self.current_mode, 0)
+        self.band_mode_qso_label.config(text=f"{self.current_band}: {band_count} | {self.current_mode}: {mode_count}")
     
     def update_header(self):
         """Päivitä header-tiedot"""
@@ -1734,6 +1914,9 @@ More info: https://github.com/oh3enk/hamlogger
     
     def switch_log(self):
         """Vaihda lokia"""
+        if self.log_loading_busy():
+            return
+        
         if self.log_modified:
             response = messagebox.askyesnocancel(
                 self.texts['save_changes'], 
@@ -1748,6 +1931,10 @@ More info: https://github.com/oh3enk/hamlogger
     
     def new_log(self):
         """Luo uusi loki"""
+        if self.log_loading_busy():
+            return
+        
+        response = False
         if self.log_modified:
             response = messagebox.askyesnocancel(
                 self.texts['save_changes'],
@@ -1758,16 +1945,27 @@ More info: https://github.com/oh3enk/hamlogger
             elif response:
                 self.save_current_log()
         
+        # Taustatallennuksen takaisinkutsut vanhalle lokille ennen vaihtoa
+        self.finish_pending_writes()
+        if self.log_modified and response:
+            # Tallennus epäonnistui, loki jää auki
+            return
+        
         self.log_entries = []
+        self.rebuild_indexes()
         self.current_log_file = None
         self.log_modified = False
-        self.log_text.delete(1.0, tk.END)
-        self.update_stats()
-        self.prev_contact_label.config(text=self.texts['no_contacts'])
-        self.update_header()
+        if self.log_store is not None:
+            self.set_log_store(SQLiteLogStore(self.log_store_path(None)))
+            self.log_store.replace_all([])
+        self.start_journal(None)
+        self.display_log()
     
     def open_log_file(self):
         """Avaa lokitiedosto"""
+        if self.log_loading_busy():
+            return
+        
         filename = filedialog.askopenfilename(
             initialdir=self.settings['data_dir'],
             filetypes=[("ADI-tiedostot", "*.adi"), ("Text files", "*.txt"), ("Kaikki tiedostot", "*.*")],
@@ -1775,173 +1973,388 @@ More info: https://github.com/oh3enk/hamlogger
         )
         
         if filename:
-            try:
-                content = None
-                encodings = ['utf-8', 'latin-1', 'cp1252', 'iso-8859-1']
-                
-                for encoding in encodings:
-                    try:
-                        with open(filename, 'r', encoding=encoding) as f:
-                            content = f.read()
-                        print(f"Tiedosto luettu onnistuneesti enkoodauksella: {encoding}")
-                        break
-                    except UnicodeDecodeError:
-                        continue
-                
-                if content is None:
-                    messagebox.showerror(self.texts['file_open_error'], "Tiedoston enkoodausta ei tunnistettu. Kokeile muuntaa tiedosto UTF-8 -muotoon.")
-                    return
-                
-                success_count = self.parse_adi_content(content)
-                
-                if success_count > 0:
-                    self.current_log_file = filename
-                    self.log_modified = False
-                    self.update_header()
-                    messagebox.showinfo("Avattu", f"Loki ladattu! {success_count} QSO:ta tuotu.")
-                    
-                    self.update_stats()
-                    self.log_text.delete(1.0, tk.END)
-                    for qso in self.log_entries:
-                        self.add_to_log_display(qso)
-                    
-                    if self.log_entries:
-                        self.update_previous_contact(self.log_entries[-1])
-                else:
-                    messagebox.showwarning(self.texts['no_data'], self.texts['no_qso_data'])
-                
-            except Exception as e:
-                messagebox.showerror(self.texts['file_open_error'], f"Tiedoston avaus epäonnistui: {str(e)}")
+            self.start_log_load(filename)
     
-    def parse_adi_content(self, content):
-        """Jäsennä ADI-muotoinen sisältö"""
-        success_count = 0
-        self.log_entries = []
+    def start_log_load(self, filename):
+        """Avaa loki taustalla: uusimmat QSO:t näkyvät heti ja lokiin voi kirjata latauksen aikana.
+
+        Latauksen aikana kirjatut QSO:t jäävät ladattujen perään ja menevät
+        journaaliin tavallisina lisäyksinä. Jos lokin SQLite-varasto on
+        tuoreempi tai journaalissa on palautettavia muutoksia, loki luetaan
+        kerralla kuten ennenkin.
+        """
+        self.finish_pending_writes()
+        if self.needs_direct_load(filename):
+            self.load_log_file(filename)
+            return
         
-        header_end = content.find('<EOH>')
-        if header_end != -1:
-            content = content[header_end + 5:]
+        try:
+            loader = LogLoader(filename, self.adif_converter())
+        except OSError as e:
+            messagebox.showerror(self.texts['file_open_error'], f"Tiedoston avaus epäonnistui: {str(e)}")
+            return
         
-        tag_pattern = re.compile(r'<([A-Za-z_]+):(\d+)(?::[^>]*)?>([^<]*)', re.IGNORECASE)
+        self.log_entries = []
+        self.rebuild_indexes()
+        self.set_log_store(None)
+        self.current_log_file = filename
+        self.start_journal(filename)
+        self.log_modified = False
+        self.loaded_count = 0
+        self.display_log()
         
-        records = content.split('<EOR>')
+        self.log_loader = loader
+        self.show_load_progress()
+        loader.start()
+        self.root.after(50, self.poll_log_loader)
+    
+    def needs_direct_load(self, filename):
+        """Luetaanko loki kerralla (varasto tuoreempi tai journaali palautettavana)"""
+        if self.settings.get('sqlite_store'):
+            store_path = self.log_store_path(filename)
+            if os.path.exists(store_path):
+                store = SQLiteLogStore(store_path)
+                try:
+                    if store.is_newer_than(filename):
+                        return True
+                finally:
+                    store.close()
+        journal = QsoJournal(self.journal_path(filename))
+        return os.path.exists(journal.path) or os.path.exists(journal.rotated_path)
+    
+    def show_load_progress(self):
+        """Edistymispalkki ja peruutuspainike lokinäkymän yläpuolelle"""
+        self.load_frame = ttk.Frame(self.log_frame)
+        self.load_label = ttk.Label(self.load_frame, text=self.texts['loading_log'])
+        self.load_label.pack(side=tk.LEFT)
+        self.load_progress = ttk.Progressbar(self.load_frame, mode='determinate', maximum=100)
+        self.load_progress.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        ttk.Button(self.load_frame, text=self.texts['cancel'],
+                   command=self.cancel_log_load).pack(side=tk.RIGHT)
+        self.load_frame.pack(side=tk.TOP, fill=tk.X, before=self.log_text)
+    
+    def hide_load_progress(self):
+        if getattr(self, 'load_frame', None) is not None:
+            self.load_frame.destroy()
+            self.load_frame = None
+    
+    def poll_log_loader(self):
+        """Siirrä ladatut QSO:t lokiin Tk-säikeessä"""
+        loader = self.log_loader
+        if loader is None:
+            return
         
-        for record in records:
-            if not record.strip():
-                continue
-                
-            tags = {}
-            for match in tag_pattern.finditer(record):
-                tag_name = match.group(1).upper()
-                tag_value = match.group(3).strip()
-                tags[tag_name] = tag_value
+        # Rajoitettu työmäärä per kierros, jotta syöttörivi pysyy vasteellisena
+        deadline = time.perf_counter() + 0.03
+        changed = False
+        while time.perf_counter() < deadline:
+            try:
+                kind, payload, done = loader.messages.get_nowait()
+            except queue.Empty:
+                break
             
-            if 'CALL' in tags:
-                try:
-                    qso_date = None
-                    time_on = None
-                    
-                    # Tukee sekä QSO_DATE että DATE kenttää
-                    if 'QSO_DATE' in tags:
-                        qso_date = tags['QSO_DATE']
-                        qso_date = ''.join(c for c in qso_date if c.isdigit())
-                    elif 'DATE' in tags:
-                        qso_date = tags['DATE']
-                        qso_date = ''.join(c for c in qso_date if c.isdigit())
-                        
-                    if 'TIME_ON' in tags:
-                        time_on = tags['TIME_ON']
-                        time_on = ''.join(c for c in time_on if c.isdigit())
-                    
-                    if not time_on and 'TIME_OFF' in tags:
-                        time_on = tags['TIME_OFF']
-                        time_on = ''.join(c for c in time_on if c.isdigit())
-                    
-                    if not qso_date or not time_on:
-                        print(f"Puutteellinen aikatieto: {tags.get('CALL', 'UNKNOWN')}")
-                        continue
-                    
-                    if len(qso_date) != 8:
-                        print(f"Virheellinen QSO_DATE: {qso_date}")
-                        continue
-                    
-                    if len(time_on) == 4:
-                        time_on += '00'
-                    elif len(time_on) == 6:
-                        pass
-                    else:
-                        print(f"Virheellinen TIME_ON: {time_on}")
-                        continue
-                    
-                    datetime_str = f"{qso_date} {time_on}"
-                    timestamp = datetime.datetime.strptime(datetime_str, '%Y%m%d %H%M%S')
-                    
-                    band = tags.get('BAND', self.current_band).upper()
-                    if band.endswith('M') and band[:-1].isdigit():
-                        band = band[:-1] + 'm'
-                    elif band.endswith('CM') and band[:-2].isdigit():
-                        band = band[:-2] + 'cm'
-                    
-                    mode = tags.get('MODE', self.current_mode).upper()
-                    mode_map = {
-                        'SSB': 'SSB', 'LSB': 'LSB', 'USB': 'USB', 'CW': 'CW', 
-                        'FM': 'FM', 'AM': 'AM', 'FT8': 'FT8', 'FT4': 'FT4',
-                        'RTTY': 'RTTY', 'PSK': 'PSK', 'JT65': 'JT65', 'FREEDV': 'FreeDV'
-                    }
-                    mode = mode_map.get(mode, mode)
-                    
-                    rst_sent = tags.get('RST_SENT', self.settings['default_rst_sent'])
-                    rst_rcvd = tags.get('RST_RCVD', self.settings['default_rst_rcvd'])
-                    
-                    if not rst_sent or rst_sent == '0':
-                        rst_sent = self.settings['default_rst_sent']
-                    if not rst_rcvd or rst_rcvd == '0':
-                        rst_rcvd = self.settings['default_rst_rcvd']
-                    
-                    comment = tags.get('COMMENT', '')
-                    if not comment:
-                        comment = tags.get('QSLMSG', tags.get('REMARKS', tags.get('NOTES', '')))
-                    
-                    my_gridsquare = tags.get('MY_GRIDSQUARE', '')
-                    
-                    # Etsi vasta-aseman WWFF-tunnus (tukee sekä SIG_INFO että WWFF_REF)
-                    their_wwff = ""
-                    if 'SIG_INFO' in tags and tags.get('SIG') == 'WWFF':
-                        their_wwff = tags['SIG_INFO']
-                    elif 'WWFF_REF' in tags:
-                        their_wwff = tags['WWFF_REF']
-                    
-                    qso_data = {
-                        'timestamp': timestamp.strftime('%Y-%m-%d %H:%M:%S'),
-                        'call': tags['CALL'],
-                        'band': band,
-                        'mode': mode,
-                        'rst_sent': rst_sent,
-                        'rst_rcvd': rst_rcvd,
-                        'comment': comment,
-                        'my_gridsquare': my_gridsquare,
-                        'their_wwff': their_wwff
-                    }
-                    
-                    self.log_entries.append(qso_data)
-                    success_count += 1
-                    
-                except Exception as e:
-                    print(f"Virhe QSO:n jäsentämisessä: {e}")
-                    print(f"Tags: {tags}")
-                    continue
+            if kind == 'done':
+                self.finish_log_load()
+                return
+            if kind == 'error':
+                self.abandon_log_load()
+                messagebox.showerror(self.texts['file_open_error'], f"Tiedoston avaus epäonnistui: {str(payload)}")
+                return
+            
+            if kind == 'restart':
+                # Ladatut osat pois, latauksen aikana kirjatut jäävät
+                self.log_entries = self.log_entries[self.loaded_count:]
+                self.loaded_count = 0
+                self.rebuild_indexes()
+            elif kind == 'prepend':
+                self.log_entries[0:0] = payload
+            else:
+                self.log_entries[self.loaded_count:self.loaded_count] = payload
+            
+            if payload:
+                for qso in payload:
+                    self.index_qso(qso)
+                self.loaded_count += len(payload)
+            if loader.total:
+                self.load_progress['value'] = done * 100 / loader.total
+            changed = True
+        
+        if changed:
+            self.log_changed(parts=('log', 'stats'))
+        self.root.after(50, self.poll_log_loader)
+    
+    def finish_log_load(self):
+        """Lataus valmis: varasto, asetukset ja näkymä"""
+        self.log_loader = None
+        self.hide_load_progress()
+        if not self.loaded_count:
+            self.abandon_log_load()
+            messagebox.showwarning(self.texts['no_data'], self.texts['no_qso_data'])
+            return
         
-        return success_count
+        live_count = len(self.log_entries) - self.loaded_count
+        if self.settings.get('sqlite_store'):
+            store = SQLiteLogStore(self.log_store_path(self.current_log_file))
+            store.replace_all(self.log_entries)
+            if live_count:
+                store.mark_synced(False)
+            self.set_log_store(store)
+            # Varasto sisältää nyt myös latauksen aikana kirjatut QSO:t
+            if self.journal is not None:
+                self.journal.clear()
+            self.set_journal(None)
+        
+        self.log_modified = live_count > 0
+        self.settings['last_log_file'] = self.current_log_file
+        self.save_settings()
+        
+        self.update_header()
+        self.update_stats()
+        self.refresh_log_display()
+        self.update_previous_contact(self.log_entries[-1])
+        print(f"Loki ladattu taustalla: {self.loaded_count} QSO:ta")
     
-    def save_current_log(self):
-        """Tallenna nykyinen loki"""
+    def cancel_log_load(self):
+        """Peruuta lataus: latauksen aikana kirjatut QSO:t jäävät uuteen lokiin"""
+        if self.log_loader is not None:
+            self.abandon_log_load()
+    
+    def abandon_log_load(self):
+        """Hylkää osittain ladattu loki ja jatka tallentamattomalla lokilla"""
+        if self.log_loader is not None:
+            self.log_loader.cancel()
+            self.log_loader = None
+        self.hide_load_progress()
+        
+        live = self.log_entries[self.loaded_count:]
+        if self.journal is not None:
+            self.journal.clear()
+        self.log_entries = live
+        self.loaded_count = 0
+        self.rebuild_indexes()
+        self.current_log_file = None
+        
+        if self.settings.get('sqlite_store'):
+            self.set_log_store(SQLiteLogStore(self.log_store_path(None)))
+            self.log_store.replace_all(live)
+            if live:
+                self.log_store.mark_synced(False)
+        self.start_journal(None)
+        if self.journal is not None:
+            for qso in live:
+                self.journal.append('add', qso=qso)
+        self.log_modified = bool(live)
+        self.display_log()
+    
+    def log_loading_busy(self):
+        """Estä toiminnot, jotka tarvitsevat koko lokin, latauksen ajaksi"""
+        if self.log_loader is None:
+            return False
+        messagebox.showinfo(self.texts['loading_log'], self.texts['loading_busy'])
+        return True
+    
+    def read_log_entries(self, filename):
+        """Lue lokin QSO:t ADI-tiedostosta tai sen tuoreemmasta SQLite-varastosta"""
+        store = None
+        if self.settings.get('sqlite_store'):
+            store = SQLiteLogStore(self.log_store_path(filename))
+        
+        self.recovered_changes = 0
+        self.set_journal(None)
+        if store is not None and store.is_newer_than(filename):
+            self.log_entries = store.load()
+            self.rebuild_indexes()
+            print(f"Loki luettu SQLite-varastosta: {store.path}")
+        else:
+            with open_log_stream(filename) as stream:
+                self.parse_adi_content(stream)
+            print(f"Tiedosto luettu onnistuneesti enkoodauksella: {stream.encoding}")
+            
+            # Kaatumista edeltäneet muutokset journaalista
+            if store is None and self.settings.get('qso_journal', True):
+                journal = QsoJournal(self.journal_path(filename))
+                self.recovered_changes = journal.replay(self.log_entries)
+                if self.recovered_changes:
+                    print(f"Journaalista palautettu {self.recovered_changes} muutosta")
+                    self.rebuild_indexes()
+                self.warn_journal_replay(journal)
+                self.set_journal(journal)
+            
+            if store is not None and self.log_entries:
+                store.replace_all(self.log_entries)
+        
+        if store is not None:
+            if self.log_entries:
+                self.set_log_store(store)
+            else:
+                store.close()
+        return len(self.log_entries)
+    
+    def log_store_path(self, filename):
+        """SQLite-varaston polku lokitiedoston vieressä"""
+        if filename:
+            return os.path.splitext(filename)[0] + '.sqlite'
+        return os.path.join(self.settings['data_dir'], 'unsaved_log.sqlite')
+    
+    def set_log_store(self, store):
+        """Vaihda käytössä oleva SQLite-varasto"""
+        if self.log_store is not None and self.log_store is not store:
+            self.log_store.close()
+        self.log_store = store
+    
+    def log_store_synced(self):
+        return self.log_store is None or self.log_store.synced
+    
+    def journal_path(self, filename):
+        """Journaalitiedoston polku lokitiedoston vieressä"""
+        if filename:
+            return filename + '.journal'
+        return os.path.join(self.settings['backup_dir'], 'unsaved_log.journal')
+    
+    def set_journal(self, journal):
+        """Vaihda käytössä oleva journaali"""
+        if self.journal is not None and self.journal is not journal:
+            self.journal.close()
+        self.journal = journal
+    
+    def warn_journal_replay(self, journal):
+        """Ilmoita, jos journaalin toisto pysähtyi puuttuvaan kohteeseen"""
+        if journal.replay_error:
+            messagebox.showwarning(
+                "Journaali",
+                f"Kaikkia tallentamattomia muutoksia ei voitu palauttaa:\n{journal.replay_error}\n"
+                f"Tarkista loki ennen tallentamista."
+            )
+    
+    def record_unsaved_changes(self):
+        """Kirjaa uuteen journaaliin ero viimeksi tallennettuun lokiin (varasto poistui käytöstä)"""
+        saved = []
+        if self.current_log_file and os.path.exists(self.current_log_file):
+            with open_log_stream(self.current_log_file) as stream:
+                saved = list(self.iter_adi_qsos(stream))
+        count = self.journal.record_changes(saved, self.log_entries)
+        print(f"Journaaliin kirjattu {count} tallentamatonta muutosta")
+    
+    def start_journal(self, filename):
+        """Aloita tyhjä journaali tallennetun tai uuden lokin päälle"""
+        if self.log_store is not None or not self.settings.get('qso_journal', True):
+            # SQLite-varasto kirjoittaa jo jokaisen QSO:n levylle
+            self.set_journal(None)
+            return
+        journal = QsoJournal(self.journal_path(filename))
+        journal.clear()
+        self.set_journal(journal)
+    
+    def recover_unsaved_journal(self):
+        """Palauta tallentamattoman lokin QSO:t edellisestä istunnosta"""
+        if self.log_store is not None or not self.settings.get('qso_journal', True):
+            return
+        
+        try:
+            journal = QsoJournal(self.journal_path(None))
+            if not self.log_entries:
+                self.recovered_changes = journal.replay(self.log_entries)
+                if self.recovered_changes:
+                    print(f"Journaalista palautettu {self.recovered_changes} muutosta")
+                    self.rebuild_indexes()
+                    self.log_modified = True
+                    self.display_log()
+                self.warn_journal_replay(journal)
+            self.set_journal(journal)
+        except Exception as e:
+            print(f"Journaalin palautus epäonnistui: {e}")
+    
+    def configure_log_store(self):
+        """Ota SQLite-varasto käyttöön tai pois asetuksen mukaan"""
+        if self.log_loader is not None:
+            # Varasto luodaan kun lataus valmistuu
+            return
+        if not self.settings.get('sqlite_store'):
+            if self.log_store is not None:
+                self.set_log_store(None)
+                # Journaali ottaa taas muutokset talteen; tallentamattomat
+                # muutokset olivat vain varastossa, joten ne kirjataan heti
+                self.start_journal(self.current_log_file)
+                if self.log_modified and self.journal is not None:
+                    try:
+                        self.record_unsaved_changes()
+                    except Exception as e:
+                        messagebox.showwarning(
+                            "Journaali",
+                            f"Tallentamattomia muutoksia ei voitu kirjata journaaliin: {e}\n"
+                            f"Tallenna loki."
+                        )
+            return
+        if self.log_store is not None:
+            return
+        
+        # Taustatallennus voi vielä palauttaa sivuun siirretyn journaalin
+        self.finish_pending_writes()
+        try:
+            store = SQLiteLogStore(self.log_store_path(self.current_log_file))
+            if not self.current_log_file and not self.log_entries and store.count():
+                # Edellisen istunnon tallentamaton loki
+                self.log_entries = store.load()
+                self.rebuild_indexes()
+                self.log_modified = not store.synced
+                self.display_log()
+            else:
+                store.replace_all(self.log_entries)
+                if self.log_modified:
+                    store.mark_synced(False)
+            self.set_log_store(store)
+            if self.journal is not None:
+                # Journaalin muutokset ovat nyt varastossa, vanha journaali ei saa jäädä levylle
+                self.journal.clear()
+            self.set_journal(None)
+        except Exception as e:
+            print(f"SQLite-varaston avaus epäonnistui: {e}")
+    
+    @timed('parse_adi_content')
+    def parse_adi_content(self, content):
+        """Jäsennä ADI-muotoinen sisältö (merkkijono tai tiedosto-olio)"""
+        if isinstance(content, str):
+            content = io.StringIO(content)
+        
+        self.log_entries = list(self.iter_adi_qsos(content))
+        self.rebuild_indexes()
+        return len(self.log_entries)
+    
+    def iter_adi_qsos(self, stream):
+        """Jäsennä ADI-tietueet tiedosto-oliosta QSO-tietueiksi yksi kerrallaan"""
+        convert = self.adif_converter()
+        for tags in iter_adif_records(stream):
+            qso_data = convert(tags)
+            if qso_data is not None:
+                yield qso_data
+    
+    def adif_converter(self):
+        """ADI-kentät -> QSO nykyisillä oletusarvoilla (käy myös taustasäikeelle)"""
+        return functools.partial(qso_from_adif_tags,
+                                 default_band=self.current_band, default_mode=self.current_mode,
+                                 default_rst_sent=self.settings['default_rst_sent'],
+                                 default_rst_rcvd=self.settings['default_rst_rcvd'])
+    
+    def qso_from_adif_tags(self, tags):
+        """Muunna yhden ADI-tietueen kentät QSO-tietueeksi (None jos virheellinen)"""
+        return qso_from_adif_tags(tags, self.current_band, self.current_mode,
+                                  self.settings['default_rst_sent'], self.settings['default_rst_rcvd'])
+    
+    def save_current_log(self, quiet=False):
+        """Tallenna nykyinen loki (quiet: ei ilmoitusta onnistumisesta)"""
+        if self.log_loading_busy():
+            return
+        
         if not self.current_log_file:
-            self.save_log_as()
+            self.save_log_as(quiet)
         else:
-            self.save_to_file(self.current_log_file)
+            self.save_log(self.current_log_file, quiet)
     
-    def save_log_as(self):
+    def save_log_as(self, quiet=False):
         """Tallenna loki nimellä"""
+        if self.log_loading_busy():
+            return
+        
         if self.settings['mywwff']:
             default_name = f"{self.settings['mycall'].replace('/', '_')}@{self.settings['mywwff']}.adi"
         elif self.settings['mylocator']:
@@ -1957,69 +2370,144 @@ More info: https://github.com/oh3enk/hamlogger
         )
         
         if filename:
-            self.save_to_file(filename)
+            self.save_log(filename, quiet)
+    
+    def save_log(self, filename, quiet=False):
+        """Tallenna koko loki taustalla.
+
+        Journaali siirretään sivuun ennen kirjoitusta ja poistetaan vasta kun
+        ADI on levyllä; tallennuksen aikana lisätyt QSO:t menevät uuteen
+        journaaliin. Epäonnistunut tallennus palauttaa edellisen tilan.
+        Virheestä ilmoitetaan aina, onnistumisesta vain kun quiet on epätosi.
+        """
+        if self.log_saving:
+            # Yksi lokin tallennus kerrallaan
+            self.finish_pending_writes()
+        
+        previous_file = self.current_log_file
+        previous_journal = self.journal
+        generation = self.log_generation
+        rotated = previous_journal.rotate() if previous_journal is not None else None
+        
+        if filename != previous_file:
+            if self.log_store is not None:
+                # Varasto siirtyy uuden tiedostonimen viereen
+                store = SQLiteLogStore(self.log_store_path(filename))
+                store.replace_all(self.log_entries)
+                self.set_log_store(store)
+            self.start_journal(filename)
             self.current_log_file = filename
-            self.log_modified = False
             self.update_header()
+        
+        def remove_rotated():
+            if rotated is not None and os.path.exists(rotated):
+                os.remove(rotated)
+        
+        def saved(filename, error):
+            self.log_saving = False
+            if error is not None:
+                self.log_save_failed(filename, error, previous_file, previous_journal, rotated)
+                return
+            
+            if previous_file is None and self.log_store is not None:
+                # Tallentamattoman lokin varasto on nyt tiedostossa
+                unsaved_store = SQLiteLogStore(self.log_store_path(None))
+                unsaved_store.replace_all([])
+                unsaved_store.close()
+            if generation == self.log_generation:
+                self.log_modified = False
+                if self.log_store is not None:
+                    self.log_store.mark_synced()
+            self.update_header()
+            if not quiet:
+                messagebox.showinfo("Tallennettu", f"Loki tallennettu: {filename}")
+        
+        self.log_saving = True
+        self.write_adi_async(filename, self.log_entries, saved, after_write=remove_rotated)
     
-    def save_to_file(self, filename):
-        """Tallenna ADI-muotoiseen tiedostoon"""
+    def log_save_failed(self, filename, error, previous_file, previous_journal, rotated):
+        """Palauta tila epäonnistuneen tallennuksen jälkeen"""
         try:
-            adi_content = self.generate_adi()
-            with open(filename, 'w', encoding='utf-8') as f:
-                f.write(adi_content)
-            messagebox.showinfo("Tallennettu", f"Loki tallennettu: {filename}")
+            if previous_journal is not None:
+                previous_journal.restore(rotated, newer=self.journal)
+                self.set_journal(previous_journal)
+            if self.current_log_file != previous_file:
+                if self.log_store is not None:
+                    store = SQLiteLogStore(self.log_store_path(previous_file))
+                    store.replace_all(self.log_entries)
+                    self.set_log_store(store)
+                self.current_log_file = previous_file
+            if self.log_store is not None:
+                self.log_store.mark_synced(False)
         except Exception as e:
-            messagebox.showerror(self.texts['file_save_error'], f"Tallennus epäonnistui: {str(e)}")
-    
-    def generate_adi(self):
-        """Luo ADI-muotoinen sisältö"""
-        adi_content = []
-        
-        adi_content.append("<ADIF_VER:5>3.1.0")
-        adi_content.append("<CREATED_TIMESTAMP:15>%s" % datetime.datetime.now(datetime.UTC).strftime('%Y%m%d %H%M%S'))
-        adi_content.append("<PROGRAMID:7>HamLogger")
-        adi_content.append("<PROGRAMVERSION:5>1.0.0")
-        adi_content.append("<EOH>")
+            print(f"Journaalin palautus epäonnistui: {e}")
         
-        for qso in self.log_entries:
-            qso_date = datetime.datetime.strptime(qso['timestamp'], '%Y-%m-%d %H:%M:%S')
-            
-            record = []
-            record.append(f"<STATION_CALLSIGN:{len(self.settings['mycall'])}>{self.settings['mycall']}")
-            record.append(f"<CALL:{len(qso['call'])}>{qso['call']}")
-            record.append(f"<QSO_DATE:8>{qso_date.strftime('%Y%m%d')}")
-            record.append(f"<TIME_ON:6>{qso_date.strftime('%H%M%S')}")
-            record.append(f"<BAND:{len(qso['band'])}>{qso['band']}")
-            record.append(f"<MODE:{len(qso['mode'])}>{qso['mode']}")
-            record.append(f"<RST_SENT:{len(qso['rst_sent'])}>{qso['rst_sent']}")
-            record.append(f"<RST_RCVD:{len(qso['rst_rcvd'])}>{qso['rst_rcvd']}")
-            
-            # Oma WWFF (MY_SIG_INFO)
-            if self.settings['mywwff']:
-                record.append(f"<MY_SIG:4>WWFF")
-                record.append(f"<MY_SIG_INFO:{len(self.settings['mywwff'])}>{self.settings['mywwff']}")
-            
-            # Vasta-aseman WWFF (SIG ja SIG_INFO)
-            if qso.get('their_wwff'):
-                record.append(f"<SIG:4>WWFF")
-                record.append(f"<SIG_INFO:{len(qso['their_wwff'])}>{qso['their_wwff']}")
-            
-            if qso.get('my_gridsquare'):
-                record.append(f"<MY_GRIDSQUARE:{len(qso['my_gridsquare'])}>{qso['my_gridsquare']}")
-            
-            if qso.get('comment') and qso['comment']:
-                record.append(f"<COMMENT:{len(qso['comment'])}>{qso['comment']}")
-            
-            record.append(f"<OPERATOR:{len(self.settings['mycall'])}>{self.settings['mycall']}")
-            
-            adi_content.extend(record)
-            adi_content.append("<EOR>")
+        self.log_modified = True
+        self.update_header()
+        messagebox.showerror(self.texts['file_save_error'], f"Tallennus epäonnistui: {str(error)}")
+    
+    def save_to_file(self, filename, entries=None, message=None):
+        """Tallenna ADI-muotoiseen tiedostoon taustalla"""
+        if entries is None:
+            entries = self.log_entries
+        if message is None:
+            message = f"Loki tallennettu: {filename}"
+        
+        def saved(filename, error):
+            if error is not None:
+                messagebox.showerror(self.texts['file_save_error'], f"Tallennus epäonnistui: {str(error)}")
+            else:
+                messagebox.showinfo("Tallennettu", message)
         
-        return "\n".join(adi_content)
+        self.write_adi_async(filename, entries, saved)
+    
+    def write_adi_async(self, filename, entries, on_done, after_write=None):
+        """Muodosta ja kirjoita ADI taustasäikeessä, on_done(filename, error) Tk-säikeessä"""
+        render = functools.partial(render_adi, mycall=self.settings['mycall'],
+                                   mywwff=self.settings['mywwff'])
+        if self.latency is not None:
+            render = self.latency.wrap('generate_adi', render, len(entries))
+        self.submit_write(filename, render, entries, on_done, after_write)
+    
+    def submit_write(self, filename, render, entries, on_done, after_write=None):
+        """Jätä kirjoitus taustasäikeelle; render(entries) palauttaa sisällön tai sen palat"""
+        self.adi_writer.submit(filename, render, entries, on_done, after_write)
+        if not self.writer_polling:
+            self.writer_polling = True
+            self.root.after(100, self.poll_adi_writer)
+    
+    def poll_adi_writer(self):
+        """Tarkista taustakirjoitukset Tk-silmukasta"""
+        self.handle_finished_writes()
+        if self.adi_writer.pending:
+            self.root.after(100, self.poll_adi_writer)
+        else:
+            self.writer_polling = False
     
+    def finish_pending_writes(self):
+        """Odota taustakirjoitukset loppuun (esim. ennen sulkemista)"""
+        self.adi_writer.wait()
+        self.handle_finished_writes()
+    
+    def handle_finished_writes(self):
+        """Aja valmistuneiden kirjoitusten takaisinkutsut"""
+        for on_done, filename, error in self.adi_writer.poll():
+            try:
+                on_done(filename, error)
+            except Exception as e:
+                print(f"Tallennuksen käsittely epäonnistui: {e}")
+    
+    @timed('generate_adi')
+    def generate_adi(self, entries=None):
+        """Luo ADI-muotoinen sisältö (oletuksena koko lokista)"""
+        if entries is None:
+            entries = self.log_entries
+        return render_adi(entries, self.settings['mycall'], self.settings['mywwff'])
     def save_adi_dialog(self):
         """Tallenna ADI-tiedosto"""
+        if self.log_loading_busy():
+            return
+        
         if not self.log_entries:
             messagebox.showwarning(self.texts['no_data'], "Ei tallennettavia QSO:ita")
             return
@@ -2039,16 +2527,13 @@ More info: https://github.com/oh3enk/hamlogger
         )
         
         if filename:
-            try:
-                adi_content = self.generate_adi()
-                with open(filename, 'w', encoding='utf-8') as f:
-                    f.write(adi_content)
-                messagebox.showinfo("Tallennettu", f"ADI-tiedosto tallennettu: {filename}")
-            except Exception as e:
-                messagebox.showerror(self.texts['file_save_error'], f"Tallennus epäonnistui: {str(e)}")
+            self.save_to_file(filename, message=f"ADI-tiedosto tallennettu: {filename}")
     
     def export_partial_log(self):
         """Vie osa lokista uudeksi lokiksi"""
+        if self.log_loading_busy():
+            return
+        
         if not self.log_entries:
             messagebox.showwarning(self.texts['no_data'], "Ei vientiin kelpaavaa QSO-dataa")
             return
@@ -2081,11 +2566,10 @@ More info: https://github.com/oh3enk/hamlogger
                 end_date = datetime.datetime.strptime(end_date_str, '%d.%m.%Y')
                 end_date = end_date + datetime.timedelta(days=1)
                 
-                filtered_qsos = []
-                for qso in self.log_entries:
-                    qso_date = datetime.datetime.strptime(qso['timestamp'], '%Y-%m-%d %H:%M:%S')
-                    if start_date <= qso_date < end_date:
-                        filtered_qsos.append(qso)
+                # Vertaillaan suoraan epoch-sekunteina (päivämäärät UTC:nä)
+                start_epoch = date_epoch(start_date)
+                end_epoch = date_epoch(end_date)
+                filtered_qsos = entries_between(self.log_entries, start_epoch, end_epoch)
                 
                 if not filtered_qsos:
                     messagebox.showwarning(self.texts['no_data'], f"Valitulla aikavälillä ({start_date_str} - {end_date_str}) ei löytynyt QSO:ita")
@@ -2106,17 +2590,13 @@ More info: https://github.com/oh3enk/hamlogger
                 )
                 
                 if filename:
-                    original_entries = self.log_entries
-                    self.log_entries = filtered_qsos
-                    
-                    try:
-                        adi_content = self.generate_adi()
-                        with open(filename, 'w', encoding='utf-8') as f:
-                            f.write(adi_content)
-                        messagebox.showinfo(self.texts['export_complete'], f"Lokin osa tallennettu: {filename}\n{len(filtered_qsos)} QSO:ta")
-                    finally:
-                        self.log_entries = original_entries
+                    def exported(filename, error):
+                        if error is not None:
+                            messagebox.showerror("Viennin virhe", f"Vienti epäonnistui: {str(error)}")
+                        else:
+                            messagebox.showinfo(self.texts['export_complete'], f"Lokin osa tallennettu: {filename}\n{len(filtered_qsos)} QSO:ta")
                     
+                    self.write_adi_async(filename, filtered_qsos, exported)
                     export_window.destroy()
                 
             except ValueError as e:
@@ -2127,92 +2607,70 @@ More info: https://github.com/oh3enk/hamlogger
         ttk.Button(export_window, text="Vie valittu osa", command=perform_export).pack(pady=10)
     
     def merge_logs(self):
-        """Yhdistä kaksi lokia yhdeksi"""
-        messagebox.showinfo(self.texts['select_logs_to_merge'], self.texts['select_first_log'])
-        file1 = filedialog.askopenfilename(
-            title=self.texts['select_first_log'],
+        """Yhdistä valitut lokit yhdeksi aikajärjestetyksi lokiksi"""
+        sources = filedialog.askopenfilenames(
+            title=self.texts['select_logs_to_merge'],
             filetypes=[("ADI files", "*.adi"), ("All files", "*.*")],
             initialdir=self.settings['data_dir']
         )
         
-        if not file1:
+        if not sources:
             return
         
-        messagebox.showinfo(self.texts['select_logs_to_merge'], self.texts['select_second_log'])
-        file2 = filedialog.askopenfilename(
-            title=self.texts['select_second_log'],
+        # Tallenna yhdistetty loki
+        default_filename = f"{self.settings['mycall']}_merged_{datetime.datetime.now(datetime.UTC).strftime('%Y%m%d_%H%M')}.adi"
+        filename = filedialog.asksaveasfilename(
+            title="Tallenna yhdistetty loki",
+            defaultextension=".adi",
             filetypes=[("ADI files", "*.adi"), ("All files", "*.*")],
-            initialdir=self.settings['data_dir']
+            initialdir=self.settings['data_dir'],
+            initialfile=default_filename,
+            confirmoverwrite=True
         )
         
-        if not file2:
+        if not filename:
             return
         
-        try:
-            # Lataa molemmat lokit
-            merged_entries = []
-            
-            for filename in [file1, file2]:
-                with open(filename, 'r', encoding='utf-8', errors='ignore') as f:
-                    content = f.read()
-                
-                # Parsitaan ADI-data käyttäen olemassa olevaa parse_adi_content -metodia
-                # Tämä on luotettavampi tapa kuin regex
-                original_entries = self.log_entries.copy()
-                self.log_entries = []
-                
-                success_count = self.parse_adi_content(content)
-                
-                if success_count > 0:
-                    merged_entries.extend(self.log_entries)
-                
-                # Palauta alkuperäinen loki
-                self.log_entries = original_entries
-            
-            if not merged_entries:
-                messagebox.showwarning(self.texts['no_data'], "Yhdistetyistä tiedostoista ei löytynyt QSO:ita")
-                return
-            
-            # Poista duplikaatit (sama asema, sama päivämäärä ja aika)
-            unique_entries = []
-            seen = set()
-            
-            for qso in merged_entries:
-                # Käytä timestampia ja callsignia duplikaattitarkistukseen
-                key = (qso['call'], qso['timestamp'])
-                if key not in seen:
-                    seen.add(key)
-                    unique_entries.append(qso)
-            
-            # JÄRJESTÄ AIKAJÄRJESTYKSEEN
-            unique_entries.sort(key=lambda x: x['timestamp'])
-            
-            # Tallenna yhdistetty loki
-            default_filename = f"{self.settings['mycall']}_merged_{datetime.datetime.now(datetime.UTC).strftime('%Y%m%d_%H%M')}.adi"
-            filename = filedialog.asksaveasfilename(
-                title="Tallenna yhdistetty loki",
-                defaultextension=".adi",
-                filetypes=[("ADI files", "*.adi"), ("All files", "*.*")],
-                initialdir=self.settings['data_dir'],
-                initialfile=default_filename,
-                confirmoverwrite=True
-            )
-            
-            if filename:
-                # Käytä olemassa olevaa tallennusfunktiota
-                original_entries = self.log_entries
-                self.log_entries = unique_entries
-                self.save_to_file(filename)
-                self.log_entries = original_entries
-                
+        convert = self.adif_converter()
+        mycall, mywwff = self.settings['mycall'], self.settings['mywwff']
+        tolerance = self.merge_tolerance()
+        exact_call = self.settings.get('merge_exact_call', False)
+        totals = {}
+        
+        def render(entries):
+            # Ajetaan kirjoitussäikeessä: lokit luetaan virtana, järjestetään
+            # rajatun kokoisina ajoina ja lomitetaan suoraan tiedostoon
+            with tempfile.TemporaryDirectory(prefix='ohhamlog_merge_') as run_dir:
+                runs = SortedRuns(run_dir)
+                for source in sources:
+                    # Tietueet luetaan suoraan tiedostosta, nykyiseen lokiin ei kosketa
+                    with open_log_stream(source) as stream:
+                        runs.add_all(filter(None, map(convert, iter_adif_records(stream))))
+                if not len(runs):
+                    raise ValueError("Yhdistetyistä tiedostoista ei löytynyt QSO:ita")
+                # Ensin täsmälleen sama kutsu ja aika, sitten sama yhteys aikaikkunan sisällä
+                near = NearDuplicateFilter(tolerance, exact_call)
+                unique = Counted(near.filter(unique_in_time_order(runs)))
+                yield from iter_adi_chunks(unique, mycall, mywwff)
+                totals.update(files=len(sources), qsos=len(runs), unique=unique.count, merged=near.merged)
+        
+        def merged(filename, error):
+            if error is not None:
+                messagebox.showerror(self.texts['merge_error'], f"Yhdistäminen epäonnistui: {str(error)}")
+            else:
                 messagebox.showinfo(self.texts['merge_complete'], 
-                                  f"Yhdistäminen valmis: {len(unique_entries)} uniikkia QSO:ta")
+                                  f"Yhdistäminen valmis: {totals['files']} tiedostoa, {totals['qsos']} QSO:ta, "
+                                  f"{totals['unique']} uniikkia QSO:ta"
+                                  f"{self.near_duplicate_report(totals['merged'])}")
         
-        except Exception as e:
-            messagebox.showerror(self.texts['merge_error'], f"Yhdistäminen epäonnistui: {str(e)}")
+        self.submit_write(filename, render, [], merged)
     
     def save_and_exit(self):
         """Tallenna ja sulje"""
+        if self.log_loader is not None:
+            # Kesken jäänyt lataus pois, latauksen aikana kirjatut QSO:t säilyvät
+            self.abandon_log_load()
+        
         if self.log_modified:
             response = messagebox.askyesnocancel(
                 self.texts['save_changes'],
@@ -2221,8 +2679,14 @@ More info: https://github.com/oh3enk/hamlogger
             if response is None:
                 return
             elif response:
-                self.save_current_log()
-        
+                # Sulkemisen yhteydessä ei onnistumisilmoitusta
+                self.save_current_log(quiet=True)
+            elif self.journal is not None:
+                # Käyttäjä hylkäsi muutokset, älä palauta niitä seuraavalla kerralla
+                self.journal.clear()
+        
+        # Keskeneräiset tallennukset ja backupit loppuun ennen sulkemista
+        self.finish_pending_writes()
         self.root.quit()
     
     def quit_application(self):
@@ -2319,6 +2783,27 @@ More info: https://github.com/oh3enk/hamlogger
                     data_dir_var.set(directory)
             
             ttk.Button(other_frame, text="Selaa...", command=browse_data_dir).grid(row=2, column=2, padx=5)
+            
+            # SQLite-varasto
+            ttk.Label(other_frame, text="SQLite-tietokanta:").grid(row=3, column=0, sticky=tk.W, pady=5)
+            sqlite_store_var = tk.BooleanVar(value=self.settings.get('sqlite_store', False))
+            ttk.Checkbutton(other_frame, variable=sqlite_store_var).grid(row=3, column=1, sticky=tk.W, pady=5)
+            
+            # Viivemittaus
+            ttk.Label(other_frame, text="Viivemittaus:").grid(row=4, column=0, sticky=tk.W, pady=5)
+            latency_stats_var = tk.BooleanVar(value=self.settings.get('latency_stats', False))
+            ttk.Checkbutton(other_frame, variable=latency_stats_var).grid(row=4, column=1, sticky=tk.W, pady=5)
+            
+            # Kaksoiskappaleiden aikaikkuna yhdistettäessä ja tuotaessa
+            ttk.Label(other_frame, text="Dupe-ikkuna (min):").grid(row=5, column=0, sticky=tk.W, pady=5)
+            merge_tolerance_var = tk.StringVar(value=str(self.settings.get('merge_tolerance_minutes',
+                                                                           MERGE_TOLERANCE_MINUTES)))
+            ttk.Spinbox(other_frame, from_=0, to=60, textvariable=merge_tolerance_var,
+                        width=5).grid(row=5, column=1, sticky=tk.W, pady=5)
+            
+            ttk.Label(other_frame, text="Dupe: koko kutsu:").grid(row=6, column=0, sticky=tk.W, pady=5)
+            merge_exact_call_var = tk.BooleanVar(value=self.settings.get('merge_exact_call', False))
+            ttk.Checkbutton(other_frame, variable=merge_exact_call_var).grid(row=6, column=1, sticky=tk.W, pady=5)
         
         def save_settings():
             """Tallenna asetukset"""
@@ -2341,6 +2826,15 @@ More info: https://github.com/oh3enk/hamlogger
                 self.settings['language'] = new_language
                 self.settings['theme'] = new_theme
                 self.settings['data_dir'] = data_dir_var.get()
+                self.settings['sqlite_store'] = sqlite_store_var.get()
+                self.configure_log_store()
+                self.settings['latency_stats'] = latency_stats_var.get()
+                self.configure_latency()
+                try:
+                    self.settings['merge_tolerance_minutes'] = max(0, int(merge_tolerance_var.get()))
+                except ValueError:
+                    pass
+                self.settings['merge_exact_call'] = merge_exact_call_var.get()
                 
                 self.language = new_language
                 self.update_language()
@@ -2358,49 +2852,57 @@ More info: https://github.com/oh3enk/hamlogger
         ttk.Button(button_frame, text="Tallenna", command=save_settings).pack(side=tk.RIGHT, padx=5)
         ttk.Button(button_frame, text="Peruuta", command=settings_window.destroy).pack(side=tk.RIGHT)
     
+    def qso_uid_at(self, event):
+        """Klikatun rivin QSO-tunniste rivin qso<uid>-tagista, None jos ei riviä"""
+        index = self.log_text.index(f"@{event.x},{event.y}")
+        for tag in self.log_text.tag_names(index):
+            if tag.startswith('qso'):
+                return int(tag[3:])
+        return None
+    
     def show_log_context_menu(self, event):
         """Näytä kontekstivalikko oikealla hiiren painikkeella"""
-        # Etsi klikattu rivi
-        index = self.log_text.index(f"@{event.x},{event.y}")
-        line_num = int(index.split('.')[0])
-        
-        # Tarkista että rivi on datarivi (ei tyhjä)
-        line_content = self.log_text.get(f"{line_num}.0", f"{line_num}.end")
-        if not line_content.strip():
-            return
-        
-        # Laske log_entries indeksi (rivit ovat käänteisessä järjestyksessä)
-        entry_index = len(self.log_entries) - line_num
-        if entry_index < 0 or entry_index >= len(self.log_entries):
-            return
+        # Etsi klikatun rivin QSO
+        uid = self.qso_uid_at(event)
         
         # Luo kontekstivalikko
         context_menu = tk.Menu(self.root, tearoff=0)
-        context_menu.add_command(label=self.texts['edit_entry'], 
-                                command=lambda: self.edit_log_entry(entry_index))
-        context_menu.add_command(label=self.texts['delete_entry'], 
-                                command=lambda: self.delete_log_entry(entry_index))
+        if uid is not None:
+            # Paikka lokissa haetaan vasta valinnan hetkellä
+            context_menu.add_command(label=self.texts['edit_entry'], 
+                                    command=lambda: self.edit_log_entry(self.entry_index(uid)))
+            context_menu.add_command(label=self.texts['delete_entry'], 
+                                    command=lambda: self.delete_log_entry(self.entry_index(uid)))
+            context_menu.add_separator()
+        
+        # Lokinäkymän järjestys
+        context_menu.add_command(label=self.texts['sort_oldest_first'],
+                                command=lambda: self.log_view.set_order())
+        context_menu.add_command(label=self.texts['sort_newest_first'],
+                                command=lambda: self.log_view.set_order(newest_first=True))
+        context_menu.add_command(label=self.texts['sort_by_call'],
+                                command=lambda: self.log_view.set_order(self.call_sort_key))
         
         context_menu.post(event.x_root, event.y_root)
     
+    def call_sort_key(self, index):
+        qso = self.log_entries[index]
+        return (qso.call, qso.epoch)
+    
     def on_log_double_click(self, event):
         """Käsittele kaksoisklikkaus - avaa muokkausdialogi"""
-        index = self.log_text.index(f"@{event.x},{event.y}")
-        line_num = int(index.split('.')[0])
-        
-        line_content = self.log_text.get(f"{line_num}.0", f"{line_num}.end")
-        if not line_content.strip():
+        uid = self.qso_uid_at(event)
+        if uid is None:
             return
         
-        entry_index = len(self.log_entries) - line_num
-        if entry_index < 0 or entry_index >= len(self.log_entries):
-            return
-        
-        self.edit_log_entry(entry_index)
+        self.edit_log_entry(self.entry_index(uid))
     
     def edit_log_entry(self, index):
         """Muokkaa lokimerkintää"""
-        if index < 0 or index >= len(self.log_entries):
+        if self.log_loading_busy():
+            return
+        
+        if index is None or index < 0 or index >= len(self.log_entries):
             return
         
         entry = self.log_entries[index]
@@ -2468,17 +2970,43 @@ More info: https://github.com/oh3enk/hamlogger
         row += 1
         
         def save_changes():
-            # Päivitä merkintä
-            entry['call'] = call_var.get().upper()
-            entry['band'] = band_var.get()
-            entry['mode'] = mode_var.get()
-            entry['rst_sent'] = rst_sent_var.get()
-            entry['rst_rcvd'] = rst_rcvd_var.get()
-            entry['their_wwff'] = wwff_var.get().upper()
-            entry['comment'] = comment_text.get('1.0', 'end-1c').strip()
+            # Loki on voinut muuttua dialogin ollessa auki: hae paikka tunnisteella
+            index = self.entry_index(entry.uid)
+            if index is None:
+                messagebox.showwarning(self.texts['edit_qso'], "QSO on poistettu lokista")
+                edit_window.destroy()
+                return
+            
+            # Korvaa merkintä muokatulla kopiolla: taustatallennuksen
+            # tilannekuva pysyy ehjänä (indeksiavain muuttuu kenttien mukana)
+            updated = entry.copy()
+            updated['call'] = call_var.get().upper()
+            updated['band'] = band_var.get()
+            updated['mode'] = mode_var.get()
+            updated['rst_sent'] = rst_sent_var.get()
+            updated['rst_rcvd'] = rst_rcvd_var.get()
+            updated['their_wwff'] = wwff_var.get().upper()
+            updated['comment'] = comment_text.get('1.0', 'end-1c').strip()
+            # Rivit, joiden duplikaattitila voi muuttua: vanha ja uusi avain
+            affected = self.dupe_index.members(entry)
+            self.unindex_qso(entry)
+            self.log_entries[index] = updated
+            self.index_qso(updated)
+            affected.extend(self.dupe_index.members(updated))
+            if self.log_store is not None:
+                self.log_store.update(updated)
+            if self.journal is not None:
+                self.journal.append('edit', target=entry, qso=updated)
             
             self.log_modified = True
-            self.refresh_log_display()
+            if self.log_view.sort_key is not None and updated.call != entry.call:
+                # Kutsujärjestyksessä rivi vaihtaa paikkaa: pidä muokattu QSO näkyvissä
+                self.refresh_log_display()
+                if index not in self.log_view.shown:
+                    self.log_view.jump_to(index)
+            else:
+                self.refresh_log_rows(affected)
+            self.update_stats()
             self.update_header()
             edit_window.destroy()
         
@@ -2490,7 +3018,10 @@ More info: https://github.com/oh3enk/hamlogger
     
     def delete_log_entry(self, index):
         """Poista lokimerkintä"""
-        if index < 0 or index >= len(self.log_entries):
+        if self.log_loading_busy():
+            return
+        
+        if index is None or index < 0 or index >= len(self.log_entries):
             return
         
         entry = self.log_entries[index]
@@ -2498,17 +3029,49 @@ More info: https://github.com/oh3enk/hamlogger
         
         if messagebox.askyesno(self.texts['delete_entry'], 
                                f"Haluatko varmasti poistaa yhteyden {call}?"):
+            index = self.entry_index(entry.uid)
+            if index is None:
+                return
+            row = self.log_view.row_of(index)
+            self.unindex_qso(entry)
             del self.log_entries[index]
+            # Myöhempien paikat lasketaan uudelleen seuraavalla haulla
+            self.entry_positions.pop(entry.uid, None)
+            if self.log_store is not None:
+                self.log_store.remove(entry)
+            if self.journal is not None:
+                self.journal.append('delete', target=entry)
             self.log_modified = True
-            self.refresh_log_display()
+            self.log_view.remove_row(row, index)
+            self.refresh_log_rows(self.dupe_index.members(entry))
             self.update_stats()
             self.update_header()
     
+    def display_log(self):
+        """Näytä kokonaan uusi loki (avaus, palautus, uusi loki).
+
+        Näkymä piirretään kerran lopuksi: vain näkyvät rivit yhdellä
+        Text.insert-kutsulla, vieritettynä uusimpaan QSO:hon.
+        """
+        self.update_header()
+        self.update_stats()
+        self.log_view.reset()
+        if self.log_entries:
+            self.update_previous_contact(self.log_entries[-1])
+        else:
+            self.prev_contact_uid = None
+            self.prev_contact_label.config(text=self.texts['no_contacts'])
+    
+    @timed('refresh_log_display')
     def refresh_log_display(self):
-        """Päivitä lokinäyttö kokonaan"""
-        self.log_text.delete('1.0', tk.END)
-        for qso in reversed(self.log_entries):
-            self.add_to_log_display(qso)
+        """Päivitä lokinäyttö (piirtää vain näkyvät rivit)"""
+        self.log_view.refresh(changed=True)
+    
+    def refresh_log_rows(self, qsos):
+        """Piirrä uudelleen näkyvät rivit, joiden QSO on listassa qsos"""
+        ids = {id(qso) for qso in qsos}
+        if ids:
+            self.log_view.update_rows(lambda index: id(self.log_entries[index]) in ids)
 
 def main():
     root = tk.Tk()
@@ -2517,4 +3080,8 @@ def main():
     root.mainloop()
 
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        # Komentoriviparametrit: eräajo ilman ikkunaa (ks. ohhamlog_cli.py)
+        from ohhamlog_cli import main as cli_main
+        sys.exit(cli_main(sys.argv[1:]))
     main()
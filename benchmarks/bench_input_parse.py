@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""Syöttörivin jäsennyksen mikrobenchmark.
+
+Mittaa parse_input_line-funktion ajan riviä kohden eri syötemuodoille
+(band/mode-komento, pelkkä kutsu, kutsu + raportit, WWFF + kommentti).
+Käyttää vain ohhamlog_core-moduulia, tkinteriä ei tuoda.
+
+    python benchmarks/bench_input_parse.py [--repeat N]
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ohhamlog_core import parse_input_line  # noqa: E402
+
+SAMPLES = [
+    ('band', '40'),
+    ('band_cm', ',23'),
+    ('mode', 'CW'),
+    ('call', 'OH1AA'),
+    ('call_rst', 'OH2BB 57'),
+    ('call_rst_rst', 'OH3CC 57 58'),
+    ('call_wwff', 'OH4DD OHFF-0001'),
+    ('full', 'OH5EE/P 599 579 OHFF-1234 nice signal in park'),
+    ('ff_country', 'G4FFF 59 59 FF-OH123 thanks'),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=100000,
+                        help='jäsennyksiä rivimuotoa kohden')
+    args = parser.parse_args()
+
+    print(f"{'muoto':<16} {'us/rivi':>10}")
+    total = 0.0
+    for name, line in SAMPLES:
+        for mode in ('SSB', 'CW'):
+            elapsed = min(timeit.repeat(
+                lambda: parse_input_line(line, mode, '59', '59'),
+                number=args.repeat, repeat=3))
+            per_line = elapsed / args.repeat * 1e6
+            total += per_line
+            print(f"{name + '/' + mode:<16} {per_line:>10.2f}")
+    print(f"{'keskiarvo':<16} {total / (len(SAMPLES) * 2):>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""Lokin perusoperaatioiden benchmark synteettisellä lokilla.
+
+Mittaa ADI-jäsennyksen, ADI:n muodostuksen, dupetarkistuksen, yhdistämisen
+dupepoiston ja järjestyksen (muistissa ja levylle kirjoitettavina ajoina),
+lähekkäisten kaksoiskappaleiden poiston, osaviennin suodatuksen sekä
+tekstilokin jäsennyksen eri lokikoilla. Tulokset kirjoitetaan JSONiin,
+jota voi verrata aiempaan ajoon:
+
+    python benchmarks/bench_log_ops.py --output base.json
+    python benchmarks/bench_log_ops.py --sizes 1k,10k,100k,1m --compare base.json
+
+Käyttää vain ohhamlog_core-moduulia, tkinteriä ei tuoda.
+"""
+import argparse
+import contextlib
+import datetime
+import functools
+import io
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [BENCH_DIR, os.path.dirname(BENCH_DIR)]
+
+import synthetic  # noqa: E402
+from ohhamlog_core import (  # noqa: E402
+    MERGE_RUN_RECORDS, CallHistoryIndex, DupeIndex, LogStats, NearDuplicateFilter, SortedRuns,
+    entries_between, iter_adif_records, parse_text_qso, qso_from_adif_tags, render_adi,
+    unique_in_time_order)
+
+DEFAULT_SIZES = '1k,10k,100k'
+DUPE_PROBES = 10000
+
+DEFAULT_SETTINGS = {
+    'mycall': 'OH3ENK',
+    'mylocator': 'KP11',
+    'mywwff': 'OHFF-0001',
+    'default_rst_sent': '59',
+    'default_rst_rcvd': '59',
+}
+
+
+def parse_size(text):
+    text = text.strip().lower()
+    multiplier = {'k': 1000, 'm': 1000000}.get(text[-1:], 1)
+    return int(text.rstrip('km')) * multiplier
+
+
+def parse_adi(content):
+    """Sama jäsennys kuin HamLogger.parse_adi_content (ilman indeksejä)"""
+    convert = functools.partial(qso_from_adif_tags, default_band='20m', default_mode='SSB',
+                                default_rst_sent='59', default_rst_rcvd='59')
+    return [qso for qso in map(convert, iter_adif_records(io.StringIO(content))) if qso is not None]
+
+
+def rebuild_indexes(qsos):
+    """Sama indeksien rakennus kuin HamLogger.rebuild_indexes"""
+    DupeIndex().rebuild(qsos)
+    CallHistoryIndex().rebuild(qsos)
+    LogStats().rebuild(qsos)
+
+
+def merge_runs(qsos, run_records):
+    """Sama ulkoinen lajittelu kuin merge_logs, ajot levylle run_records QSO:n välein"""
+    with tempfile.TemporaryDirectory() as run_dir:
+        runs = SortedRuns(run_dir, run_records)
+        runs.add_all(qsos)
+        for _ in unique_in_time_order(runs):
+            pass
+
+
+def build_operations(size, seed):
+    """(nimi, funktio, käsiteltyjen alkioiden määrä) annetun kokoiselle lokille"""
+    qsos = synthetic.generate_qsos(size, seed)
+    adi_text = synthetic.generate_adi(size, seed)
+    text_lines = synthetic.generate_text_lines(min(size, 100000), seed)
+
+    dupes = DupeIndex()
+    dupes.rebuild(qsos)
+    rnd = random.Random(seed)
+    probes = [qsos[rnd.randrange(size)] for _ in range(DUPE_PROBES // 2)]
+    probes += synthetic.generate_qsos(DUPE_PROBES - len(probes), seed + 100)
+
+    # Kaksi osittain päällekkäistä lokia yhdistettäväksi
+    merge_input = qsos + rnd.sample(qsos, size // 2)
+    rnd.shuffle(merge_input)
+
+    # Toisen ohjelman kirjaamat kopiot minuutin sisällä, aikajärjestyksessä
+    shifted = [qso.copy() for qso in rnd.sample(qsos, size // 2)]
+    for qso in shifted:
+        qso.epoch += rnd.randint(-60, 60)
+    near_input = sorted(qsos + shifted, key=lambda qso: qso.epoch)
+
+    start_epoch = qsos[size // 3].epoch
+    end_epoch = qsos[2 * size // 3].epoch
+
+    def parse_text():
+        for line in text_lines:
+            parse_text_qso(line, '20m', 'SSB', DEFAULT_SETTINGS['default_rst_sent'],
+                           DEFAULT_SETTINGS['default_rst_rcvd'], DEFAULT_SETTINGS['mylocator'])
+
+    return [
+        ('parse_adi', lambda: parse_adi(adi_text), size),
+        ('rebuild_indexes', lambda: rebuild_indexes(qsos), size),
+        ('generate_adi', lambda: render_adi(qsos, DEFAULT_SETTINGS['mycall'],
+                                            DEFAULT_SETTINGS['mywwff']), size),
+        ('is_duplicate_contact', lambda: [dupes.is_duplicate(qso) for qso in probes], len(probes)),
+        ('merge_dedupe_sort', lambda: merge_runs(merge_input, MERGE_RUN_RECORDS), len(merge_input)),
+        ('merge_sorted_runs', lambda: merge_runs(merge_input, max(1000, size // 4)), len(merge_input)),
+        ('near_duplicates', lambda: list(NearDuplicateFilter().filter(near_input)), len(near_input)),
+        ('export_filter', lambda: entries_between(qsos, start_epoch, end_epoch), size),
+        ('parse_text_qso', parse_text, len(text_lines)),
+    ]
+
+
+def measure(func, repeat):
+    best = None
+    for _ in range(repeat):
+        # Rikkinäisten tietueiden varoitukset eivät kuulu tulosteeseen
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            start = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def load_baseline(filename):
+    with open(filename, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return {(row['size'], row['operation']): row['seconds'] for row in data['results']}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default=DEFAULT_SIZES,
+                        help=f"lokikoot pilkuilla eroteltuna, esim. 1k,10k,100k,1m (oletus {DEFAULT_SIZES})")
+    parser.add_argument('--seed', type=int, default=1, help='synteettisen lokin siemen')
+    parser.add_argument('--repeat', type=int, default=3, help='toistot, paras aika jää voimaan')
+    parser.add_argument('--only', help='aja vain nämä operaatiot (pilkuilla eroteltuna)')
+    parser.add_argument('--label', default='', help='ajon nimi JSONiin (esim. versio)')
+    parser.add_argument('--output', help='kirjoita tulokset JSON-tiedostoon')
+    parser.add_argument('--compare', help='vertaa aiempaan JSON-tulokseen')
+    args = parser.parse_args()
+
+    only = set(args.only.split(',')) if args.only else None
+    baseline = load_baseline(args.compare) if args.compare else {}
+
+    results = []
+    print(f"{'koko':>8} {'operaatio':<22} {'s':>10} {'us/alkio':>10} {'muutos':>8}")
+    for size in map(parse_size, args.sizes.split(',')):
+        for name, func, items in build_operations(size, args.seed):
+            if only and name not in only:
+                continue
+            # Suurilla lokeilla yksi kierros riittää
+            seconds = measure(func, args.repeat if size <= 100000 else 1)
+            results.append({
+                'size': size,
+                'operation': name,
+                'seconds': seconds,
+                'items': items,
+                'us_per_item': seconds / items * 1e6,
+            })
+            change = ''
+            if (size, name) in baseline:
+                change = f"{seconds / baseline[(size, name)]:.2f}x"
+            print(f"{size:>8} {name:<22} {seconds:>10.4f} {seconds / items * 1e6:>10.2f} {change:>8}")
+
+    if args.output:
+        report = {
+            'created': datetime.datetime.now(datetime.UTC).isoformat(timespec='seconds'),
+            'label': args.label,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'seed': args.seed,
+            'results': results,
+        }
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""Deterministinen synteettinen loki benchmarkeja varten.
+
+Sama siemen tuottaa aina saman lokin, joten eri versioiden tuloksia voi
+verrata keskenään. Kutsut, bandit, modet ja WWFF-tunnukset painotetaan
+tavallisen lokin mukaan, ja osa ADI-tietueista on tahallaan rikki
+(puuttuva päivä, väärä kentän pituus, roskaa tietueiden välissä, pienet
+kirjaimet, puuttuva <EOR>) kuten muiden ohjelmien tuottamissa lokeissa.
+"""
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ohhamlog_core import QSO  # noqa: E402
+
+START_EPOCH = 1577836800    # 2020-01-01 00:00:00 UTC
+
+PREFIXES = ['OH', 'OH', 'OH', 'OG', 'OF', 'SM', 'SM', 'LA', 'OZ', 'ES', 'DL', 'DL',
+            'DK', 'G', 'M', 'F', 'I', 'EA', 'K', 'W', 'N', 'VE', 'JA', 'VK', 'UA',
+            'SP', 'OK', 'HA', 'YL', 'LY', 'S5', '9A']
+SUFFIX_LETTERS = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+BANDS = ['160m', '80m', '60m', '40m', '30m', '20m', '17m', '15m', '12m', '10m', '6m', '2m', '70cm']
+BAND_WEIGHTS = [2, 10, 2, 20, 6, 25, 5, 8, 3, 8, 4, 5, 2]
+MODES = ['SSB', 'CW', 'FT8', 'FT4', 'FM', 'RTTY', 'AM', 'FreeDV']
+MODE_WEIGHTS = [35, 30, 20, 5, 5, 3, 1, 1]
+WWFF_PREFIXES = ['OHFF', 'SMFF', 'LAFF', 'OZFF', 'ESFF', 'DLFF', 'GFF', 'GMFF', 'ONFF', 'SPFF']
+COMMENTS = ['', '', '', '', 'TNX', 'QRP', 'NICE SIGNAL', 'POTA', 'QSB', 'NAME JUKKA', 'PSE QSL']
+
+MALFORMED_KINDS = ('no_date', 'bad_length', 'garbage', 'lowercase', 'no_eor', 'bad_time')
+
+TEXT_LINE_FORMATS = (
+    "{call} {rst_sent} {rst_rcvd} {date} {time} {band} {mode}",
+    "{date} {time} {call} {band} {mode} {rst_sent} {rst_rcvd}",
+    "{call},{rst_sent},{rst_rcvd},{date},{time},{band},{mode}",
+)
+
+
+def make_callsign(rnd):
+    call = f"{rnd.choice(PREFIXES)}{rnd.randint(0, 9)}"
+    call += ''.join(rnd.choice(SUFFIX_LETTERS) for _ in range(rnd.choice((1, 2, 2, 3, 3, 3))))
+    roll = rnd.random()
+    if roll < 0.04:
+        call += '/P'
+    elif roll < 0.05:
+        call = f"OH/{call}"
+    return call
+
+
+def generate_qsos(count, seed=1):
+    """count QSO:ta, asemia noin neljännes QSO-määrästä (toistuvia kutsuja ja dupeja)"""
+    rnd = random.Random(seed)
+    stations = [make_callsign(rnd) for _ in range(max(50, count // 4))]
+    epoch = START_EPOCH
+    qsos = []
+    for _ in range(count):
+        epoch += rnd.randint(20, 600)
+        mode = rnd.choices(MODES, MODE_WEIGHTS)[0]
+        rst = '599' if mode == 'CW' else '59'
+        wwff = ''
+        if rnd.random() < 0.1:
+            wwff = f"{rnd.choice(WWFF_PREFIXES)}-{rnd.randint(1, 2999):04d}"
+        qsos.append(QSO(
+            epoch=epoch,
+            call=rnd.choice(stations),
+            band=rnd.choices(BANDS, BAND_WEIGHTS)[0],
+            mode=mode,
+            rst_sent=rst,
+            rst_rcvd=rst if rnd.random() < 0.8 else rst[:1] + str(rnd.randint(3, 8)) + rst[2:],
+            comment=rnd.choice(COMMENTS),
+            my_gridsquare='KP11',
+            their_wwff=wwff,
+        ))
+    return qsos
+
+
+def adif_field(name, value):
+    return f"<{name}:{len(value)}>{value}"
+
+
+def adif_record(qso, rnd, malformed=None):
+    fields = [
+        adif_field('CALL', qso.call),
+        adif_field('QSO_DATE', qso.adif_date),
+        adif_field('TIME_ON', qso.adif_time),
+        adif_field('BAND', qso.band),
+        adif_field('MODE', qso.mode),
+        adif_field('RST_SENT', qso.rst_sent),
+        adif_field('RST_RCVD', qso.rst_rcvd),
+    ]
+    if qso.their_wwff:
+        fields += [adif_field('SIG', 'WWFF'), adif_field('SIG_INFO', qso.their_wwff)]
+    if qso.comment:
+        fields.append(adif_field('COMMENT', qso.comment))
+    if rnd.random() < 0.3:
+        fields.append(adif_field('FREQ', f"{rnd.uniform(1.8, 148.0):.4f}"))
+    eor = '<EOR>'
+
+    if malformed == 'no_date':
+        del fields[1]
+    elif malformed == 'bad_length':
+        fields[0] = f"<CALL:{len(qso.call) + 3}>{qso.call}"
+    elif malformed == 'garbage':
+        fields.insert(0, 'exported by SomeLogger v0.1 >>> ')
+    elif malformed == 'lowercase':
+        fields = [field.replace(field[1:field.index(':')], field[1:field.index(':')].lower(), 1)
+                  for field in fields]
+        eor = '<eor>'
+    elif malformed == 'no_eor':
+        eor = ''
+    elif malformed == 'bad_time':
+        fields[2] = adif_field('TIME_ON', '9961')
+
+    separator = ' ' if rnd.random() < 0.5 else '\n'
+    return separator.join(fields) + eor
+
+
+def generate_adi(count, seed=1, malformed_ratio=0.01):
+    """ADI-teksti count tietueesta, joista noin malformed_ratio on rikki"""
+    rnd = random.Random(seed + 1)
+    records = ["Synthetic log\n<ADIF_VER:5>3.1.0\n<PROGRAMID:9>synthetic\n<EOH>"]
+    for qso in generate_qsos(count, seed):
+        malformed = rnd.choice(MALFORMED_KINDS) if rnd.random() < malformed_ratio else None
+        records.append(adif_record(qso, rnd, malformed))
+    return "\n".join(records) + "\n"
+
+
+def generate_text_lines(count, seed=1):
+    """Tekstilokin rivit import_text_logille (välilyönti- ja CSV-muodot)"""
+    rnd = random.Random(seed + 2)
+    lines = []
+    for qso in generate_qsos(count, seed):
+        timestamp = qso.timestamp
+        lines.append(rnd.choice(TEXT_LINE_FORMATS).format(
+            call=qso.call, rst_sent=qso.rst_sent, rst_rcvd=qso.rst_rcvd,
+            date=timestamp[:10], time=timestamp[11:16],
+            band=qso.band, mode=qso.mode.upper()))
+    return lines
@@ -0,0 +1,563 @@
+#!/usr/bin/env python3
+"""OHHamLoggerin eräajotyökalu ADI-tiedostoille ilman käyttöliittymää.
+
+    python ohhamlog_cli.py parse lokit/
+    python ohhamlog_cli.py validate -r lokit/
+    python ohhamlog_cli.py merge -o kaikki.adi --tolerance 3 --report dupet.txt lokit/
+    python ohhamlog_cli.py split --by day -o paivat/ loki.adi
+    python ohhamlog_cli.py dedupe -o siistit/ lokit/
+    python ohhamlog_cli.py filter --from 2024-06-01 --to 2024-06-30 --band 40m --ref OHFF -o valitut/ lokit/
+    python ohhamlog_cli.py convert --format csv -o csv/ lokit/
+
+Hakemistoista luetaan *.adi- ja *.adif-tiedostot (-r myös alihakemistoista).
+Tiedostot käsitellään rinnakkain prosessipoolissa (--jobs, oletuksena kaikki
+ytimet) ja kukin luetaan virtana lohko kerrallaan. ADI-tulosteet kirjoitetaan
+samassa muodossa kuin HamLogger tallentaa lokin (QSO-mallin kentät), ja
+oma kutsu sekä WWFF otetaan ohjelman asetuksista, ellei niitä anneta.
+merge järjestää tiedostot levylle kirjoitettaviksi ajoiksi ja lomittaa ne,
+joten muistia kuluu korkeintaan --run-records QSO:ta prosessia kohden.
+"""
+import argparse
+import collections
+import concurrent.futures
+import contextlib
+import csv
+import datetime
+import functools
+import io
+import itertools
+import json
+import os
+import sys
+import tempfile
+
+from ohhamlog_core import (
+    MERGE_RUN_RECORDS, MERGE_TOLERANCE_MINUTES, QSO, AdifTimeError, Counted,
+    NearDuplicateFilter, SortedRuns, adi_header_lines, adi_record_lines, adif_record_epoch,
+    base_callsign, date_epoch, describe_near_duplicate, epoch_timestamp, iter_adi_chunks,
+    iter_adif_records, open_log_stream, qso_from_adif_tags, unique_in_time_order,
+    write_file_atomic)
+
+ADI_SUFFIXES = ('.adi', '.adif')
+SETTINGS_FILE = os.path.join(os.path.expanduser('~'), 'hamlog', 'settings.json')
+DEFAULT_SETTINGS = {
+    'mycall': '',
+    'mywwff': '',
+    'default_band': '20m',
+    'default_mode': 'SSB',
+    'default_rst_sent': '59',
+    'default_rst_rcvd': '59',
+}
+SPLIT_KEYS = {
+    'day': lambda qso: qso.adif_date,
+    'band': lambda qso: qso.band,
+    'mode': lambda qso: qso.mode,
+    'ref': lambda qso: qso.their_wwff or 'none',
+}
+CONVERT_SUFFIXES = {'adi': '.adi', 'csv': '.csv', 'jsonl': '.jsonl'}
+SPLIT_OPEN_FILES = 32   # split: yhtä aikaa auki olevat osatiedostot
+
+
+def load_settings():
+    """Oletusarvot ohjelman asetustiedostosta, jos se on olemassa"""
+    settings = dict(DEFAULT_SETTINGS)
+    try:
+        with open(SETTINGS_FILE, 'r', encoding='utf-8') as f:
+            loaded = json.load(f)
+    except (OSError, ValueError):
+        return settings
+    for key in settings:
+        if isinstance(loaded.get(key), str):
+            settings[key] = loaded[key]
+    return settings
+
+
+def collect_files(paths, recursive=False):
+    """Tiedostot komentoriviltä; hakemistoista ADI-tiedostot nimijärjestyksessä.
+
+    Palauttaa parit (tiedosto, tulosnimi), jossa tulosnimi on polku
+    suhteessa annettuun hakemistoon (tiedostolle pelkkä nimi).
+    """
+    files = []
+    for path in paths:
+        if not os.path.isdir(path):
+            files.append((path, os.path.basename(path)))
+            continue
+        if recursive:
+            found = [os.path.join(directory, name)
+                     for directory, _, names in os.walk(path) for name in names]
+        else:
+            found = [os.path.join(path, name) for name in os.listdir(path)]
+        files.extend((name, os.path.relpath(name, path)) for name in sorted(found)
+                     if name.lower().endswith(ADI_SUFFIXES) and os.path.isfile(name))
+    return files
+
+
+def output_name(options, filename, suffix=None):
+    """Tulostiedoston nimi --output-hakemiston sisällä (alihakemistot säilyvät)"""
+    name = options.output_names.get(filename, os.path.basename(filename))
+    if suffix is not None:
+        name = os.path.splitext(name)[0] + suffix
+    return name
+
+
+def output_path(options, filename, suffix=None):
+    """Tulostiedosto --output-hakemistoon samalla nimellä (tai uudella päätteellä)"""
+    path = os.path.join(options.output, output_name(options, filename, suffix))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+
+def adif_converter(options):
+    return functools.partial(qso_from_adif_tags,
+                             default_band=options.default_band, default_mode=options.default_mode,
+                             default_rst_sent=options.default_rst_sent,
+                             default_rst_rcvd=options.default_rst_rcvd)
+
+
+def read_qsos(filename, options):
+    """QSO:t tiedostosta virtana; virheelliset tietueet ohitetaan"""
+    convert = adif_converter(options)
+    with open_log_stream(filename) as stream:
+        for tags in iter_adif_records(stream):
+            qso = convert(tags)
+            if qso is not None:
+                yield qso
+
+
+def unique_qsos(qsos):
+    """Ohita saman kutsun ja ajan kaksoiskappaleet (kuten merge_logs)"""
+    seen = set()
+    for qso in qsos:
+        key = (qso.call, qso.epoch)
+        if key not in seen:
+            seen.add(key)
+            yield qso
+
+
+def make_filter(options):
+    """Ehto QSO:lle --from/--to/--band/--mode/--ref/--call -valitsimista"""
+    tests = []
+    if options.date_from:
+        start = date_epoch(datetime.date.fromisoformat(options.date_from))
+        tests.append(lambda qso: qso.epoch >= start)
+    if options.date_to:
+        end = date_epoch(datetime.date.fromisoformat(options.date_to) + datetime.timedelta(days=1))
+        tests.append(lambda qso: qso.epoch < end)
+    if options.band:
+        bands = {band.strip().lower() for band in options.band.split(',')}
+        tests.append(lambda qso: qso.band.lower() in bands)
+    if options.mode:
+        modes = {mode.strip().upper() for mode in options.mode.split(',')}
+        tests.append(lambda qso: qso.mode.upper() in modes)
+    if options.ref:
+        refs = tuple(ref.strip().upper() for ref in options.ref.split(','))
+        tests.append(lambda qso: qso.their_wwff.upper().startswith(refs))
+    if options.call:
+        calls = {base_callsign(call) for call in options.call.split(',')}
+        tests.append(lambda qso: base_callsign(qso.call) in calls)
+    return lambda qso: all(test(qso) for test in tests)
+
+
+def write_adi(filename, qsos, options):
+    """Kirjoita QSO:t ADI-tiedostoon virtana, palauta kirjoitettujen määrä"""
+    counted = Counted(qsos)
+    write_file_atomic(filename, iter_adi_chunks(counted, options.mycall, options.mywwff))
+    return counted.count
+
+
+class SplitWriter:
+    """split-komennon osatiedostot tietue kerrallaan.
+
+    Jokainen osa kirjoitetaan väliaikaistiedostoon, joka avataan osan
+    ensimmäisestä QSO:sta, ja siirretään paikalleen commit()-metodissa
+    (kuten write_file_atomic). Auki pidetään korkeintaan SPLIT_OPEN_FILES
+    tiedostoa; pisimpään käyttämättä ollut suljetaan ja avataan
+    tarvittaessa uudelleen jatkamaan.
+    """
+
+    def __init__(self, options):
+        self.options = options
+        self.targets = {}    # osa -> (kohdetiedosto, väliaikaistiedosto)
+        self.counts = {}     # osa -> QSO-määrä
+        self.files = collections.OrderedDict()   # osa -> auki oleva tiedosto
+
+    def file(self, part, target):
+        f = self.files.pop(part, None)
+        if f is None:
+            if len(self.files) >= SPLIT_OPEN_FILES:
+                self.files.popitem(last=False)[1].close()
+            if part in self.targets:
+                f = open(self.targets[part][1], 'a', encoding='utf-8')
+            else:
+                fd, temp_path = tempfile.mkstemp(prefix=f".{os.path.basename(target)}.",
+                                                 suffix='.tmp', dir=os.path.dirname(target))
+                self.targets[part] = (target, temp_path)
+                self.counts[part] = 0
+                f = os.fdopen(fd, 'w', encoding='utf-8')
+                f.write("\n".join(adi_header_lines()))
+        self.files[part] = f
+        return f
+
+    def write(self, part, target, qso):
+        f = self.file(part, target)
+        f.write("\n" + "\n".join(adi_record_lines(qso, self.options.mycall, self.options.mywwff)))
+        self.counts[part] += 1
+
+    def close_files(self):
+        while self.files:
+            self.files.popitem()[1].close()
+
+    def commit(self):
+        """Siirrä valmiit osat paikalleen"""
+        self.close_files()
+        for target, temp_path in self.targets.values():
+            with open(temp_path, 'rb') as f:
+                os.fsync(f.fileno())
+            try:
+                os.chmod(temp_path, os.stat(target).st_mode & 0o7777)
+            except FileNotFoundError:
+                os.chmod(temp_path, 0o644)
+            os.replace(temp_path, target)
+
+    def discard(self):
+        """Poista keskeneräiset osat"""
+        self.close_files()
+        for _, temp_path in self.targets.values():
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+
+
+def iter_csv_chunks(qsos):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(QSO.FIELDS)
+    for qso in qsos:
+        writer.writerow([qso[field] for field in QSO.FIELDS])
+        if buffer.tell() > 65536:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def iter_jsonl_chunks(qsos):
+    for qso in qsos:
+        yield json.dumps(qso.to_dict(), ensure_ascii=False) + "\n"
+
+
+# Tiedostokohtaiset työt ajetaan prosessipoolissa. Jokainen palauttaa
+# sanakirjan, jossa on vähintään 'file' ja virheen sattuessa 'error'.
+
+def per_file(work):
+    @functools.wraps(work)
+    def wrapper(filename, options):
+        try:
+            # qso_from_adif_tags tulostaa jokaisen hylätyn tietueen
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                result = work(filename, options)
+        except (OSError, ValueError) as e:
+            return {'file': filename, 'error': str(e)}
+        result['file'] = filename
+        return result
+    return wrapper
+
+
+@per_file
+def parse_file(filename, options):
+    convert = adif_converter(options)
+    records = qsos = 0
+    first = last = None
+    with open_log_stream(filename) as stream:
+        for tags in iter_adif_records(stream):
+            records += 1
+            qso = convert(tags)
+            if qso is None:
+                continue
+            qsos += 1
+            if first is None or qso.epoch < first:
+                first = qso.epoch
+            if last is None or qso.epoch > last:
+                last = qso.epoch
+    return {
+        'records': records,
+        'qsos': qsos,
+        'rejected': records - qsos,
+        'first': epoch_timestamp(first) if first is not None else None,
+        'last': epoch_timestamp(last) if last is not None else None,
+    }
+
+
+@per_file
+def validate_file(filename, options):
+    problems = []
+    records = 0
+    with open_log_stream(filename) as stream:
+        try:
+            for records, tags in enumerate(iter_adif_records(stream, strict=True), 1):
+                tags = {name: value.strip() for name, value in tags.items()}
+                call = tags.get('CALL', '')
+                if not call:
+                    problems.append((records, call, "CALL puuttuu"))
+                    continue
+                try:
+                    adif_record_epoch(tags)
+                except AdifTimeError as e:
+                    problems.append((records, call, str(e)))
+                except ValueError as e:
+                    problems.append((records, call, f"Virheellinen aika: {e}"))
+        except ValueError as e:
+            problems.append((records + 1, '', str(e)))
+    return {'records': records, 'problems': problems}
+
+
+@per_file
+def dedupe_file(filename, options):
+    counted = Counted(read_qsos(filename, options))
+    written = write_adi(output_path(options, filename), unique_qsos(counted), options)
+    return {'qsos': counted.count, 'written': written, 'removed': counted.count - written}
+
+
+@per_file
+def filter_file(filename, options):
+    counted = Counted(read_qsos(filename, options))
+    kept = filter(make_filter(options), counted)
+    first = next(kept, None)
+    if first is None:
+        return {'qsos': counted.count, 'written': 0}
+    written = write_adi(output_path(options, filename), itertools.chain([first], kept), options)
+    return {'qsos': counted.count, 'written': written}
+
+
+@per_file
+def convert_file(filename, options):
+    counted = Counted(read_qsos(filename, options))
+    target = output_path(options, filename, CONVERT_SUFFIXES[options.format])
+    if options.format == 'adi':
+        write_adi(target, counted, options)
+    elif options.format == 'csv':
+        write_file_atomic(target, iter_csv_chunks(counted))
+    else:
+        write_file_atomic(target, iter_jsonl_chunks(counted))
+    return {'qsos': counted.count, 'written': counted.count, 'output': target}
+
+
+@per_file
+def split_file(filename, options):
+    key = SPLIT_KEYS[options.by]
+    stem, suffix = os.path.splitext(output_path(options, filename))
+    writer = SplitWriter(options)
+    try:
+        for qso in read_qsos(filename, options):
+            value = key(qso)
+            safe_value = value.replace('/', '_').replace(os.sep, '_')
+            writer.write(value, f"{stem}_{safe_value}{suffix or '.adi'}", qso)
+    except BaseException:
+        writer.discard()
+        raise
+    writer.commit()
+    return {'qsos': sum(writer.counts.values()), 'parts': writer.counts}
+
+
+@per_file
+def sorted_file_runs(filename, options):
+    runs = SortedRuns(options.run_dir, options.run_records)
+    runs.add_all(read_qsos(filename, options))
+    runs.spill()
+    return {'qsos': len(runs), 'runs': runs.paths}
+
+
+def run_files(work, files, options):
+    """Aja työ tiedostoille rinnakkain, tulokset tiedostojen järjestyksessä"""
+    jobs = options.jobs or os.cpu_count() or 1
+    if jobs == 1 or len(files) < 2:
+        yield from (work(filename, options) for filename in files)
+        return
+    chunksize = max(1, len(files) // (jobs * 4))
+    with concurrent.futures.ProcessPoolExecutor(max_workers=min(jobs, len(files))) as executor:
+        yield from executor.map(work, files, itertools.repeat(options), chunksize=chunksize)
+
+
+def report_errors(results):
+    """Tulosta tiedostokohtaiset virheet, palauta onnistuneet tulokset ja virheiden määrä"""
+    ok, errors = [], 0
+    for result in results:
+        if 'error' in result:
+            errors += 1
+            print(f"{result['file']}: VIRHE {result['error']}", file=sys.stderr)
+        else:
+            ok.append(result)
+    return ok, errors
+
+
+def command_parse(files, options):
+    results, errors = report_errors(run_files(parse_file, files, options))
+    if options.json:
+        json.dump(results, sys.stdout, indent=2, ensure_ascii=False)
+        print()
+    else:
+        for result in results:
+            span = f"  {result['first']} - {result['last']}" if result['first'] else ""
+            print(f"{result['file']}: {result['qsos']} QSO:ta, {result['rejected']} hylätty{span}")
+        total = sum(result['qsos'] for result in results)
+        rejected = sum(result['rejected'] for result in results)
+        print(f"Yhteensä {len(results)} tiedostoa, {total} QSO:ta, {rejected} hylättyä tietuetta")
+    return 1 if errors else 0
+
+
+def command_validate(files, options):
+    results, errors = report_errors(run_files(validate_file, files, options))
+    invalid = sum(len(result['problems']) for result in results)
+    if options.json:
+        json.dump(results, sys.stdout, indent=2, ensure_ascii=False)
+        print()
+    else:
+        for result in results:
+            for record, call, reason in result['problems']:
+                print(f"{result['file']}: tietue {record} {' '.join(call.split())}: {reason}")
+        records = sum(result['records'] for result in results)
+        print(f"{len(results)} tiedostoa, {records} tietuetta, {invalid} virheellistä")
+    return 1 if errors or invalid else 0
+
+
+def command_merge(files, options):
+    # Jokainen tiedosto järjestetään ajoiksi levylle, ajot lomitetaan virtana
+    with tempfile.TemporaryDirectory(prefix='ohhamlog_merge_') as run_dir:
+        options.run_dir = run_dir
+        results, errors = report_errors(run_files(sorted_file_runs, files, options))
+        runs = SortedRuns(run_dir)
+        for result in results:
+            runs.add_paths(result['runs'], result['qsos'])
+        near = NearDuplicateFilter(max(0, options.tolerance) * 60, options.exact_call)
+        written = write_adi(options.output, near.filter(unique_in_time_order(runs)), options)
+    print(f"Yhdistetty {len(results)} tiedostoa: {len(runs)} QSO:ta, {written} uniikkia -> {options.output}")
+    if near.merged:
+        print(f"Yhdistettyjä kaksoiskappaleita (±{options.tolerance} min): {len(near.merged)}")
+    if options.report:
+        with open(options.report, 'w', encoding='utf-8') as f:
+            for kept, dropped in near.merged:
+                f.write(describe_near_duplicate(kept, dropped) + "\n")
+    return 1 if errors else 0
+
+
+def command_per_file(work, files, options):
+    os.makedirs(options.output, exist_ok=True)
+    results, errors = report_errors(run_files(work, files, options))
+    for result in results:
+        if 'parts' in result:
+            details = ", ".join(f"{key}: {count}" for key, count in sorted(result['parts'].items()))
+            print(f"{result['file']}: {result['qsos']} QSO:ta -> {details}")
+        else:
+            removed = f", {result['removed']} poistettu" if 'removed' in result else ""
+            print(f"{result['file']}: {result['qsos']} QSO:ta, {result['written']} kirjoitettu{removed}")
+    print(f"{len(results)} tiedostoa käsitelty -> {options.output}")
+    return 1 if errors else 0
+
+
+# Tiedostokohtaisten komentojen tulosnimen pääte (None = sama kuin syötteellä);
+# split nimeää osat syötteen nimen ilman päätettä mukaan
+OUTPUT_SUFFIXES = {
+    'split': lambda options: '',
+    'dedupe': lambda options: None,
+    'filter': lambda options: None,
+    'convert': lambda options: CONVERT_SUFFIXES[options.format],
+}
+
+COMMANDS = {
+    'parse': command_parse,
+    'validate': command_validate,
+    'merge': command_merge,
+    'split': functools.partial(command_per_file, split_file),
+    'dedupe': functools.partial(command_per_file, dedupe_file),
+    'filter': functools.partial(command_per_file, filter_file),
+    'convert': functools.partial(command_per_file, convert_file),
+}
+
+
+def build_parser():
+    settings = load_settings()
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('paths', nargs='+', help='ADI-tiedostot tai hakemistot')
+    common.add_argument('-r', '--recursive', action='store_true', help='lue myös alihakemistot')
+    common.add_argument('-j', '--jobs', type=int, default=0,
+                        help='rinnakkaiset prosessit (oletus: ytimien määrä)')
+    common.add_argument('--mycall', default=settings['mycall'], help='oma kutsu ADI-tulosteisiin')
+    common.add_argument('--mywwff', default=settings['mywwff'], help='oma WWFF-alue ADI-tulosteisiin')
+    for key in ('default_band', 'default_mode', 'default_rst_sent', 'default_rst_rcvd'):
+        common.add_argument('--' + key.replace('_', '-'), dest=key, default=settings[key],
+                            help=argparse.SUPPRESS)
+
+    parser = argparse.ArgumentParser(
+        prog='ohhamlog_cli', description=__doc__.splitlines()[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="\n".join(__doc__.splitlines()[2:]))
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    for name, text in (('parse', 'yhteenveto tiedostoista'),
+                       ('validate', 'listaa virheelliset tietueet')):
+        sub = commands.add_parser(name, parents=[common], help=text)
+        sub.add_argument('--json', action='store_true', help='tulosta JSON-muodossa')
+
+    sub = commands.add_parser('merge', parents=[common], help='yhdistä tiedostot aikajärjestykseen')
+    sub.add_argument('-o', '--output', required=True, help='yhdistetty ADI-tiedosto')
+    sub.add_argument('--run-records', type=int, default=MERGE_RUN_RECORDS,
+                     help=f"QSO:ta muistissa prosessia kohden ennen levylle kirjoittamista "
+                          f"(oletus {MERGE_RUN_RECORDS})")
+    sub.add_argument('--tolerance', type=int, default=MERGE_TOLERANCE_MINUTES,
+                     help=f"sama yhteys (kutsu, bandi, mode), jos aikaero enintään näin monta "
+                          f"minuuttia; 0 = vain sama sekunti (oletus {MERGE_TOLERANCE_MINUTES})")
+    sub.add_argument('--exact-call', action='store_true',
+                     help='vertaa koko kutsua (oletuksena peruskutsu: A1A/P on sama kuin A1A)')
+    sub.add_argument('--report', help='kirjoita yhdistetyt kaksoiskappaleet tekstitiedostoon')
+
+    sub = commands.add_parser('split', parents=[common], help='jaa tiedostot osiin')
+    sub.add_argument('--by', choices=sorted(SPLIT_KEYS), default='day', help='jakoperuste')
+    sub.add_argument('-o', '--output', required=True, help='tuloshakemisto')
+
+    sub = commands.add_parser('dedupe', parents=[common], help='poista saman kutsun ja ajan kaksoiskappaleet')
+    sub.add_argument('-o', '--output', required=True, help='tuloshakemisto')
+
+    sub = commands.add_parser('filter', parents=[common], help='valitse QSO:t ehtojen mukaan')
+    sub.add_argument('--from', dest='date_from', help='alkaen päivästä (YYYY-MM-DD)')
+    sub.add_argument('--to', dest='date_to', help='päivään asti (YYYY-MM-DD, mukaan lukien)')
+    sub.add_argument('--band', help='bandit pilkuilla eroteltuna, esim. 40m,20m')
+    sub.add_argument('--mode', help='modet pilkuilla eroteltuna, esim. CW,SSB')
+    sub.add_argument('--ref', help='WWFF-tunnukset tai niiden alut, esim. OHFF-0029 tai OHFF')
+    sub.add_argument('--call', help='kutsut pilkuilla eroteltuna (peruskutsun mukaan)')
+    sub.add_argument('-o', '--output', required=True, help='tuloshakemisto')
+
+    sub = commands.add_parser('convert', parents=[common], help='muunna ADI/CSV/JSONL-muotoon')
+    sub.add_argument('--format', choices=sorted(CONVERT_SUFFIXES), default='adi', help='tulosmuoto')
+    sub.add_argument('-o', '--output', required=True, help='tuloshakemisto')
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    options = parser.parse_args(argv)
+    if options.command == 'filter':
+        try:
+            make_filter(options)
+        except ValueError as e:
+            parser.error(f"virheellinen päivämäärä: {e}")
+
+    collected = collect_files(options.paths, options.recursive)
+    if not collected:
+        parser.error("ei ADI-tiedostoja")
+    files = [filename for filename, _ in collected]
+    options.output_names = dict(collected)
+    if options.command in OUTPUT_SUFFIXES:
+        # Samannimiset syötteet eivät saa kirjoittaa toistensa päälle
+        owners = {}
+        for filename in files:
+            name = output_name(options, filename, OUTPUT_SUFFIXES[options.command](options))
+            if name in owners:
+                parser.error(f"{owners[name]} ja {filename} tuottaisivat saman tulosteen {name}")
+            owners[name] = filename
+    return COMMANDS[options.command](files, options)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
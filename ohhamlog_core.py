@@ -0,0 +1,2006 @@
+#!/usr/bin/env python3
+"""OHHamLoggerin lokimoottori ilman käyttöliittymää.
+
+QSO-malli, ADIF-luku ja -kirjoitus, tekstilokin ja syöttörivin jäsennys,
+dupe- ja kutsuindeksit, tilastot, journaali, varmuuskopiot ja viivemittaus.
+Moduuli ei tuo tkinteriä, joten sitä voi käyttää eräajotyökaluista,
+palvelimista ja benchmarkeista. Graafinen HamLogger kutsuu näitä.
+"""
+import datetime
+import os
+import json
+import math
+import operator
+import re
+import io
+import codecs
+import sys
+import time
+import functools
+import bisect
+import heapq
+import pickle
+import sqlite3
+import tempfile
+import threading
+import queue
+from collections import Counter, deque
+
+# Modejen normalisointi (ADI-tiedostot ja syöttörivi)
+MODE_MAP = {
+    'SSB': 'SSB', 'LSB': 'LSB', 'USB': 'USB', 'CW': 'CW',
+    'FM': 'FM', 'AM': 'AM', 'FT8': 'FT8', 'FT4': 'FT4',
+    'RTTY': 'RTTY', 'PSK': 'PSK', 'JT65': 'JT65', 'FREEDV': 'FreeDV'
+}
+
+ADIF_CHUNK_SIZE = 65536
+
+# <NIMI>, <NIMI:pituus> tai <NIMI:pituus:tyyppi>
+ADIF_TAG_PATTERN = re.compile(r'<([A-Za-z0-9_]+)(?::(\d+)(?::[^<>]*)?)?>')
+
+
+def iter_adif_records(stream, chunk_size=ADIF_CHUNK_SIZE, strict=False):
+    """Lue ADI-tietueet tiedosto-oliosta yksi kerrallaan.
+
+    Kentän pituus (<NIMI:pituus>) luetaan kirjaimellisesti, joten arvo voi
+    sisältää myös '<'-merkkejä. <EOH> ja <EOR> tunnistetaan kirjainkoosta
+    riippumatta. Palauttaa sanakirjan {KENTTÄ: arvo} jokaista tietuetta kohden.
+    strict=True nostaa ValueErrorin, jos viimeinen arvo katkeaa kesken.
+    """
+    finditer = ADIF_TAG_PATTERN.finditer
+    buf = stream.read(chunk_size)
+    eof = not buf
+    pos = 0
+    record = {}
+
+    while True:
+        resume = None
+        for match in finditer(buf, pos):
+            start, value_start = match.span()
+            if start < pos:
+                # Osuma on edellisen kentän arvon sisällä
+                continue
+
+            name, length = match.group(1, 2)
+            if length is None:
+                name = name.upper()
+                if name == 'EOR':
+                    if record:
+                        yield record
+                    record = {}
+                elif name == 'EOH':
+                    # Otsakkeen kentät eivät kuulu QSO-tietueisiin
+                    record = {}
+                pos = value_start
+                continue
+
+            end = value_start + int(length)
+            if end > len(buf):
+                if not eof:
+                    # Arvo jatkuu seuraavassa lohkossa
+                    resume = start
+                    break
+                if strict:
+                    raise ValueError(f"kenttä {name} katkeaa tiedoston lopussa")
+            record[name.upper()] = buf[value_start:end]
+            pos = end
+
+        if eof:
+            break
+
+        if resume is None:
+            # Mahdollinen keskeneräinen tagi puskurin lopussa
+            resume = buf.rfind('<', pos)
+            if resume == -1:
+                resume = len(buf)
+
+        chunk = stream.read(chunk_size)
+        eof = not chunk
+        buf = buf[resume:] + chunk
+        pos = 0
+
+    # Viimeinen tietue ilman <EOR>-merkkiä
+    if record:
+        yield record
+
+
+NON_DIGIT_PATTERN = re.compile(r'\D')
+
+SECONDS_PER_DAY = 86400
+_EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+
+# Tarkistetut ADI-päivämäärät: 'YYYYMMDD' -> päivän alun epoch-sekunnit
+_adif_date_cache = {}
+# Päivänumero (epoch // 86400) -> ('YYYY-MM-DD', 'YYYYMMDD')
+_day_string_cache = {}
+
+
+def adif_digits(value):
+    """Poista arvosta muut kuin numerot"""
+    if value.isdigit():
+        return value
+    return NON_DIGIT_PATTERN.sub('', value)
+
+
+def date_epoch(date):
+    """Päivämäärän (date tai datetime) alun UTC-epoch-sekunnit"""
+    return (date.toordinal() - _EPOCH_ORDINAL) * SECONDS_PER_DAY
+
+
+def adif_epoch(qso_date, time_on):
+    """Muunna ADI-päivämäärä (YYYYMMDD) ja aika (HHMMSS) UTC-epoch-sekunneiksi"""
+    day_start = _adif_date_cache.get(qso_date)
+    if day_start is None:
+        # Tarkista päivämäärä kerran, sama päivä toistuu lokissa satoja kertoja
+        date = datetime.date(int(qso_date[:4]), int(qso_date[4:6]), int(qso_date[6:8]))
+        day_start = date_epoch(date)
+        _adif_date_cache[qso_date] = day_start
+    
+    hours, minutes, seconds = int(time_on[:2]), int(time_on[2:4]), int(time_on[4:6])
+    if hours > 23 or minutes > 59 or seconds > 61:
+        raise ValueError(f"virheellinen kellonaika {time_on}")
+    return day_start + hours * 3600 + minutes * 60 + seconds
+
+
+def timestamp_to_epoch(timestamp):
+    """Muunna 'YYYY-MM-DD HH:MM:SS' UTC-epoch-sekunneiksi"""
+    return adif_epoch(timestamp[:10].replace('-', ''), timestamp[11:19].replace(':', ''))
+
+
+def day_strings(day):
+    """Päivänumeron merkkijonot ('YYYY-MM-DD', 'YYYYMMDD')"""
+    strings = _day_string_cache.get(day)
+    if strings is None:
+        date = datetime.date.fromordinal(day + _EPOCH_ORDINAL)
+        strings = (date.isoformat(), date.strftime('%Y%m%d'))
+        _day_string_cache[day] = strings
+    return strings
+
+
+def epoch_timestamp(epoch):
+    """UTC-epoch-sekunnit muotoon 'YYYY-MM-DD HH:MM:SS'"""
+    day, seconds = divmod(epoch, SECONDS_PER_DAY)
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{day_strings(day)[0]} {hours:02d}:{minutes:02d}:{seconds:02d}"
+
+
+def utc_day_now():
+    """Nykyinen UTC-päivänumero"""
+    return int(time.time()) // SECONDS_PER_DAY
+
+
+class QSO:
+    """Yksi QSO-tietue.
+
+    Aika on tallessa kokonaislukuna (UTC-epoch-sekunnit) ja bandi, mode ja
+    lokaattori internoituina merkkijonoina. Vanha sanakirjarajapinta
+    (qso['call'], qso.get('comment'), qso['timestamp']) toimii edelleen.
+    """
+
+    __slots__ = ('epoch', 'call', 'band', 'mode', 'rst_sent', 'rst_rcvd',
+                 'comment', 'my_gridsquare', 'their_wwff', 'qso_id', 'uid')
+
+    FIELDS = ('timestamp', 'call', 'band', 'mode', 'rst_sent', 'rst_rcvd',
+              'comment', 'my_gridsquare', 'their_wwff')
+    INTERNED = ('band', 'mode', 'my_gridsquare')
+
+    def __init__(self, epoch, call, band, mode, rst_sent='', rst_rcvd='',
+                 comment='', my_gridsquare='', their_wwff='', qso_id=None):
+        self.epoch = epoch
+        self.call = call
+        self.band = sys.intern(band)
+        self.mode = sys.intern(mode)
+        self.rst_sent = rst_sent
+        self.rst_rcvd = rst_rcvd
+        self.comment = comment
+        self.my_gridsquare = sys.intern(my_gridsquare)
+        self.their_wwff = their_wwff
+        # Tunniste lokivarastossa (SQLite-rivin id), None jos ei tallennettu
+        self.qso_id = qso_id
+        # Pysyvä tunniste tämän istunnon ajan (lokinäkymän rivit, muokkaus)
+        self.uid = None
+
+    @classmethod
+    def from_dict(cls, data):
+        """Luo QSO vanhanmallisesta sanakirjasta"""
+        return cls(timestamp_to_epoch(data['timestamp']), data['call'], data['band'], data['mode'],
+                   data.get('rst_sent', ''), data.get('rst_rcvd', ''), data.get('comment', ''),
+                   data.get('my_gridsquare', ''), data.get('their_wwff', ''))
+
+    def to_dict(self):
+        return {field: self[field] for field in self.FIELDS}
+
+    def copy(self):
+        """Kopio muokkausta varten (lokissa olevaa QSO:ta ei muuteta paikallaan)"""
+        qso = QSO(self.epoch, self.call, self.band, self.mode, self.rst_sent, self.rst_rcvd,
+                  self.comment, self.my_gridsquare, self.their_wwff, self.qso_id)
+        qso.uid = self.uid
+        return qso
+
+    @property
+    def day(self):
+        """UTC-päivänumero (epoch // 86400)"""
+        return self.epoch // SECONDS_PER_DAY
+
+    @property
+    def timestamp(self):
+        """Aika muodossa 'YYYY-MM-DD HH:MM:SS'"""
+        return epoch_timestamp(self.epoch)
+
+    @timestamp.setter
+    def timestamp(self, value):
+        self.epoch = timestamp_to_epoch(value)
+
+    @property
+    def adif_date(self):
+        """QSO_DATE-kentän arvo (YYYYMMDD)"""
+        return day_strings(self.epoch // SECONDS_PER_DAY)[1]
+
+    @property
+    def adif_time(self):
+        """TIME_ON-kentän arvo (HHMMSS)"""
+        minutes, seconds = divmod(self.epoch % SECONDS_PER_DAY, 60)
+        hours, minutes = divmod(minutes, 60)
+        return f"{hours:02d}{minutes:02d}{seconds:02d}"
+
+    def __getitem__(self, key):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        if key in self.INTERNED:
+            value = sys.intern(value)
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in self.FIELDS
+
+    def get(self, key, default=None):
+        if key not in self.FIELDS:
+            return default
+        return getattr(self, key)
+
+    def __repr__(self):
+        return f"QSO({self.timestamp} {self.call} {self.band} {self.mode})"
+
+
+# Lokitiedostojen enkoodaukset: UTF-8 ensin, muuten latin-1 (kelpaa kaikille tavuille)
+LOG_ENCODINGS = ['utf-8', 'latin-1']
+ENCODING_PREFIX_SIZE = 65536
+
+_BOM_ENCODINGS = [
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+]
+
+
+class LogFileReader:
+    """Lokitiedoston lukija, joka tunnistaa enkoodauksen yhdellä lukukerralla.
+
+    Enkoodaus päätellään tiedoston alusta (BOM tai UTF-8-kokeilu) ja loppu
+    puretaan inkrementaalisesti. Jos UTF-8 osoittautuu myöhemmin vääräksi,
+    jatketaan samoista tavuista latin-1:llä lukematta tiedostoa uudelleen.
+    Tarjoaa read(size)-metodin, joten sen voi antaa suoraan ADI-jäsentimelle.
+    """
+
+    def __init__(self, binary, prefix_size=ENCODING_PREFIX_SIZE):
+        self.binary = binary
+        self.pending = binary.read(prefix_size)
+        self.encoding = self.detect_encoding(self.pending)
+        self.decoder = codecs.getincrementaldecoder(self.encoding)()
+
+    @staticmethod
+    def detect_encoding(prefix):
+        """Päättele enkoodaus tiedoston alusta"""
+        for bom, encoding in _BOM_ENCODINGS:
+            if prefix.startswith(bom):
+                return encoding
+        
+        for encoding in LOG_ENCODINGS:
+            try:
+                # final=False sallii katkenneen monitavuisen merkin lopussa
+                codecs.getincrementaldecoder(encoding)().decode(prefix, final=False)
+                return encoding
+            except UnicodeDecodeError:
+                continue
+        return LOG_ENCODINGS[-1]
+
+    def read(self, size=-1):
+        """Lue ja pura seuraava lohko (tyhjä merkkijono vain tiedoston lopussa)"""
+        while True:
+            if self.pending is not None:
+                data = self.pending
+                self.pending = None
+            else:
+                data = self.binary.read(size)
+
+            try:
+                text = self.decoder.decode(data, final=not data)
+            except UnicodeDecodeError:
+                # UTF-8 ei kelpaa - puskuroidut tavut mukaan ja vaihda varaenkoodaukseen
+                buffered = self.decoder.getstate()[0]
+                self.encoding = LOG_ENCODINGS[-1]
+                self.decoder = codecs.getincrementaldecoder(self.encoding)()
+                text = self.decoder.decode(buffered + data, final=not data)
+
+            # Pelkkä monitavuisen merkin alku ei vielä tuota tekstiä
+            if text or not data:
+                return text
+
+    def close(self):
+        self.binary.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def open_log_stream(filename):
+    """Avaa lokitiedosto tekstivirtana enkoodauksen tunnistuksella"""
+    return LogFileReader(open(filename, 'rb'))
+
+
+@functools.lru_cache(maxsize=65536)
+def base_callsign(call):
+    """Palauta kutsun perusosa ilman maa-etuliitettä ja päätteitä (OH/DL1ABC/P -> DL1ABC)"""
+    call = call.strip().upper()
+    if '/' not in call:
+        return call
+    
+    parts = [part for part in call.split('/') if part]
+    if not parts:
+        return call
+    
+    # Varsinainen kutsu on pisin osa, jossa on sekä kirjaimia että numeroita
+    candidates = [part for part in parts
+                  if any(c.isdigit() for c in part) and any(c.isalpha() for c in part)]
+    if candidates:
+        return max(candidates, key=len)
+    return parts[0]
+
+
+# Syöttörivin kielioppi: jokainen sana luokitellaan kerran näillä lausekkeilla
+INPUT_CM_BAND_PATTERN = re.compile(r'[^,]*,(\d{1,3})')
+INPUT_BAND_PATTERN = re.compile(r'\d{1,4}')
+INPUT_CALLSIGN_PATTERN = re.compile(r'(?=[^ ]*\d)(?=[^ ]*[A-Z])\S+')
+# OHFF-1234, GMFF-12, FF-1234 (prefix 0-2 merkkiä + FF) sekä FF-OH1234
+INPUT_WWFF_PATTERN = re.compile(r'[^-]{0,2}FF-\d{1,4}|FF-[A-Z]{2}\d{1,4}')
+
+
+def parse_input_command(text):
+    """Tulkitse yksisanainen band/mode-komento: ('band', '20m'), ('mode', 'CW') tai None"""
+    match = INPUT_CM_BAND_PATTERN.fullmatch(text)
+    if match:
+        return 'band', f"{match.group(1)}cm"
+    if INPUT_BAND_PATTERN.fullmatch(text):
+        return 'band', f"{text}m"
+    if text in MODE_MAP:
+        return 'mode', MODE_MAP[text]
+    return None
+
+
+def parse_input_line(text, mode, default_rst_sent, default_rst_rcvd):
+    """Jäsennä syöttörivi yhdellä läpikäynnillä.
+
+    Palauttaa (laji, arvo): ('band', '40m'), ('mode', 'CW'), ('qso', luonnos)
+    tai (None, None). Luonnos on sanakirja, jossa call, rst_sent, rst_rcvd,
+    their_wwff ja comment.
+    """
+    tokens = text.strip().upper().split()
+    if not tokens:
+        return None, None
+    
+    if len(tokens) == 1:
+        command = parse_input_command(tokens[0])
+        if command:
+            return command
+        # Pelkkä sana kirjataan vain, jos se näyttää kutsulta
+        if not INPUT_CALLSIGN_PATTERN.fullmatch(tokens[0]):
+            return None, None
+    
+    rst_sent = default_rst_sent
+    rst_rcvd = default_rst_rcvd
+    their_wwff = ""
+    comment_parts = []
+    # Raportit saavat olla vain heti kutsun perässä: 0 = lähetetty, 1 = vastaanotettu
+    rst_position = 0
+    for token in tokens[1:]:
+        if rst_position < 2 and token.isdigit():
+            if rst_position == 0:
+                rst_sent = token
+            else:
+                rst_rcvd = token
+            rst_position += 1
+            continue
+        rst_position = 2
+        if not their_wwff and INPUT_WWFF_PATTERN.fullmatch(token):
+            their_wwff = token
+        else:
+            comment_parts.append(token)
+    
+    # CW-raportit täydennetään vasta kun molemmat raportit ovat tiedossa
+    if mode == 'CW':
+        if len(rst_sent) == 2:
+            rst_sent += '9'
+        if len(rst_rcvd) == 2:
+            rst_rcvd += '9'
+    
+    return 'qso', {
+        'call': tokens[0],
+        'rst_sent': rst_sent,
+        'rst_rcvd': rst_rcvd,
+        'their_wwff': their_wwff,
+        'comment': " ".join(comment_parts),
+    }
+
+
+INPUT_HINT_DELAY_MS = 150
+INPUT_TOKEN_PATTERN = re.compile(r'\S+')
+
+
+class InputState:
+    """Syöttörivin tila, jota päivitetään näppäinpainallusten erotuksilla.
+
+    Muutoskohtaa edeltävät valmiit sanat säilyvät, joten tavallinen
+    kirjoittaminen ja askelpalautin rivin lopussa luokittelevat uudelleen
+    vain viimeisen sanan. Luokittelu noudattaa parse_input_line-sääntöjä.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.text = ''
+        self.tokens = []
+        self.starts = []
+        self.kinds = []
+
+    def update(self, text):
+        """Päivitä tila syöttörivin uuteen tekstiin, palauta muuttuiko tila"""
+        old = self.text
+        if text == old:
+            return False
+        if text.startswith(old):
+            keep = len(old)
+        elif old.startswith(text):
+            keep = len(text)
+        else:
+            keep = len(os.path.commonprefix((old, text)))
+        
+        # Muutoskohtaan ulottuvat sanat voivat muuttua, aiemmat eivät
+        while self.tokens and self.starts[-1] + len(self.tokens[-1]) >= keep:
+            self.tokens.pop()
+            self.starts.pop()
+            self.kinds.pop()
+        position = self.starts[-1] + len(self.tokens[-1]) if self.tokens else 0
+        
+        for match in INPUT_TOKEN_PATTERN.finditer(text, position):
+            self.tokens.append(match.group().upper())
+            self.starts.append(match.start())
+            self.kinds.append(self.classify(len(self.tokens) - 1))
+        self.text = text
+        return True
+
+    def classify(self, index):
+        """Luokittele sana paikkansa ja edeltävien sanojen perusteella"""
+        token = self.tokens[index]
+        if index == 0:
+            return 'call'
+        if token.isdigit() and (index == 1 or (index == 2 and self.kinds[1] == 'rst')):
+            return 'rst'
+        if INPUT_WWFF_PATTERN.fullmatch(token):
+            return 'wwff'
+        return 'text'
+
+    @property
+    def command(self):
+        """Yksisanainen band/mode-komento tai None"""
+        if len(self.tokens) != 1:
+            return None
+        return parse_input_command(self.tokens[0])
+
+    @property
+    def call(self):
+        """Tähän mennessä kirjoitettu kutsu"""
+        if not self.tokens or self.command:
+            return ''
+        return self.tokens[0]
+
+    @property
+    def reports(self):
+        return [token for token, kind in zip(self.tokens, self.kinds) if kind == 'rst']
+
+    @property
+    def reference(self):
+        """Ensimmäinen tunnistettu WWFF-tunnus"""
+        for token, kind in zip(self.tokens, self.kinds):
+            if kind == 'wwff':
+                return token
+        return ''
+
+    def hint(self):
+        """Lyhyt kuvaus siitä, miten rivi tulkittaisiin"""
+        command = self.command
+        if command:
+            kind, value = command
+            return f"{'Band' if kind == 'band' else 'Mode'}: {value}"
+        if not self.tokens:
+            return ''
+        parts = [self.call]
+        reports = self.reports
+        if reports:
+            parts.append('/'.join(reports))
+        if self.reference:
+            parts.append(self.reference)
+        return "  ".join(parts)
+
+
+class DupeIndex:
+    """Duplikaatti-indeksi: (peruskutsu, QSO-päivä, bandi, mode) -> QSO:t.
+
+    Indeksi päivitetään aina kun QSO lisätään, muokataan tai poistetaan,
+    joten duplikaattitarkistus ei käy koko lokia läpi.
+    """
+
+    def __init__(self):
+        self.buckets = {}
+
+    @staticmethod
+    def key(qso):
+        return (base_callsign(qso.call), qso.epoch // SECONDS_PER_DAY, qso.band, qso.mode)
+
+    def add(self, qso):
+        self.buckets.setdefault(self.key(qso), []).append(qso)
+
+    def remove(self, qso):
+        """Poista QSO indeksistä (kutsuttava ennen kenttien muuttamista)"""
+        key = self.key(qso)
+        bucket = self.buckets.get(key)
+        if not bucket:
+            return
+        for i, other in enumerate(bucket):
+            if other is qso:
+                del bucket[i]
+                break
+        if not bucket:
+            del self.buckets[key]
+
+    def rebuild(self, entries):
+        self.buckets = {}
+        for qso in entries:
+            self.add(qso)
+
+    def members(self, qso):
+        """QSO:t, joilla on sama avain kuin qso:lla (duplikaattitila voi muuttua)"""
+        return list(self.buckets.get(self.key(qso), ()))
+
+    def is_duplicate(self, qso):
+        """Onko samalla avaimella jokin muu QSO kuin qso itse"""
+        bucket = self.buckets.get(self.key(qso))
+        if not bucket:
+            return False
+        return len(bucket) > 1 or bucket[0] is not qso
+
+
+def _qso_epoch(qso):
+    return qso.epoch
+
+
+class CallHistoryIndex:
+    """Kutsuhistoria: peruskutsu -> saman aseman QSO:t aikajärjestyksessä.
+
+    Uusin yhteys on listan lopussa, joten edellinen yhteys löytyy suoraan
+    ilman koko lokin läpikäyntiä.
+    """
+
+    def __init__(self):
+        self.calls = {}
+
+    def add(self, qso):
+        history = self.calls.setdefault(base_callsign(qso.call), [])
+        if not history or history[-1].epoch <= qso.epoch:
+            history.append(qso)
+        else:
+            bisect.insort(history, qso, key=_qso_epoch)
+
+    def remove(self, qso):
+        """Poista QSO indeksistä (kutsuttava ennen kenttien muuttamista)"""
+        key = base_callsign(qso.call)
+        history = self.calls.get(key)
+        if not history:
+            return
+        for i in range(len(history) - 1, -1, -1):
+            if history[i] is qso:
+                del history[i]
+                break
+        if not history:
+            del self.calls[key]
+
+    def rebuild(self, entries):
+        self.calls = {}
+        for qso in entries:
+            self.add(qso)
+
+    def history(self, call):
+        """Kaikki yhteydet asemaan aikajärjestyksessä"""
+        return self.calls.get(base_callsign(call), [])
+
+    def last_contact(self, qso):
+        """Viimeisin muu yhteys samaan asemaan kuin qso (None jos ei ole)"""
+        for other in reversed(self.history(qso.call)):
+            if other is not qso:
+                return other
+        return None
+
+
+SCP_MATCH_LIMIT = 20
+
+
+class PartialCallIndex:
+    """Super check partial: kutsut järjestettynä listana ja kolmen merkin indeksinä.
+
+    Alkuosahaku tehdään puolitushaulla järjestetystä listasta. Vähintään
+    kolmen merkin katkelmat haetaan myös kutsun keskeltä: ehdokkaat ovat
+    katkelman kolmen merkin jaksojen joukkojen leikkaus. Lisäykset kootaan
+    ja yhdistetään listaan vasta seuraavassa haussa.
+    """
+
+    def __init__(self, calls=()):
+        self.rebuild(calls)
+
+    def rebuild(self, calls):
+        self.calls = sorted({call.upper() for call in calls if call})
+        self.pending = set()
+        self.trigrams = {}
+        for call in self.calls:
+            self.index_trigrams(call)
+
+    def __len__(self):
+        return len(self.calls) + len(self.pending)
+
+    def index_trigrams(self, call):
+        for i in range(len(call) - 2):
+            self.trigrams.setdefault(call[i:i + 3], set()).add(call)
+
+    def add(self, call):
+        call = call.upper()
+        if not call or call in self.pending:
+            return
+        i = bisect.bisect_left(self.calls, call)
+        if i < len(self.calls) and self.calls[i] == call:
+            return
+        self.pending.add(call)
+        self.index_trigrams(call)
+
+    def discard(self, call):
+        call = call.upper()
+        if call in self.pending:
+            self.pending.discard(call)
+        else:
+            i = bisect.bisect_left(self.calls, call)
+            if i == len(self.calls) or self.calls[i] != call:
+                return
+            del self.calls[i]
+        for i in range(len(call) - 2):
+            members = self.trigrams.get(call[i:i + 3])
+            if members is not None:
+                members.discard(call)
+                if not members:
+                    del self.trigrams[call[i:i + 3]]
+
+    def merge_pending(self):
+        if not self.pending:
+            return
+        if len(self.pending) <= 64:
+            for call in self.pending:
+                bisect.insort(self.calls, call)
+        else:
+            # Kaksi järjestettyä jaksoa: timsort yhdistää ne lineaarisesti
+            self.calls.extend(self.pending)
+            self.calls.sort()
+        self.pending = set()
+
+    def matches(self, fragment, limit=SCP_MATCH_LIMIT):
+        """Kutsut, joissa katkelma esiintyy: ensin alkuosan osumat, sitten muut aakkosjärjestyksessä"""
+        fragment = fragment.strip().upper()
+        if not fragment:
+            return []
+        self.merge_pending()
+        
+        result = []
+        i = bisect.bisect_left(self.calls, fragment)
+        while i < len(self.calls) and len(result) < limit and self.calls[i].startswith(fragment):
+            result.append(self.calls[i])
+            i += 1
+        if len(fragment) < 3 or len(result) >= limit:
+            return result
+        
+        groups = []
+        for j in range(len(fragment) - 2):
+            members = self.trigrams.get(fragment[j:j + 3])
+            if not members:
+                return result
+            groups.append(members)
+        groups.sort(key=len)
+        candidates = groups[0].intersection(*groups[1:]) if len(groups) > 1 else groups[0]
+        inner = (call for call in candidates
+                 if fragment in call and not call.startswith(fragment))
+        result.extend(heapq.nsmallest(limit - len(result), inner))
+        return result
+
+    def load_file(self, filename):
+        """Lue MASTER.SCP-muotoinen tiedosto: yksi kutsu riviltä, #-rivit ovat kommentteja"""
+        calls = []
+        with open(filename, 'r', encoding='latin-1') as f:
+            for line in f:
+                call = line.strip()
+                if call and not call.startswith('#'):
+                    calls.append(call.split()[0])
+        self.rebuild(calls)
+        return self
+
+
+class LogStats:
+    """Lokin tilastolaskurit: yhteensä, UTC-päivittäin, bandeittain ja modeittain.
+
+    Laskurit päivitetään QSO:n lisäyksen, muokkauksen ja poiston yhteydessä.
+    """
+
+    def __init__(self):
+        self.total = 0
+        self.per_day = Counter()
+        self.per_band = Counter()
+        self.per_mode = Counter()
+
+    def add(self, qso):
+        self.total += 1
+        self.per_day[qso.epoch // SECONDS_PER_DAY] += 1
+        self.per_band[qso.band] += 1
+        self.per_mode[qso.mode] += 1
+
+    def remove(self, qso):
+        """Poista QSO laskureista (kutsuttava ennen kenttien muuttamista)"""
+        self.total -= 1
+        for counter, key in ((self.per_day, qso.epoch // SECONDS_PER_DAY),
+                             (self.per_band, qso.band),
+                             (self.per_mode, qso.mode)):
+            counter[key] -= 1
+            if counter[key] <= 0:
+                del counter[key]
+
+    def rebuild(self, entries):
+        self.__init__()
+        for qso in entries:
+            self.add(qso)
+
+    def day_count(self, day):
+        """QSO:iden määrä annettuna UTC-päivänä (päivänumero, epoch // 86400)"""
+        return self.per_day.get(day, 0)
+
+
+class SQLiteLogStore:
+    """SQLite-pohjainen lokivarasto (WAL-tila).
+
+    Jokainen lisäys, muokkaus ja poisto kirjoittaa vain yhden rivin. ADI
+    säilyy siirtomuotona: varasto pitää kirjaa siitä, onko sen sisältö
+    tallennettu ADI-tiedostoon (synced).
+    """
+
+    COLUMNS = ('epoch', 'callsign', 'band', 'mode', 'rst_sent', 'rst_rcvd',
+               'comment', 'my_gridsquare', 'their_wwff')
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS qso (
+            id INTEGER PRIMARY KEY,
+            epoch INTEGER NOT NULL,
+            callsign TEXT NOT NULL,
+            band TEXT NOT NULL,
+            mode TEXT NOT NULL,
+            rst_sent TEXT NOT NULL DEFAULT '',
+            rst_rcvd TEXT NOT NULL DEFAULT '',
+            comment TEXT NOT NULL DEFAULT '',
+            my_gridsquare TEXT NOT NULL DEFAULT '',
+            their_wwff TEXT NOT NULL DEFAULT ''
+        );
+        CREATE INDEX IF NOT EXISTS qso_callsign ON qso (callsign);
+        CREATE INDEX IF NOT EXISTS qso_epoch ON qso (epoch);
+        CREATE INDEX IF NOT EXISTS qso_band ON qso (band);
+        CREATE INDEX IF NOT EXISTS qso_mode ON qso (mode);
+        CREATE INDEX IF NOT EXISTS qso_their_wwff ON qso (their_wwff);
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(self.SCHEMA)
+        self.conn.commit()
+
+    @staticmethod
+    def row_values(qso):
+        return (qso.epoch, qso.call, qso.band, qso.mode, qso.rst_sent, qso.rst_rcvd,
+                qso.comment, qso.my_gridsquare, qso.their_wwff)
+
+    def set_synced(self, synced):
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('synced', ?)",
+                          ('1' if synced else '0',))
+
+    @property
+    def synced(self):
+        """Onko varaston sisältö tallennettu ADI-tiedostoon"""
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'synced'").fetchone()
+        return row is None or row[0] == '1'
+
+    def mark_synced(self, synced=True):
+        self.set_synced(synced)
+        self.conn.commit()
+
+    def is_newer_than(self, filename):
+        """Onko varasto päivitetty ADI-tiedoston jälkeen"""
+        try:
+            store_mtime = max(os.path.getmtime(path) for path in (self.path, self.path + '-wal')
+                              if os.path.exists(path))
+            return store_mtime > os.path.getmtime(filename) and self.count() > 0
+        except (OSError, ValueError):
+            return False
+
+    def count(self):
+        return self.conn.execute('SELECT COUNT(*) FROM qso').fetchone()[0]
+
+    def add(self, qso):
+        cursor = self.conn.execute(
+            f"INSERT INTO qso ({', '.join(self.COLUMNS)}) VALUES ({', '.join('?' * len(self.COLUMNS))})",
+            self.row_values(qso))
+        qso.qso_id = cursor.lastrowid
+        self.set_synced(False)
+        self.conn.commit()
+
+    def update(self, qso):
+        if qso.qso_id is None:
+            self.add(qso)
+            return
+        self.conn.execute(
+            f"UPDATE qso SET {', '.join(f'{column} = ?' for column in self.COLUMNS)} WHERE id = ?",
+            self.row_values(qso) + (qso.qso_id,))
+        self.set_synced(False)
+        self.conn.commit()
+
+    def remove(self, qso):
+        if qso.qso_id is None:
+            return
+        self.conn.execute('DELETE FROM qso WHERE id = ?', (qso.qso_id,))
+        self.set_synced(False)
+        self.conn.commit()
+
+    def replace_all(self, entries):
+        """Korvaa varaston sisältö (esim. ADI-tiedoston avauksen jälkeen) yhdessä transaktiossa"""
+        with self.conn:
+            self.conn.execute('DELETE FROM qso')
+            insert = f"INSERT INTO qso ({', '.join(self.COLUMNS)}) VALUES ({', '.join('?' * len(self.COLUMNS))})"
+            for qso in entries:
+                qso.qso_id = self.conn.execute(insert, self.row_values(qso)).lastrowid
+            self.set_synced(True)
+
+    def load(self):
+        """Lue kaikki QSO:t aikajärjestyksessä"""
+        rows = self.conn.execute(
+            f"SELECT id, {', '.join(self.COLUMNS)} FROM qso ORDER BY epoch, id")
+        return [QSO(epoch, call, band, mode, rst_sent, rst_rcvd, comment, my_gridsquare, their_wwff, qso_id)
+                for (qso_id, epoch, call, band, mode, rst_sent, rst_rcvd,
+                     comment, my_gridsquare, their_wwff) in rows]
+
+    def close(self):
+        self.conn.close()
+
+
+class AdifTimeError(ValueError):
+    """ADI-tietueen aikatieto puuttuu tai on väärän muotoinen"""
+
+
+def adif_record_epoch(tags):
+    """ADI-tietueen aika UTC-epoch-sekunteina (kenttien arvot valmiiksi siistittyinä).
+
+    Puuttuva tai väärän pituinen päivä/aika nostaa AdifTimeErrorin,
+    olematon päivä tai kellonaika ValueErrorin.
+    """
+    # Tukee sekä QSO_DATE että DATE kenttää
+    qso_date = adif_digits(tags.get('QSO_DATE') or tags.get('DATE') or '')
+    time_on = adif_digits(tags.get('TIME_ON') or tags.get('TIME_OFF') or '')
+    
+    if not qso_date or not time_on:
+        raise AdifTimeError(f"Puutteellinen aikatieto: {tags.get('CALL', 'UNKNOWN')}")
+    
+    if len(qso_date) != 8:
+        raise AdifTimeError(f"Virheellinen QSO_DATE: {qso_date}")
+    
+    if len(time_on) == 4:
+        time_on += '00'
+    elif len(time_on) != 6:
+        raise AdifTimeError(f"Virheellinen TIME_ON: {time_on}")
+    
+    return adif_epoch(qso_date, time_on)
+
+
+def qso_from_adif_tags(tags, default_band, default_mode, default_rst_sent, default_rst_rcvd):
+    """Muunna yhden ADI-tietueen kentät QSO-tietueeksi (None jos virheellinen).
+
+    Puuttuvat bandi, mode ja raportit täydennetään annetuilla oletuksilla.
+    """
+    if 'CALL' not in tags:
+        return None
+    
+    # Arvot luetaan pituuden mukaan, joten ylimääräiset välilyönnit pois
+    tags = {name: value.strip() for name, value in tags.items()}
+    
+    try:
+        try:
+            epoch = adif_record_epoch(tags)
+        except AdifTimeError as e:
+            print(e)
+            return None
+        
+        band = tags.get('BAND', default_band).upper()
+        if band.endswith('CM') and band[:-2].isdigit():
+            band = band[:-2] + 'cm'
+        elif band.endswith('M') and band[:-1].isdigit():
+            band = band[:-1] + 'm'
+        
+        mode = tags.get('MODE', default_mode).upper()
+        mode = MODE_MAP.get(mode, mode)
+        
+        rst_sent = tags.get('RST_SENT')
+        rst_rcvd = tags.get('RST_RCVD')
+        if not rst_sent or rst_sent == '0':
+            rst_sent = default_rst_sent
+        if not rst_rcvd or rst_rcvd == '0':
+            rst_rcvd = default_rst_rcvd
+        
+        comment = tags.get('COMMENT', '')
+        if not comment:
+            comment = tags.get('QSLMSG', tags.get('REMARKS', tags.get('NOTES', '')))
+        
+        # Etsi vasta-aseman WWFF-tunnus (tukee sekä SIG_INFO että WWFF_REF)
+        their_wwff = ""
+        if 'SIG_INFO' in tags and tags.get('SIG') == 'WWFF':
+            their_wwff = tags['SIG_INFO']
+        elif 'WWFF_REF' in tags:
+            their_wwff = tags['WWFF_REF']
+        
+        return QSO(
+            epoch=epoch,
+            call=tags['CALL'],
+            band=band,
+            mode=mode,
+            rst_sent=rst_sent,
+            rst_rcvd=rst_rcvd,
+            comment=comment,
+            my_gridsquare=tags.get('MY_GRIDSQUARE', ''),
+            their_wwff=their_wwff
+        )
+        
+    except Exception as e:
+        print(f"Virhe QSO:n jäsentämisessä: {e}")
+        print(f"Tags: {tags}")
+        return None
+
+
+LOAD_BLOCK_SIZE = 1 << 20     # Taustalatauksen lohko (tavua)
+LOAD_CHUNK_RECORDS = 5000     # Tietueita per viesti, kun luetaan alusta loppuun
+ADIF_EOR_BYTES = re.compile(rb'<eor>', re.IGNORECASE)
+
+
+class LogLoader:
+    """Lataa ADI-lokin taustasäikeessä ja lähettää QSO:t paloina Tk-säikeelle.
+
+    Tiedosto luetaan lopusta alkuun tietueen rajoilla katkaistuina lohkoina,
+    joten uusimmat QSO:t ovat näkyvissä heti. Jos lohkoraja osuu kentän arvon
+    sisään (arvo katkeaa), lataus aloitetaan alusta tavallisella jäsentimellä.
+    Viestit jonossa messages: ('prepend' | 'append', qsot, luetut tavut),
+    ('restart', None, 0), ('done', None, tavut) tai ('error', poikkeus, 0).
+    """
+
+    def __init__(self, filename, convert, block_size=LOAD_BLOCK_SIZE):
+        self.filename = filename
+        self.convert = convert
+        self.block_size = block_size
+        self.total = os.path.getsize(filename)
+        self.messages = queue.Queue()
+        self.cancelled = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='LogLoader', daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def run(self):
+        try:
+            if not self.load_backwards():
+                self.messages.put(('restart', None, 0))
+                self.load_forwards()
+            if not self.cancelled.is_set():
+                self.messages.put(('done', None, self.total))
+        except Exception as e:
+            self.messages.put(('error', e, 0))
+
+    def load_backwards(self):
+        """Lue lohkot lopusta alkuun; False jos tiedostoa ei voi jakaa luotettavasti"""
+        with open(self.filename, 'rb') as f:
+            if LogFileReader.detect_encoding(f.read(4)) == 'utf-16':
+                return False
+            
+            end = self.total
+            while end > 0:
+                if self.cancelled.is_set():
+                    return True
+                start = self.block_start(f, end)
+                f.seek(start)
+                data = f.read(end - start)
+                
+                encoding = LogFileReader.detect_encoding(data)
+                try:
+                    text = data.decode(encoding if start or encoding != 'utf-8' else 'utf-8-sig')
+                    records = list(iter_adif_records(io.StringIO(text), strict=True))
+                except ValueError:
+                    return False
+                
+                qsos = [qso for qso in map(self.convert, records) if qso is not None]
+                self.messages.put(('prepend', qsos, self.total - start))
+                end = start
+        return True
+
+    def block_start(self, f, end):
+        """Lohkon alku: ensimmäisen <EOR>:n jälkeen kohtaa end edeltävällä alueella"""
+        size = self.block_size
+        while end - size > 0:
+            start = end - size
+            f.seek(start)
+            match = ADIF_EOR_BYTES.search(f.read(size))
+            if match and start + match.end() < end:
+                return start + match.end()
+            size *= 2
+        return 0
+
+    def load_forwards(self):
+        """Tavallinen jäsennys alusta loppuun"""
+        with open_log_stream(self.filename) as stream:
+            qsos = []
+            for tags in iter_adif_records(stream):
+                if self.cancelled.is_set():
+                    return
+                qso = self.convert(tags)
+                if qso is not None:
+                    qsos.append(qso)
+                if len(qsos) >= LOAD_CHUNK_RECORDS:
+                    self.messages.put(('append', qsos, stream.binary.tell()))
+                    qsos = []
+            self.messages.put(('append', qsos, self.total))
+
+
+class QsoJournal:
+    """Lisäyspohjainen muutosloki ADI-tiedoston vieressä.
+
+    Jokainen lisätty, muokattu tai poistettu QSO kirjoitetaan yhdeksi
+    JSON-riviksi ja fsync'ataan heti. Kaatumisen jälkeen rivit ajetaan
+    viimeksi tallennetun ADI-tiedoston päälle; ADI kirjoitetaan kokonaan
+    uudelleen vain käyttäjän tallentaessa, jolloin journaali tyhjennetään.
+    Muokkaukset ja poistot viittaavat kohde-QSO:n tallennettuihin kenttiin
+    (kutsu ja aika, tarkemmin koko tietue), eivät paikkaan lokissa. Jos
+    kohdetta ei löydy, toisto pysähtyy ja syy jää replay_error-kenttään.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        self.replay_error = None
+
+    @staticmethod
+    def target_key(qso):
+        """Kohteen tunniste: kutsu ja aika (QSO tai sen to_dict)"""
+        return (qso['call'].strip().upper(), qso['timestamp'])
+
+    @staticmethod
+    def entry(op, target=None, qso=None):
+        entry = {'op': op}
+        if target is not None:
+            entry['target'] = target.to_dict()
+        if qso is not None:
+            entry['qso'] = qso.to_dict()
+        return json.dumps(entry, ensure_ascii=False) + '\n'
+
+    def write(self, lines):
+        if self.file is None:
+            self.file = open(self.path, 'a', encoding='utf-8')
+        self.file.write(''.join(lines))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def append(self, op, target=None, qso=None):
+        """Kirjaa muutos; target on muokattava tai poistettava QSO ennen muutosta"""
+        self.write([self.entry(op, target, qso)])
+
+    def record_changes(self, saved, entries):
+        """Kirjaa tyhjään journaaliin ero tallennetun lokin (saved) ja entries-listan välillä.
+
+        Kentiltään samat QSO:t pariutetaan keskenään. Tallennetuista jäljelle
+        jääneet muuttuvat muokkauksiksi, jos entries-listassa on saman
+        tunnisteen QSO, muuten poistoiksi; loput entries-listasta lisäyksiksi.
+        Palauttaa kirjattujen muutosten määrän.
+        """
+        def fingerprint(qso):
+            return tuple(qso[field] for field in QSO.FIELDS)
+
+        saved_counts = Counter(map(fingerprint, saved))
+        new = []
+        for qso in entries:
+            key = fingerprint(qso)
+            if saved_counts[key]:
+                saved_counts[key] -= 1
+            else:
+                new.append(qso)
+        new_by_target = {}
+        for qso in new:
+            new_by_target.setdefault(self.target_key(qso), []).append(qso)
+
+        lines = []
+        edited = set()
+        for qso in saved:
+            key = fingerprint(qso)
+            if not saved_counts[key]:
+                continue
+            saved_counts[key] -= 1
+            candidates = new_by_target.get(self.target_key(qso))
+            if candidates:
+                updated = candidates.pop(0)
+                edited.add(id(updated))
+                lines.append(self.entry('edit', qso, updated))
+            else:
+                lines.append(self.entry('delete', qso))
+        lines.extend(self.entry('add', qso=qso) for qso in new if id(qso) not in edited)
+        if lines:
+            self.write(lines)
+        return len(lines)
+
+    @property
+    def rotated_path(self):
+        return self.path + '.saving'
+
+    def replay(self, entries):
+        """Aja journaalin muutokset lokiin, palauttaa toistettujen muutosten määrän"""
+        self.replay_error = None
+        applied = 0
+        positions = None     # tunniste -> paikat lokissa, rakennetaan ensimmäisestä viittauksesta
+        removed = False
+
+        def locate(target):
+            nonlocal positions
+            if positions is None:
+                positions = {}
+                for i, qso in enumerate(entries):
+                    positions.setdefault(self.target_key(qso), []).append(i)
+            candidates = positions.get(self.target_key(target), [])
+            # Kentiltään identtinen ensin (saman kutsun ja ajan kaksoiskappaleet)
+            for i in candidates:
+                if entries[i].to_dict() == target:
+                    return i
+            return candidates[0] if candidates else None
+
+        def move(i, old, new):
+            if positions is None:
+                return
+            if old is not None:
+                positions[self.target_key(old)].remove(i)
+            if new is not None:
+                positions.setdefault(self.target_key(new), []).append(i)
+
+        try:
+            for path in (self.rotated_path, self.path):
+                if not os.path.exists(path):
+                    continue
+                with open(path, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        try:
+                            entry = json.loads(line)
+                            op = entry['op']
+                            if op == 'add':
+                                qso = QSO.from_dict(entry['qso'])
+                                entries.append(qso)
+                                move(len(entries) - 1, None, qso)
+                            elif op in ('edit', 'delete'):
+                                target = entry['target']
+                                index = locate(target)
+                                if index is None:
+                                    self.replay_error = (f"Journaalin kohdetta ei löytynyt: "
+                                                         f"{target['call']} {target['timestamp']}")
+                                    print(f"Journaalin toisto pysähtyi: {self.replay_error}")
+                                    return applied
+                                old = entries[index]
+                                if op == 'edit':
+                                    qso = QSO.from_dict(entry['qso'])
+                                    qso.qso_id = entries[index].qso_id
+                                    entries[index] = qso
+                                    move(index, old, qso)
+                                else:
+                                    entries[index] = None
+                                    move(index, old, None)
+                                    removed = True
+                            else:
+                                continue
+                        except (ValueError, KeyError, TypeError) as e:
+                            # Kesken jäänyt viimeinen rivi (kaatuminen kirjoituksen aikana)
+                            print(f"Journaalin toisto pysähtyi: {e}")
+                            return applied
+                        applied += 1
+            return applied
+        finally:
+            if removed:
+                entries[:] = [qso for qso in entries if qso is not None]
+
+    def rotate(self):
+        """Siirrä journaali sivuun tallennuksen ajaksi.
+
+        Tallennuksen aikana tulevat muutokset kirjoitetaan uuteen journaaliin.
+        Siirretty tiedosto poistetaan kun ADI on levyllä, tai palautetaan
+        journaalin alkuun jos tallennus epäonnistuu.
+        """
+        self.close()
+        if os.path.exists(self.path):
+            os.replace(self.path, self.rotated_path)
+        return self.rotated_path
+
+    def restore(self, rotated, newer=None):
+        """Palauta sivuun siirretty journaali (tallennus epäonnistui)"""
+        self.close()
+        parts = [rotated, self.path]
+        if newer is not None and newer is not self:
+            newer.close()
+            parts.append(newer.path)
+        
+        content = []
+        for path in parts:
+            if os.path.exists(path):
+                with open(path, 'r', encoding='utf-8') as f:
+                    content.append(f.read())
+        write_file_atomic(self.path, ''.join(content))
+        if os.path.exists(rotated):
+            os.remove(rotated)
+        if newer is not None and newer is not self and os.path.exists(newer.path):
+            os.remove(newer.path)
+
+    def clear(self):
+        """Tyhjennä journaali (loki on tallennettu ADI-tiedostoon)"""
+        self.close()
+        for path in (self.path, self.rotated_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+ADI_WRITE_BATCH = 1000   # Tietueita per kirjoitettava pala
+
+
+def adi_header_lines():
+    """ADI-otsakkeen rivit"""
+    return [
+        "<ADIF_VER:5>3.1.0",
+        "<CREATED_TIMESTAMP:15>%s" % datetime.datetime.now(datetime.UTC).strftime('%Y%m%d %H%M%S'),
+        "<PROGRAMID:7>HamLogger",
+        "<PROGRAMVERSION:5>1.0.0",
+        "<EOH>",
+    ]
+
+
+def adi_record_lines(qso, mycall, mywwff=''):
+    """Yhden QSO:n ADI-rivit <EOR>-merkkiin asti"""
+    record = []
+    record.append(f"<STATION_CALLSIGN:{len(mycall)}>{mycall}")
+    record.append(f"<CALL:{len(qso.call)}>{qso.call}")
+    record.append(f"<QSO_DATE:8>{qso.adif_date}")
+    record.append(f"<TIME_ON:6>{qso.adif_time}")
+    record.append(f"<BAND:{len(qso.band)}>{qso.band}")
+    record.append(f"<MODE:{len(qso.mode)}>{qso.mode}")
+    record.append(f"<RST_SENT:{len(qso.rst_sent)}>{qso.rst_sent}")
+    record.append(f"<RST_RCVD:{len(qso.rst_rcvd)}>{qso.rst_rcvd}")
+    
+    # Oma WWFF (MY_SIG_INFO)
+    if mywwff:
+        record.append(f"<MY_SIG:4>WWFF")
+        record.append(f"<MY_SIG_INFO:{len(mywwff)}>{mywwff}")
+    
+    # Vasta-aseman WWFF (SIG ja SIG_INFO)
+    if qso.their_wwff:
+        record.append(f"<SIG:4>WWFF")
+        record.append(f"<SIG_INFO:{len(qso.their_wwff)}>{qso.their_wwff}")
+    
+    if qso.my_gridsquare:
+        record.append(f"<MY_GRIDSQUARE:{len(qso.my_gridsquare)}>{qso.my_gridsquare}")
+    
+    if qso.comment:
+        record.append(f"<COMMENT:{len(qso.comment)}>{qso.comment}")
+    
+    record.append(f"<OPERATOR:{len(mycall)}>{mycall}")
+    record.append("<EOR>")
+    return record
+
+
+def render_adi(entries, mycall, mywwff=''):
+    """Luo ADI-muotoinen sisältö.
+
+    Ei käytä sovelluksen tilaa, joten sitä voi kutsua taustasäikeestä
+    lokin tilannekuvalle.
+    """
+    adi_content = adi_header_lines()
+    for qso in entries:
+        adi_content.extend(adi_record_lines(qso, mycall, mywwff))
+    return "\n".join(adi_content)
+
+
+def iter_adi_chunks(entries, mycall, mywwff=''):
+    """Sama sisältö kuin render_adi paloina, kun koko lokia ei haluta muistiin"""
+    yield "\n".join(adi_header_lines())
+    batch = []
+    records = 0
+    for qso in entries:
+        batch.extend(adi_record_lines(qso, mycall, mywwff))
+        records += 1
+        if records == ADI_WRITE_BATCH:
+            yield "\n" + "\n".join(batch)
+            batch = []
+            records = 0
+    if batch:
+        yield "\n" + "\n".join(batch)
+
+
+class Counted:
+    """Iteraattori, joka laskee läpi menneet alkiot"""
+
+    def __init__(self, iterable):
+        self.iterator = iter(iterable)
+        self.count = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        item = next(self.iterator)
+        self.count += 1
+        return item
+
+
+def unique_in_time_order(qsos):
+    """Ohita saman kutsun ja ajan kaksoiskappaleet aikajärjestetystä virrasta.
+
+    Muistissa pidetään vain saman sekunnin kutsut, joten virta voi olla
+    mielivaltaisen pitkä. Samanaikaisista ensimmäinen jää voimaan.
+    """
+    epoch = None
+    calls = set()
+    for qso in qsos:
+        if qso.epoch != epoch:
+            epoch = qso.epoch
+            calls = set()
+        if qso.call not in calls:
+            calls.add(qso.call)
+            yield qso
+
+
+MERGE_TOLERANCE_MINUTES = 3   # Oletusikkuna lähekkäisille kaksoiskappaleille
+
+
+def near_duplicate_key(qso, exact_call=False):
+    """Sama yhteys: peruskutsu (tai koko kutsu), bandi ja mode"""
+    call = qso.call.upper() if exact_call else base_callsign(qso.call)
+    return (call, qso.band.lower(), qso.mode.upper())
+
+
+class NearDuplicateFilter:
+    """Lähekkäisten kaksoiskappaleiden poisto pyyhkäisyllä aikajärjestyksessä.
+
+    Kaksi QSO:ta on sama yhteys, jos near_duplicate_key täsmää ja aikaero on
+    korkeintaan tolerance sekuntia (eri ohjelmat kirjaavat saman yhteyden
+    hieman eri aikaan). Kutsuja verrataan peruskutsuina, tai exact_call=True
+    vaatii koko kutsun (A1A ja A1A/P ovat silloin eri yhteydet).
+
+    QSO:t annetaan add()-metodille aikajärjestyksessä; muistissa pidetään
+    vain ikkunan sisällä säilytetyt QSO:t, joten koko poisto on
+    järjestämisen jälkeen lineaarinen.
+
+    protected=True merkitsee QSO:n, jota ei koskaan poisteta (esim. lokissa
+    jo oleva). Jos sellainen osuu aiemmin säilytetyn suojaamattoman QSO:n
+    ikkunaan, suojaamaton poistetaan jälkikäteen. Yhdistetyt parit
+    kirjataan listaan merged muodossa (säilytetty, poistettu).
+    """
+
+    def __init__(self, tolerance=MERGE_TOLERANCE_MINUTES * 60, exact_call=False):
+        self.tolerance = tolerance
+        self.exact_call = exact_call
+        self.recent = {}        # avain -> [(QSO, suojattu), ...] ikkunassa
+        self.window = deque()   # (aika, avain, alkio) lisäysjärjestyksessä
+        self.merged = []
+
+    def expire(self, epoch):
+        while self.window and self.window[0][0] < epoch - self.tolerance:
+            _, key, item = self.window.popleft()
+            bucket = self.recent.get(key, ())
+            for i, other in enumerate(bucket):
+                if other is item:
+                    del bucket[i]
+                    break
+            if not bucket:
+                self.recent.pop(key, None)
+
+    def add(self, qso, protected=False):
+        """Käsittele seuraava QSO, palauta True jos se säilytetään (toistaiseksi)"""
+        self.expire(qso.epoch)
+        key = near_duplicate_key(qso, self.exact_call)
+        bucket = self.recent.get(key)
+        if bucket and not protected:
+            self.merged.append((bucket[0][0], qso))
+            return False
+        if bucket:
+            # Suojattu QSO korvaa ikkunan suojaamattomat
+            for other, other_protected in bucket:
+                if not other_protected:
+                    self.merged.append((qso, other))
+            bucket[:] = [item for item in bucket if item[1]]
+        item = (qso, protected)
+        self.recent.setdefault(key, []).append(item)
+        self.window.append((qso.epoch, key, item))
+        return True
+
+    def filter(self, qsos):
+        """Säilytetyt QSO:t aikajärjestetystä virrasta (ilman suojattuja)"""
+        for qso in qsos:
+            if self.add(qso):
+                yield qso
+
+    def dropped(self):
+        """Poistettujen QSO:iden id:t"""
+        return {id(qso) for _, qso in self.merged}
+
+
+def drop_near_duplicates(existing, incoming, tolerance=MERGE_TOLERANCE_MINUTES * 60,
+                         exact_call=False):
+    """incoming ilman lähekkäisiä kaksoiskappaleita keskenään tai existing-QSO:iden kanssa.
+
+    Palauttaa (säilytetyt alkuperäisessä järjestyksessä, yhdistetyt parit).
+    existing-QSO:ita ei poisteta; niistä käydään läpi vain tuotavien
+    aikaväli ikkunan verran laajennettuna.
+    """
+    incoming = list(incoming)
+    if not incoming:
+        return [], []
+    ordered = sorted(incoming, key=_qso_epoch)
+    start = ordered[0].epoch - tolerance
+    end = ordered[-1].epoch + tolerance
+    nearby = sorted((qso for qso in existing if start <= qso.epoch <= end), key=_qso_epoch)
+    # Samalla hetkellä olemassa oleva QSO käsitellään ensin
+    stream = heapq.merge(((qso, True) for qso in nearby), ((qso, False) for qso in ordered),
+                         key=lambda item: (item[0].epoch, not item[1]))
+    dedupe = NearDuplicateFilter(tolerance, exact_call)
+    for qso, protected in stream:
+        dedupe.add(qso, protected)
+    dropped = dedupe.dropped()
+    return [qso for qso in incoming if id(qso) not in dropped], dedupe.merged
+
+
+def describe_near_duplicate(kept, dropped):
+    """Raporttirivi yhdistetystä parista"""
+    return (f"{dropped.timestamp} {dropped.call} {dropped.band} {dropped.mode} -> "
+            f"{kept.timestamp} {kept.call}")
+
+
+MERGE_RUN_RECORDS = 200000   # QSO:ta muistissa ennen kuin ajo kirjoitetaan levylle
+MERGE_FAN_IN = 64            # Yhtä aikaa auki olevat ajotiedostot yhdistettäessä
+MERGE_BATCH = 1000           # QSO:ta per pickle-lohko ajotiedostossa
+
+# Ajotiedostoon tallennettavat kentät QSO-konstruktorin järjestyksessä
+_run_fields = operator.attrgetter('epoch', 'call', 'band', 'mode', 'rst_sent', 'rst_rcvd',
+                                  'comment', 'my_gridsquare', 'their_wwff')
+
+
+def write_sorted_run(qsos, directory):
+    """Kirjoita aikajärjestetyt QSO:t ajotiedostoon, palauta polku"""
+    fd, path = tempfile.mkstemp(dir=directory, suffix='.run')
+    with os.fdopen(fd, 'wb') as f:
+        batch = []
+        for qso in qsos:
+            batch.append(_run_fields(qso))
+            if len(batch) >= MERGE_BATCH:
+                pickle.dump(batch, f, pickle.HIGHEST_PROTOCOL)
+                batch = []
+        if batch:
+            pickle.dump(batch, f, pickle.HIGHEST_PROTOCOL)
+    return path
+
+
+def read_sorted_run(path):
+    """Ajotiedoston QSO:t virtana"""
+    with open(path, 'rb') as f:
+        while True:
+            try:
+                batch = pickle.load(f)
+            except EOFError:
+                return
+            for fields in batch:
+                yield QSO(*fields)
+
+
+class SortedRuns:
+    """Ulkoinen lajittelu QSO:ille rajatulla muistilla.
+
+    QSO:t kerätään muistiin, ja kun run_records täyttyy, puskuri
+    järjestetään ja kirjoitetaan ajotiedostoksi hakemistoon directory.
+    Iteroitaessa ajot yhdistetään kekolomituksella aikajärjestykseen;
+    jos ajoja on enemmän kuin MERGE_FAN_IN, niitä yhdistetään ensin
+    suuremmiksi ajoiksi. Samanaikaiset QSO:t säilyvät lisäysjärjestyksessä.
+    Hakemiston siivoaa kutsuja (esim. tempfile.TemporaryDirectory).
+    """
+
+    def __init__(self, directory, run_records=MERGE_RUN_RECORDS):
+        self.directory = directory
+        self.run_records = run_records
+        self.buffer = []
+        self.paths = []
+        self.count = 0
+
+    def add_all(self, qsos):
+        for qso in qsos:
+            self.buffer.append(qso)
+            self.count += 1
+            if len(self.buffer) >= self.run_records:
+                self.spill()
+
+    def spill(self):
+        """Kirjoita puskuri järjestettynä ajotiedostoksi"""
+        if not self.buffer:
+            return
+        self.buffer.sort(key=_qso_epoch)
+        self.paths.append(write_sorted_run(self.buffer, self.directory))
+        self.buffer = []
+
+    def add_paths(self, paths, count):
+        """Lisää muualla (esim. toisessa prosessissa) kirjoitetut ajot"""
+        self.paths.extend(paths)
+        self.count += count
+
+    def __len__(self):
+        return self.count
+
+    def reduce(self):
+        """Yhdistä ajoja, kunnes niitä on korkeintaan MERGE_FAN_IN"""
+        while len(self.paths) > MERGE_FAN_IN:
+            merged = []
+            for start in range(0, len(self.paths), MERGE_FAN_IN):
+                group = self.paths[start:start + MERGE_FAN_IN]
+                runs = [read_sorted_run(path) for path in group]
+                merged.append(write_sorted_run(heapq.merge(*runs, key=_qso_epoch), self.directory))
+                for path in group:
+                    os.remove(path)
+            self.paths = merged
+
+    def __iter__(self):
+        self.reduce()
+        self.buffer.sort(key=_qso_epoch)
+        runs = [read_sorted_run(path) for path in self.paths]
+        runs.append(iter(self.buffer))
+        return heapq.merge(*runs, key=_qso_epoch)
+
+
+def entries_between(entries, start_epoch, end_epoch):
+    """QSO:t aikaväliltä start_epoch <= aika < end_epoch"""
+    return [qso for qso in entries if start_epoch <= qso.epoch < end_epoch]
+
+
+def write_file_atomic(filename, content):
+    """Kirjoita tiedosto turvallisesti: väliaikaistiedosto, fsync ja os.replace.
+
+    content on merkkijono tai merkkijonopalojen iteraattori (esim.
+    iter_adi_chunks). Kaatuminen kesken kirjoituksen jättää vanhan
+    tiedoston ennalleen.
+    """
+    directory = os.path.dirname(os.path.abspath(filename))
+    fd, temp_path = tempfile.mkstemp(prefix=f".{os.path.basename(filename)}.",
+                                     suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            if isinstance(content, str):
+                f.write(content)
+            else:
+                for chunk in content:
+                    f.write(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            os.chmod(temp_path, os.stat(filename).st_mode & 0o7777)
+        except FileNotFoundError:
+            os.chmod(temp_path, 0o644)
+        os.replace(temp_path, filename)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+    
+    # Uudelleennimeäminen pysyväksi myös hakemistossa (POSIX)
+    if hasattr(os, 'O_DIRECTORY'):
+        try:
+            dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+        except OSError:
+            pass
+
+
+class AdiWriter:
+    """Taustasäie, joka muodostaa ja kirjoittaa ADI-tiedostot.
+
+    Tk-säie antaa tilannekuvan lokista (lista QSO-olioista, joita ei muokata
+    paikallaan) ja jatkaa heti. Valmistuneet kirjoitukset haetaan Tk-säikeessä
+    poll()-metodilla, joten takaisinkutsut ajetaan aina Tk-säikeessä.
+    Kirjoitukset tehdään jättämisjärjestyksessä.
+    """
+
+    def __init__(self):
+        self.jobs = queue.Queue()
+        self.done = queue.Queue()
+        self.pending = 0
+        self.thread = threading.Thread(target=self.run, name='AdiWriter', daemon=True)
+        self.thread.start()
+
+    def submit(self, filename, render, entries, on_done, after_write=None):
+        """Jonoon kirjoitus; after_write ajetaan taustasäikeessä heti onnistuneen kirjoituksen jälkeen"""
+        self.pending += 1
+        self.jobs.put((filename, render, list(entries), on_done, after_write))
+
+    def run(self):
+        while True:
+            filename, render, entries, on_done, after_write = self.jobs.get()
+            error = None
+            try:
+                write_file_atomic(filename, render(entries))
+                if after_write is not None:
+                    after_write()
+            except Exception as e:
+                error = e
+            self.done.put((on_done, filename, error))
+            self.jobs.task_done()
+
+    def poll(self):
+        """Valmistuneet kirjoitukset: [(on_done, filename, error), ...]"""
+        results = []
+        while True:
+            try:
+                results.append(self.done.get_nowait())
+            except queue.Empty:
+                break
+        self.pending -= len(results)
+        return results
+
+    def wait(self):
+        """Odota kunnes kaikki jonossa olevat kirjoitukset ovat valmiit"""
+        self.jobs.join()
+
+
+BACKUP_KEEP = 10          # Säilytettävien backup-sarjojen määrä
+BACKUP_MAX_DELTAS = 30    # Delta-osia ennen uutta täyttä backupia
+
+
+class BackupManifest:
+    """Backup-hakemiston sisältö muistissa.
+
+    Backupit ovat sarjoja: täysi ADI-tiedosto ja sen perään delta-osat,
+    joissa on vain edellisen backupin jälkeen lisätyt QSO:t. Delta-osa
+    nimetään täyden tiedoston mukaan (backup_<aika>_<loki>.delta001.adi),
+    joten sarjan voi palauttaa yhdistämällä tiedostot järjestyksessä.
+    Saman sekunnin sarjoille lisätään aikaan järjestysnumero (<aika>-2).
+    Hakemisto luetaan vain kerran; sen jälkeen luettelo pidetään muistissa.
+    """
+
+    def __init__(self, backup_dir, keep=BACKUP_KEEP, max_deltas=BACKUP_MAX_DELTAS):
+        self.backup_dir = backup_dir
+        self.keep = keep
+        self.max_deltas = max_deltas
+        self.chains = []        # [[täysi, delta1, ...], ...] vanhin ensin
+        self.log_name = None    # Viimeisimmän sarjan loki
+        self.count = 0          # QSO-määrä viimeisimmässä backupissa
+        self.load()
+
+    def load(self):
+        """Lue olemassa olevat backupit hakemistosta (vain käynnistyksessä)"""
+        chains = {}
+        try:
+            for file in os.listdir(self.backup_dir):
+                if not (file.startswith('backup_') and file.endswith('.adi')):
+                    continue
+                path = os.path.join(self.backup_dir, file)
+                base, sep, _ = file.partition('.delta')
+                key = os.path.join(self.backup_dir, base + '.adi') if sep else path
+                chains.setdefault(key, []).append(path)
+        except OSError as e:
+            print(f"Backup-hakemiston luku epäonnistui: {e}")
+        
+        for paths in chains.values():
+            paths.sort()
+        self.chains = sorted(chains.values(), key=lambda paths: self.mtime(paths[0]))
+
+    @staticmethod
+    def mtime(path):
+        try:
+            return os.path.getmtime(path)
+        except OSError:
+            return 0
+
+    def plan(self, log_name, entries, full=False):
+        """Valitse seuraava backup: delta-osa jos mahdollista, muuten täysi tiedosto.
+
+        Palauttaa (polku, kirjoitettavat QSO:t) ja päivittää luettelon.
+        """
+        chain = self.chains[-1] if self.chains else None
+        if (full or chain is None or log_name != self.log_name or
+                len(entries) < self.count or len(chain) > self.max_deltas):
+            path = self.full_path(log_name)
+            chunk = entries
+            chain = [path]
+            self.chains.append(chain)
+        else:
+            path = f"{chain[0][:-len('.adi')]}.delta{len(chain):03d}.adi"
+            chunk = entries[self.count:]
+            chain.append(path)
+        
+        self.log_name = log_name
+        self.count = len(entries)
+        self.prune()
+        return path, chunk
+
+    def full_path(self, log_name):
+        """Uuden sarjan tiedostonimi; saman sekunnin sarjat erotetaan järjestysnumerolla"""
+        timestamp = datetime.datetime.now(datetime.UTC).strftime('%Y%m%d_%H%M%S')
+        name = log_name if log_name.endswith('.adi') else log_name + '.adi'
+        taken = {chain[0] for chain in self.chains}
+        path = os.path.join(self.backup_dir, f"backup_{timestamp}_{name}")
+        sequence = 1
+        while path in taken or os.path.exists(path):
+            sequence += 1
+            path = os.path.join(self.backup_dir, f"backup_{timestamp}-{sequence}_{name}")
+        return path
+
+    def prune(self):
+        """Poista vanhimmat sarjat, säilytä vain self.keep uusinta"""
+        while len(self.chains) > self.keep:
+            for path in self.chains.pop(0):
+                try:
+                    os.remove(path)
+                    print(f"Vanha backup poistettu: {os.path.basename(path)}")
+                except OSError as e:
+                    print(f"Vanhan backupin poisto epäonnistui: {e}")
+
+
+def parse_text_qso(line, default_band, default_mode, default_rst_sent, default_rst_rcvd,
+                   my_gridsquare=''):
+    """Jäsennä QSO-tietue tekstilokin rivistä (None jos rivistä ei saa QSO:ta)"""
+    try:
+        # Poista ylimääräiset välilyönnit
+        line = ' '.join(line.split())
+        
+        # Yleisimpiä lokimuotoja:
+        # 1. OH2ABC 59 59 2024-01-15 14:30 20m SSB
+        # 2. 2024-01-15 14:30 OH2ABC 20m SSB 59 59
+        # 3. OH2ABC,59,59,2024-01-15,14:30,20m,SSB (CSV)
+        
+        parts = []
+        
+        # Kokeile ensin CSV-muotoa
+        if ',' in line:
+            parts = [p.strip() for p in line.split(',')]
+        else:
+            parts = line.split()
+        
+        if len(parts) < 5:
+            return None
+        
+        qso_data = {
+            'timestamp': '',
+            'call': '',
+            'band': default_band,
+            'mode': default_mode,
+            'rst_sent': default_rst_sent,
+            'rst_rcvd': default_rst_rcvd,
+            'comment': '',
+            'my_gridsquare': my_gridsquare,
+            'their_wwff': ''
+        }
+        
+        # Etsi osat
+        for part in parts:
+            part_upper = part.upper()
+            
+            # Kutsu (sisältää numeroita ja kirjaimia)
+            if any(c.isdigit() for c in part) and any(c.isalpha() for c in part) and len(part) >= 3:
+                if not qso_data['call']:
+                    qso_data['call'] = part_upper
+            
+            # Päivämäärä (vuosi-kuukausi-päivä)
+            elif re.match(r'\d{4}-\d{2}-\d{2}', part):
+                date_part = part
+            
+            # Aika (tunnit:minuutit)
+            elif re.match(r'\d{1,2}:\d{2}', part):
+                time_part = part
+                if ':' in time_part and time_part.count(':') == 1:
+                    time_part += ':00'  # Lisää sekunnit
+            
+            # Bandit
+            elif part_upper in ['160M', '80M', '60M', '40M', '30M', '20M', '17M', '15M', '12M', '10M', '6M', '2M', '70CM']:
+                qso_data['band'] = part_upper.lower()
+            
+            # Modet
+            elif part_upper in ['SSB', 'LSB', 'USB', 'CW', 'FM', 'AM', 'FT8', 'FT4', 'RTTY', 'PSK', 'FREEDV']:
+                qso_data['mode'] = part_upper
+            
+            # RST (vain numerot, pituus 2-3)
+            elif part.isdigit() and 2 <= len(part) <= 3:
+                if qso_data['rst_sent'] == default_rst_sent:
+                    qso_data['rst_sent'] = part
+                else:
+                    qso_data['rst_rcvd'] = part
+        
+        # Yhdistä päivämäärä ja aika
+        if 'date_part' in locals() and 'time_part' in locals():
+            try:
+                datetime_obj = datetime.datetime.strptime(f"{date_part} {time_part}", '%Y-%m-%d %H:%M:%S')
+                qso_data['timestamp'] = datetime_obj.strftime('%Y-%m-%d %H:%M:%S')
+            except:
+                qso_data['timestamp'] = datetime.datetime.now(datetime.UTC).strftime('%Y-%m-%d %H:%M:%S')
+        else:
+            qso_data['timestamp'] = datetime.datetime.now(datetime.UTC).strftime('%Y-%m-%d %H:%M:%S')
+        
+        # Kommentti on kaikki muu teksti
+        comment_parts = []
+        for part in parts:
+            if (part != qso_data['call'] and 
+                part != date_part if 'date_part' in locals() else True and
+                part != time_part if 'time_part' in locals() else True and
+                part.upper() != qso_data['band'].upper() and
+                part.upper() != qso_data['mode'] and
+                part != qso_data['rst_sent'] and
+                part != qso_data['rst_rcvd']):
+                comment_parts.append(part)
+        
+        qso_data['comment'] = ' '.join(comment_parts)
+        
+        # Varmista että kaikki pakolliset kentät on täytetty
+        if qso_data['call'] and qso_data['timestamp']:
+            return QSO.from_dict(qso_data)
+        else:
+            return None
+            
+    except Exception as e:
+        print(f"Virhe rivin jäsentämisessä: {line} - {e}")
+        return None
+
+
+LATENCY_BUCKETS_PER_OCTAVE = 8     # Lokeron leveys noin 9 %
+
+
+def log_size_class(size):
+    """Lokin kokoluokan alaraja viivetilastoihin: 0, 100, 1000, 10000, ..."""
+    if size < 100:
+        return 0
+    return 10 ** (len(str(size)) - 1)
+
+
+class LatencyHistogram:
+    """Kestojen logaritminen histogrammi.
+
+    Yksittäisiä näytteitä ei säilytetä: prosenttipisteet luetaan lokeroista,
+    joten muisti ja kirjauksen hinta pysyvät vakioina.
+    """
+
+    __slots__ = ('buckets', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.buckets = Counter()
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        micros = max(seconds * 1e6, 1.0)
+        self.buckets[int(math.log2(micros) * LATENCY_BUCKETS_PER_OCTAVE)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, p):
+        """p-prosenttipiste sekunteina (lokeron yläraja, enintään suurin havainto)"""
+        if not self.count:
+            return 0.0
+        target = self.count * p / 100
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= target:
+                upper = 2 ** ((bucket + 1) / LATENCY_BUCKETS_PER_OCTAVE) / 1e6
+                return min(upper, self.max)
+        return self.max
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'mean_ms': self.total / self.count * 1000 if self.count else 0.0,
+            'p50_ms': self.percentile(50) * 1000,
+            'p95_ms': self.percentile(95) * 1000,
+            'p99_ms': self.percentile(99) * 1000,
+            'max_ms': self.max * 1000,
+        }
+
+
+class LatencyRecorder:
+    """Vaiheittaiset viivehistogrammit lokin kokoluokittain"""
+
+    def __init__(self):
+        self.histograms = {}
+        # AdiWriter kirjaa omasta säikeestään, käyttöliittymä lukee pääsäikeessä
+        self.lock = threading.Lock()
+
+    def record(self, stage, seconds, log_size):
+        key = (stage, log_size_class(log_size))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = LatencyHistogram()
+            histogram.record(seconds)
+
+    def wrap(self, stage, func, log_size):
+        """Palauta func, joka kirjaa oman kestonsa (esim. taustasäikeessä ajettava)"""
+        def timed_call(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.record(stage, time.perf_counter() - start, log_size)
+        return timed_call
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {}
+
+    def rows(self):
+        """(vaihe, kokoluokka, histogrammi) vaiheen ja kokoluokan mukaan järjestettynä"""
+        with self.lock:
+            return [(stage, size_class, self.histograms[(stage, size_class)])
+                    for stage, size_class in sorted(self.histograms)]
+
+    def snapshot(self, log_size):
+        with self.lock:
+            stages = [dict(stage=stage, log_size_class=size_class,
+                           **self.histograms[(stage, size_class)].to_dict())
+                      for stage, size_class in sorted(self.histograms)]
+        return {
+            'created': datetime.datetime.now(datetime.UTC).isoformat(timespec='seconds'),
+            'log_size': log_size,
+            'stages': stages,
+        }
+
+    def dump_json(self, filename, log_size):
+        write_file_atomic(filename, json.dumps(self.snapshot(log_size), indent=2))
+
@@ -0,0 +1,270 @@
+"""ohhamlog_core-moduulin toimintatestit.
+
+Ajetaan repositorion juuresta:
+
+    python -m pytest tests
+    python -m unittest discover -s tests
+
+Käyttää vain ohhamlog_core-moduulia, tkinteriä ei tuoda.
+"""
+import io
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(TESTS_DIR))
+
+from ohhamlog_core import (  # noqa: E402
+    QSO, LogFileReader, LogLoader, NearDuplicateFilter, QsoJournal, SortedRuns,
+    drop_near_duplicates, iter_adif_records, parse_input_line, qso_from_adif_tags,
+    render_adi, timestamp_to_epoch)
+
+
+def qso(call, timestamp='2024-05-01 12:00:00', band='20m', mode='SSB', comment=''):
+    return QSO(timestamp_to_epoch(timestamp), call, band, mode, '59', '59', comment)
+
+
+def convert(tags):
+    return qso_from_adif_tags(tags, '20m', 'SSB', '59', '59')
+
+
+def adif_field(name, value):
+    return f"<{name}:{len(value)}>{value}"
+
+
+class IterAdifRecordsTest(unittest.TestCase):
+
+    def parse(self, text, chunk_size):
+        return list(iter_adif_records(io.StringIO(text), chunk_size=chunk_size))
+
+    def test_chunk_boundaries(self):
+        text = ("otsake <ADIF_VER:5>3.1.0 <EOH>\n" +
+                "".join(adif_field('CALL', f"OH{i}ABC") + adif_field('BAND', '40m') + "<eor>\n"
+                        for i in range(50)))
+        expected = self.parse(text, len(text) + 1)
+        self.assertEqual(len(expected), 50)
+        self.assertEqual(expected[7], {'CALL': 'OH7ABC', 'BAND': '40m'})
+        # Lohkoraja jokaisessa mahdollisessa kohdassa tagia ja arvoa
+        for chunk_size in (1, 2, 3, 5, 7, 11, 16, 64):
+            with self.subTest(chunk_size=chunk_size):
+                self.assertEqual(self.parse(text, chunk_size), expected)
+
+    def test_value_containing_tags(self):
+        comment = "a<b> <EOR> <CALL:4>FAKE <"
+        text = adif_field('CALL', 'OH1AA') + adif_field('COMMENT', comment) + "<EOR>"
+        for chunk_size in (1, 4, 9, 1000):
+            with self.subTest(chunk_size=chunk_size):
+                self.assertEqual(self.parse(text, chunk_size),
+                                 [{'CALL': 'OH1AA', 'COMMENT': comment}])
+
+    def test_last_record_without_eor(self):
+        text = adif_field('CALL', 'OH1AA') + "<EOR>" + adif_field('CALL', 'OH2BB')
+        self.assertEqual(self.parse(text, 3), [{'CALL': 'OH1AA'}, {'CALL': 'OH2BB'}])
+
+    def test_truncated_value(self):
+        text = "<CALL:10>OH1"
+        self.assertEqual(self.parse(text, 4), [{'CALL': 'OH1'}])
+        with self.assertRaises(ValueError):
+            list(iter_adif_records(io.StringIO(text), chunk_size=4, strict=True))
+
+
+class LogFileReaderTest(unittest.TestCase):
+
+    def read_all(self, data, size):
+        reader = LogFileReader(io.BytesIO(data), prefix_size=4)
+        parts = []
+        while True:
+            text = reader.read(size)
+            if not text:
+                return reader.encoding, ''.join(parts)
+            parts.append(text)
+
+    def test_utf8_split_inside_character(self):
+        text = "ÄÖ" * 10 + "€"
+        for size in (1, 2, 3):
+            with self.subTest(size=size):
+                self.assertEqual(self.read_all(text.encode('utf-8'), size), ('utf-8', text))
+
+    def test_fallback_to_latin1_after_prefix(self):
+        text = "abcdefgh Häme"
+        encoding, decoded = self.read_all(text.encode('latin-1'), 3)
+        self.assertEqual(encoding, 'latin-1')
+        self.assertEqual(decoded, text)
+
+    def test_bom(self):
+        self.assertEqual(self.read_all(b'\xef\xbb\xbfOH1AA', 2), ('utf-8-sig', 'OH1AA'))
+
+
+class LogLoaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def load(self, records, block_size):
+        filename = os.path.join(self.directory.name, 'log.adi')
+        with open(filename, 'w', encoding='utf-8') as f:
+            f.write(render_adi(records, 'OH3ENK'))
+        loader = LogLoader(filename, convert, block_size=block_size)
+        loader.run()
+        kinds = []
+        chunks = []
+        while not loader.messages.empty():
+            kind, payload, _ = loader.messages.get()
+            kinds.append(kind)
+            if kind == 'restart':
+                chunks = []
+            elif kind == 'prepend':
+                chunks.insert(0, payload)
+            elif kind == 'append':
+                chunks.append(payload)
+            elif kind == 'error':
+                raise payload
+        return kinds, [(q.call, q.timestamp, q.comment) for chunk in chunks for q in chunk]
+
+    def expected(self, records):
+        return [(q.call, q.timestamp, q.comment) for q in records]
+
+    def test_backwards_in_blocks(self):
+        records = [qso(f"OH{i}AA", f"2024-05-01 12:{i:02d}:00") for i in range(40)]
+        kinds, loaded = self.load(records, block_size=256)
+        self.assertNotIn('restart', kinds)
+        self.assertGreater(kinds.count('prepend'), 1)
+        self.assertEqual(kinds[-1], 'done')
+        self.assertEqual(loaded, self.expected(records))
+
+    def test_eor_inside_value_falls_back_to_forward_load(self):
+        # Kommentin <EOR> näyttää lohkon rajalta, jolloin edellinen lohko katkeaa arvon keskeltä
+        records = [qso(f"OH{i}AA", f"2024-05-01 12:{i:02d}:00") for i in range(20)]
+        records[10].comment = "x" * 300 + " <EOR> jälkeen"
+        kinds, loaded = self.load(records, block_size=256)
+        self.assertIn('restart', kinds)
+        self.assertEqual(kinds[-1], 'done')
+        self.assertEqual(loaded, self.expected(records))
+
+
+class QsoJournalTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'log.journal')
+        self.journal = QsoJournal(self.path)
+        self.addCleanup(self.journal.close)
+
+    def test_replay_by_identity(self):
+        a, b, c = qso('OH1AA'), qso('OH2BB'), qso('OH3CC')
+        edited = a.copy()
+        edited.comment = 'muokattu'
+        self.journal.append('add', qso=c)
+        self.journal.append('edit', target=a, qso=edited)
+        self.journal.append('delete', target=b)
+        # Järjestys lokissa ei vaikuta, kohde löytyy kutsun ja ajan perusteella
+        entries = [b, a]
+        self.assertEqual(self.journal.replay(entries), 3)
+        self.assertIsNone(self.journal.replay_error)
+        self.assertEqual([(q.call, q.comment) for q in entries],
+                         [('OH1AA', 'muokattu'), ('OH3CC', '')])
+
+    def test_truncated_last_line(self):
+        self.journal.append('add', qso=qso('OH1AA'))
+        self.journal.append('add', qso=qso('OH2BB'))
+        self.journal.close()
+        line = QsoJournal.entry('add', qso=qso('OH3CC'))
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(line[:len(line) // 2])
+        entries = []
+        self.assertEqual(self.journal.replay(entries), 2)
+        self.assertEqual([q.call for q in entries], ['OH1AA', 'OH2BB'])
+
+    def test_missing_target_stops_replay(self):
+        self.journal.append('delete', target=qso('OH9XX'))
+        self.journal.append('add', qso=qso('OH1AA'))
+        entries = [qso('OH2BB')]
+        self.assertEqual(self.journal.replay(entries), 0)
+        self.assertIn('OH9XX', self.journal.replay_error)
+        self.assertEqual([q.call for q in entries], ['OH2BB'])
+
+    def test_record_changes_replays_to_current_log(self):
+        saved = [qso('OH1AA'), qso('OH2BB'), qso('OH3CC')]
+        current = [saved[0].copy(), saved[2], qso('OH4DD')]
+        current[0].comment = 'uusi'
+        self.assertEqual(self.journal.record_changes(saved, current), 3)
+        with open(self.path, encoding='utf-8') as f:
+            ops = [json.loads(line)['op'] for line in f]
+        self.assertEqual(sorted(ops), ['add', 'delete', 'edit'])
+        entries = list(saved)
+        self.journal.replay(entries)
+        self.assertEqual([q.to_dict() for q in entries], [q.to_dict() for q in current])
+
+
+class NearDuplicateTest(unittest.TestCase):
+
+    def test_tolerance_window(self):
+        qsos = [qso('OH1AA', '2024-05-01 12:00:00'),
+                qso('OH1AA/P', '2024-05-01 12:03:00'),   # ikkunan reunalla
+                qso('OH1AA', '2024-05-01 12:03:01'),     # ikkunan ulkopuolella
+                qso('OH1AA', '2024-05-01 12:03:30', band='40m'),
+                qso('OH1AA', '2024-05-01 12:06:01')]
+        dedupe = NearDuplicateFilter(tolerance=180)
+        kept = list(dedupe.filter(qsos))
+        # Ikkuna lasketaan säilytetyistä, poistettu QSO ei jatka sitä
+        self.assertEqual(kept, [qsos[0], qsos[2], qsos[3]])
+        self.assertEqual(dedupe.merged, [(qsos[0], qsos[1]), (qsos[2], qsos[4])])
+
+    def test_exact_call(self):
+        qsos = [qso('OH1AA'), qso('OH1AA/P', '2024-05-01 12:01:00')]
+        self.assertEqual(list(NearDuplicateFilter(180, exact_call=True).filter(qsos)), qsos)
+
+    def test_zero_tolerance(self):
+        qsos = [qso('OH1AA'), qso('OH1AA'), qso('OH1AA', '2024-05-01 12:00:01')]
+        self.assertEqual(list(NearDuplicateFilter(0).filter(qsos)), [qsos[0], qsos[2]])
+
+    def test_existing_qsos_are_kept(self):
+        existing = [qso('OH1AA', '2024-05-01 12:02:00')]
+        incoming = [qso('OH1AA', '2024-05-01 12:00:00'), qso('OH2BB')]
+        kept, merged = drop_near_duplicates(existing, incoming, 180)
+        self.assertEqual(kept, [incoming[1]])
+        self.assertEqual(merged, [(existing[0], incoming[0])])
+
+
+class SortedRunsTest(unittest.TestCase):
+
+    def test_spilled_runs_merge_in_time_order(self):
+        calls = [f"OH{i}AA" for i in range(200)]
+        qsos = [qso(call, f"2024-05-01 {(i * 7) % 24:02d}:{(i * 13) % 60:02d}:00")
+                for i, call in enumerate(calls)]
+        with tempfile.TemporaryDirectory() as directory:
+            runs = SortedRuns(directory, run_records=3)
+            runs.add_all(qsos)
+            self.assertEqual(len(runs), len(qsos))
+            merged = [(q.epoch, q.call) for q in runs]
+        # Lajittelu on vakaa: samanaikaiset lisäysjärjestyksessä
+        self.assertEqual(merged, [(q.epoch, q.call) for q in sorted(qsos, key=lambda q: q.epoch)])
+
+
+class ParseInputLineTest(unittest.TestCase):
+
+    def test_commands(self):
+        self.assertEqual(parse_input_line('40', 'SSB', '59', '59'), ('band', '40m'))
+        self.assertEqual(parse_input_line(',70', 'SSB', '59', '59'), ('band', '70cm'))
+        self.assertEqual(parse_input_line('cw', 'SSB', '59', '59'), ('mode', 'CW'))
+        self.assertEqual(parse_input_line('hello', 'SSB', '59', '59'), (None, None))
+        self.assertEqual(parse_input_line('  ', 'SSB', '59', '59'), (None, None))
+
+    def test_qso(self):
+        kind, draft = parse_input_line('oh2abc 57 55 ohff-1234 nice 73', 'SSB', '59', '59')
+        self.assertEqual(kind, 'qso')
+        self.assertEqual(draft, {'call': 'OH2ABC', 'rst_sent': '57', 'rst_rcvd': '55',
+                                 'their_wwff': 'OHFF-1234', 'comment': 'NICE 73'})
+
+    def test_cw_reports(self):
+        _, draft = parse_input_line('OH2ABC 55', 'CW', '599', '59')
+        self.assertEqual((draft['rst_sent'], draft['rst_rcvd']), ('559', '599'))
+
+
+if __name__ == '__main__':
+    unittest.main()